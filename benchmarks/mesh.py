@@ -0,0 +1,483 @@
+"""Multi-node mesh simulator and throughput benchmark.
+
+Runs N headless ChatManager nodes in one process, wired in a generated
+topology, and drives a message workload through them:
+
+    python -m benchmarks.mesh --nodes 30 --topology scale-free --messages 500 --seed 1
+    python -m benchmarks.mesh --transport loopback --nodes 10 --topology ring --rate 100
+
+Transports
+  memory    frames go through an in-process discrete-event queue with a
+            simulated per-link latency (and optional loss). Everything
+            except CPU time is a function of the seed, so two runs of the
+            same command deliver the same messages over the same paths.
+  loopback  every node runs a real AsyncNetworkEngine on 127.0.0.1, all on
+            one asyncio loop; latencies are wall-clock.
+
+The report has the delivery ratio (expected (message, receiver) pairs that
+arrived), end-to-end latency percentiles, duplicate deliveries (a UI saw the
+same message twice) and redundant frames (copies dropped by dedup), and per
+node CPU time in handle_incoming plus the process memory high-water mark.
+"""
+import argparse
+import asyncio
+import base64
+import heapq
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+try:
+    import resource
+except ImportError:         # Windows
+    resource = None
+
+from core.chat_manager import ChatManager
+from core.db import ChatDatabase
+
+
+# ---------- topologies ----------
+def ring(n, rng):
+    if n < 3:
+        return [(0, 1)] if n == 2 else []
+    return [(i, (i + 1) % n) for i in range(n)]
+
+
+def grid(n, rng):
+    width = max(1, math.ceil(math.sqrt(n)))
+    edges = []
+    for i in range(n):
+        if (i + 1) % width and i + 1 < n:
+            edges.append((i, i + 1))
+        if i + width < n:
+            edges.append((i, i + width))
+    return edges
+
+
+def random_graph(n, rng, degree=4):
+    """Random spanning tree (so the mesh is connected) plus random chords."""
+    edges = {(rng.randrange(i), i) for i in range(1, n)}
+    target = min(n * degree // 2, n * (n - 1) // 2)
+    while len(edges) < target:
+        a, b = rng.sample(range(n), 2)
+        edges.add((min(a, b), max(a, b)))
+    return sorted(edges)
+
+
+def scale_free(n, rng, m=2):
+    """Barabasi-Albert: each new node links to m nodes picked by degree."""
+    m = max(1, min(m, n - 1))
+    edges = [(i, j) for i in range(m + 1) for j in range(i + 1, m + 1) if j < n]
+    weighted = [v for e in edges for v in e]
+    for new in range(m + 1, n):
+        targets = set()
+        while len(targets) < m:
+            targets.add(rng.choice(weighted))
+        for t in targets:
+            edges.append((t, new))
+            weighted += (t, new)
+    return edges
+
+
+TOPOLOGIES = {
+    "ring": ring,
+    "grid": grid,
+    "random": random_graph,
+    "scale-free": scale_free,
+}
+
+
+def build_topology(name, n, seed=0):
+    """Adjacency list (list of sets) for `n` nodes."""
+    if name not in TOPOLOGIES:
+        raise ValueError(f"Unknown topology {name!r} (choose from {', '.join(TOPOLOGIES)})")
+    adjacency = [set() for _ in range(n)]
+    for a, b in TOPOLOGIES[name](n, random.Random(seed)):
+        if a != b:
+            adjacency[a].add(b)
+            adjacency[b].add(a)
+    return adjacency
+
+
+def make_workload(n, messages, rate, broadcast_ratio=0.0, seed=0):
+    """[(t, src, dest or None for broadcast)] with Poisson arrivals at `rate`/s."""
+    rng = random.Random(seed + 1)
+    t = 0.0
+    out = []
+    for _ in range(messages):
+        t += rng.expovariate(rate)
+        src = rng.randrange(n)
+        if rng.random() < broadcast_ratio:
+            out.append((t, src, None))
+        else:
+            dest = rng.randrange(n - 1)
+            out.append((t, src, dest if dest < src else dest + 1))
+    return out
+
+
+# ---------- nodes ----------
+class NodeConfig:
+    def __init__(self, index, peer_id, workdir, port=0, aes_key=""):
+        self.peer_id = peer_id
+        self.username = f"node{index}"
+        self.node = os.path.join(workdir, f"node{index}")
+        self.ip = "127.0.0.1"
+        self.port = port
+        self.encryption_enabled = bool(aes_key)
+        self.aes_key = aes_key
+
+
+def _peer_ids(n, seed):
+    rng = random.Random(seed + 2)
+    return [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(n)]
+
+
+class DeliveryTracker:
+    """Who should receive what, and when it arrived."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = {}          # msg_id -> (t_sent, expected receiver indexes)
+        self.arrived = {}       # (msg_id, node) -> t_arrived
+        self.duplicates = 0
+        self.unexpected = 0
+
+    def on_sent(self, msg_id, expected, t):
+        if msg_id is not None:
+            self.sent[msg_id] = (t, expected)
+
+    def listener(self, node):
+        def on_message(msg):
+            key = (msg.get("message_id"), node)
+            if key in self.arrived:
+                self.duplicates += 1
+            elif key[0] in self.sent and node in self.sent[key[0]][1]:
+                self.arrived[key] = self.clock()
+            else:
+                self.unexpected += 1
+        return on_message
+
+    def pending(self) -> int:
+        return sum(len(expected) for _, expected in self.sent.values()) - len(self.arrived)
+
+    def latencies(self):
+        return sorted(t - self.sent[msg_id][0] for (msg_id, _), t in self.arrived.items())
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _report(managers, tracker, workload, elapsed, cpu, extra):
+    expected = sum(len(e) for _, e in tracker.sent.values())
+    latencies = tracker.latencies()
+    handle = []
+    redundant = retransmits = 0
+    for m in managers:
+        snap = m.metrics.snapshot()
+        handle.append(sum(h["sum"] for h in snap["peerchat_handle_seconds"].values()))
+        redundant += sum(snap["peerchat_messages_deduped_total"].values())
+        retransmits += sum(snap["peerchat_retransmits_total"].values())
+    report = {
+        "nodes": len(managers),
+        "messages": len(workload),
+        "expected_deliveries": expected,
+        "delivered": len(tracker.arrived),
+        "delivery_ratio": round(len(tracker.arrived) / expected, 4) if expected else 1.0,
+        "latency_ms": {
+            "p50": _ms(_percentile(latencies, 0.5)),
+            "p99": _ms(_percentile(latencies, 0.99)),
+            "max": _ms(latencies[-1] if latencies else None),
+        },
+        "duplicate_deliveries": tracker.duplicates,
+        "unexpected_deliveries": tracker.unexpected,
+        "redundant_frames": redundant,
+        "retransmits": retransmits,
+        "node_cpu_ms": {
+            "mean": round(sum(handle) / len(handle) * 1000, 2) if handle else 0,
+            "max": round(max(handle) * 1000, 2) if handle else 0,
+        },
+        "process_cpu_s": round(cpu, 3),
+        "wall_s": round(elapsed, 3),
+        "peak_rss_mb": round(_rss_bytes() / 2 ** 20, 1) if _rss_bytes() else None,
+    }
+    report.update(extra)
+    return report
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+# ---------- in-memory transport ----------
+class MemoryLink:
+    """Stands in for a PeerLink: frames go into the mesh's event queue."""
+
+    def __init__(self, mesh, src, dst):
+        self.mesh = mesh
+        self.src = src
+        self.dst = dst
+        self.running = True
+
+    def send(self, data, priority=False):
+        return self.mesh.transmit(self.src, self.dst, data)
+
+
+class MemoryMesh:
+    """Discrete-event network: each frame arrives after latency + jitter."""
+
+    def __init__(self, managers, adjacency, peer_ids, latency=0.005, jitter=0.002, loss=0.0, seed=0):
+        self.managers = managers
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed + 3)
+        self.now = 0.0
+        self.frames = 0
+        self.lost = 0
+        self.errors = 0
+        self._events = []
+        self._seq = 0
+        for i, manager in enumerate(managers):
+            manager.clients = {peer_ids[j]: MemoryLink(self, i, j) for j in sorted(adjacency[i])}
+            # the engine never starts here: its timers (outbox drain, ACK
+            # retransmit) run on the virtual clock instead
+            manager.engine.call_later = self._call_later
+            manager.outbox._clock = manager.inflight._clock = self.clock
+
+    def clock(self):
+        return self.now
+
+    def transmit(self, src, dst, data) -> bool:
+        self.frames += 1
+        if self.loss and self.rng.random() < self.loss:
+            self.lost += 1
+            return True
+        self.schedule(self.now + self.latency + self.rng.uniform(0, self.jitter), self._deliver, dst, data)
+        return True
+
+    def _call_later(self, delay, fn) -> bool:
+        self.schedule(self.now + (delay or 0.0), fn)
+        return True
+
+    def schedule(self, t, fn, *args):
+        self._seq += 1
+        heapq.heappush(self._events, (t, self._seq, fn, args))
+
+    def _deliver(self, dst, data):
+        try:
+            self.managers[dst].handle_incoming(data)
+        except Exception:
+            self.errors += 1
+
+    def run(self):
+        while self._events:
+            t, _, fn, args = heapq.heappop(self._events)
+            self.now = t
+            fn(*args)
+
+
+def run_memory(n, topology, workload, seed=0, latency=0.005, jitter=0.002, loss=0.0, encrypt=False, workdir=None):
+    adjacency = build_topology(topology, n, seed)
+    peer_ids = _peer_ids(n, seed)
+    key = _aes_key(seed) if encrypt else ""
+    with _workdir(workdir) as path:
+        managers = [ChatManager(NodeConfig(i, peer_ids[i], path, aes_key=key)) for i in range(n)]
+        try:
+            mesh = MemoryMesh(managers, adjacency, peer_ids, latency, jitter, loss, seed)
+            tracker = DeliveryTracker(mesh.clock)
+            for i, manager in enumerate(managers):
+                manager.message_received.connect(tracker.listener(i))
+
+            def send(src, dest):
+                expected = {dest} if dest is not None else set(range(n)) - {src}
+                if dest is None:
+                    msg_id = managers[src].send_broadcast_message(f"bench from {src}")
+                else:
+                    msg_id = managers[src].send_message(peer_ids[dest], f"bench {src}->{dest}")
+                tracker.on_sent(msg_id, expected, mesh.now)
+
+            for t, src, dest in workload:
+                mesh.schedule(t, send, src, dest)
+
+            cpu0, wall0 = time.process_time(), time.perf_counter()
+            mesh.run()
+            cpu, elapsed = time.process_time() - cpu0, time.perf_counter() - wall0
+            return _report(managers, tracker, workload, elapsed, cpu, {
+                "transport": "memory",
+                "topology": topology,
+                "frames": mesh.frames,
+                "lost_frames": mesh.lost,
+                "errors": mesh.errors,
+                "simulated_s": round(mesh.now, 3),
+            })
+        finally:
+            for manager in managers:
+                manager.db.close()
+
+
+# ---------- loopback transport ----------
+def _free_ports(n):
+    socks = []
+    try:
+        for _ in range(n):
+            s = socket.socket()
+            s.bind(("127.0.0.1", 0))
+            socks.append(s)
+        return [s.getsockname()[1] for s in socks]
+    finally:
+        for s in socks:
+            s.close()
+
+
+def run_loopback(n, topology, workload, seed=0, encrypt=False, workdir=None, connect_timeout=30, drain_timeout=10):
+    adjacency = build_topology(topology, n, seed)
+    peer_ids = _peer_ids(n, seed)
+    ports = _free_ports(n)
+    key = _aes_key(seed) if encrypt else ""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    with _workdir(workdir) as path:
+        configs = [NodeConfig(i, peer_ids[i], path, ports[i], key) for i in range(n)]
+        # neighbours come from each node's DB, as in a real deployment
+        for i, config in enumerate(configs):
+            db = ChatDatabase(f"{config.node}.db")
+            for j in adjacency[i]:
+                db.upsert_neighbor(peer_ids[j], configs[j].username, "127.0.0.1", ports[j])
+            db.close()
+
+        managers = [ChatManager(config) for config in configs]
+        tracker = DeliveryTracker(time.perf_counter)
+        for i, manager in enumerate(managers):
+            manager.message_received.connect(tracker.listener(i))
+
+        def send(src, dest):
+            expected = {dest} if dest is not None else set(range(n)) - {src}
+            if dest is None:
+                msg_id = managers[src].send_broadcast_message(f"bench from {src}")
+            else:
+                msg_id = managers[src].send_message(peer_ids[dest], f"bench {src}->{dest}")
+            tracker.on_sent(msg_id, expected, time.perf_counter())
+
+        async def scenario():
+            for manager in managers:
+                manager.start(loop=loop)
+            deadline = time.monotonic() + connect_timeout
+            while not all(link.running for m in managers for link in m.clients.values()):
+                if time.monotonic() > deadline:
+                    raise TimeoutError("mesh did not connect")
+                await asyncio.sleep(0.02)
+            timing["cpu"], timing["wall"] = time.process_time(), time.perf_counter()
+            start = loop.time()
+            for t, src, dest in workload:
+                loop.call_at(start + t, send, src, dest)
+            await asyncio.sleep(workload[-1][0] if workload else 0)
+            deadline = time.monotonic() + drain_timeout
+            while tracker.pending() and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+
+        timing = {}     # measured from the first send, not from connecting
+        try:
+            loop.run_until_complete(scenario())
+            cpu, elapsed = time.process_time() - timing["cpu"], time.perf_counter() - timing["wall"]
+            return _report(managers, tracker, workload, elapsed, cpu, {
+                "transport": "loopback",
+                "topology": topology,
+            })
+        finally:
+            for manager in managers:
+                manager.stop()
+            loop.run_until_complete(asyncio.sleep(0.05))
+            loop.close()
+            asyncio.set_event_loop(None)
+
+
+def _aes_key(seed):
+    return base64.b64encode(random.Random(seed + 4).randbytes(32)).decode("ascii")
+
+
+class _workdir:
+    """Given directory, or a temporary one removed afterwards."""
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp = None
+
+    def __enter__(self):
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            return self.path
+        self._tmp = tempfile.mkdtemp(prefix="peerchat-mesh-")
+        return self._tmp
+
+    def __exit__(self, *exc):
+        if self._tmp:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+        return False
+
+
+# ---------- CLI ----------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a peer chat mesh and measure delivery.")
+    parser.add_argument("--nodes", type=int, default=20)
+    parser.add_argument("--topology", choices=sorted(TOPOLOGIES), default="random")
+    parser.add_argument("--transport", choices=("memory", "loopback"), default="memory")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=200.0, help="messages per second, Poisson arrivals")
+    parser.add_argument("--broadcast-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="memory transport: per-link latency")
+    parser.add_argument("--jitter-ms", type=float, default=2.0, help="memory transport: extra random latency")
+    parser.add_argument("--loss", type=float, default=0.0, help="memory transport: frame loss probability")
+    parser.add_argument("--encrypt", action="store_true", help="enable the shared-key AES layer")
+    parser.add_argument("--trace-memory", action="store_true", help="report Python heap peak per node (slower)")
+    parser.add_argument("--out", help="also write the report as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workload = make_workload(args.nodes, args.messages, args.rate, args.broadcast_ratio, args.seed)
+    if args.trace_memory:
+        tracemalloc.start()
+
+    if args.transport == "memory":
+        report = run_memory(args.nodes, args.topology, workload, args.seed,
+                            args.latency_ms / 1000, args.jitter_ms / 1000, args.loss, args.encrypt)
+    else:
+        report = run_loopback(args.nodes, args.topology, workload, args.seed, args.encrypt)
+
+    if args.trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report["heap_peak_kb_per_node"] = round(peak / 1024 / args.nodes, 1)
+    report["seed"] = args.seed
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""Microbenchmarks for the protocol, crypto, DB and dispatch hot paths.
+
+    python -m benchmarks.micro                          # run, print a table
+    python -m benchmarks.micro --compare                # ... against benchmarks/baseline.json
+    python -m benchmarks.micro --save-baseline          # record a new baseline (at a release)
+    python -m benchmarks.micro -k db --sizes 10000,100000,1000000
+
+Each case builds its fixture outside the timed region and returns the
+operation to time. The runner calls it in batches big enough to last
+`--min-time` seconds, repeats that `--repeat` times and keeps the fastest
+and median time per call; the fastest is the least noisy figure and is what
+comparisons use.
+
+A comparison flags a case as a regression when it is more than
+`--threshold` slower than the baseline (and `--fail` turns that into exit
+status 1 for CI). Baselines are only comparable on the same machine and
+Python; the file records both.
+"""
+import argparse
+import base64
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from core.chat_manager import ChatManager
+from core.db import INSERT_MESSAGE_SQL, ChatDatabase
+from core.peers import PeerDirectory
+from crypto.encrypt import decrypt_text, encrypt_text
+from network.protocol import CODEC_BINARY, CODEC_JSON, decode_message, encode_message
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DB_SIZES = (10_000, 100_000)
+
+CASES = {}
+
+
+def bench(name, limit=None):
+    """Register `fn(ctx) -> operation` as a case; `limit` caps calls per batch."""
+    def register(fn):
+        CASES[name] = (fn, limit)
+        return fn
+    return register
+
+
+class Context:
+    """Scratch space shared by the cases of one run (temp dir, cleanups)."""
+
+    def __init__(self, sizes=DB_SIZES):
+        self.sizes = sizes
+        self.tmp = tempfile.mkdtemp(prefix="peerchat-bench-")
+        self._cleanups = []
+
+    def on_close(self, fn):
+        self._cleanups.append(fn)
+
+    def close(self):
+        for fn in reversed(self._cleanups):
+            try:
+                fn()
+            except Exception:
+                pass
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+PEER_A = str(uuid.UUID(int=1, version=4))
+PEER_B = str(uuid.UUID(int=2, version=4))
+KEY = bytes(range(32))
+TEXT = "Xin chào, tối nay họp nhóm lúc 8 giờ nhé!"
+
+
+# ---------- protocol ----------
+def _frame(codec, content=TEXT):
+    return encode_message(PEER_A, PEER_B, content, sender_name="user_A", message_id=str(uuid.uuid4()), codec=codec)
+
+
+@bench("protocol.encode_message.binary")
+def _encode_binary(ctx):
+    msg_id = str(uuid.uuid4())
+    return lambda: encode_message(PEER_A, PEER_B, TEXT, sender_name="user_A", message_id=msg_id, codec=CODEC_BINARY)
+
+
+@bench("protocol.encode_message.json")
+def _encode_json(ctx):
+    msg_id = str(uuid.uuid4())
+    return lambda: encode_message(PEER_A, PEER_B, TEXT, sender_name="user_A", message_id=msg_id, codec=CODEC_JSON)
+
+
+@bench("protocol.decode_message.binary")
+def _decode_binary(ctx):
+    frame = _frame(CODEC_BINARY)
+    return lambda: decode_message(frame)
+
+
+@bench("protocol.decode_message.json")
+def _decode_json(ctx):
+    frame = _frame(CODEC_JSON)
+    return lambda: decode_message(frame)
+
+
+# ---------- crypto ----------
+@bench("crypto.encrypt_text")
+def _encrypt(ctx):
+    return lambda: encrypt_text(TEXT, KEY)
+
+
+@bench("crypto.decrypt_text")
+def _decrypt(ctx):
+    token = encrypt_text(TEXT, KEY)
+    return lambda: decrypt_text(token, KEY)
+
+
+# ---------- database ----------
+def _seeded_db(ctx, rows):
+    """DB with `rows` messages spread over 100 conversations with PEER_A."""
+    path = os.path.join(ctx.tmp, f"bench-{rows}-{len(os.listdir(ctx.tmp))}.db")
+    db = ChatDatabase(path)
+    peers = [str(uuid.UUID(int=1000 + i, version=4)) for i in range(100)]
+
+    def seed(conn):
+        batch = []
+        for i in range(rows):
+            peer = peers[i % 100]
+            sent = i % 2
+            sender, receiver = (PEER_A, peer) if sent else (peer, PEER_A)
+            batch.append((str(uuid.uuid4()), sender, None, receiver, None, f"message {i}", sent))
+            if len(batch) == 50_000:
+                conn.executemany(INSERT_MESSAGE_SQL, batch)
+                batch = []
+        conn.executemany(INSERT_MESSAGE_SQL, batch)
+        conn.commit()
+
+    db.executor.write(seed)
+    for i, peer in enumerate(peers):
+        db.upsert_neighbor(peer, f"user_{i}", "127.0.0.1", 9000 + i)
+    ctx.on_close(db.close)
+    return db, peers
+
+
+def _register_db_cases(sizes):
+    for rows in sizes:
+        label = _label(rows)
+
+        def save(ctx, rows=rows):
+            db, peers = _seeded_db(ctx, rows)
+            return lambda: db.save_message(str(uuid.uuid4()), PEER_A, peers[0], TEXT, "user_A", "user_0", 1)
+
+        def save_write_behind(ctx, rows=rows):
+            db, peers = _seeded_db(ctx, rows)
+            db.write_behind = True
+            return lambda: db.save_message(str(uuid.uuid4()), PEER_A, peers[0], TEXT, "user_A", "user_0", 1)
+
+        def conversation(ctx, rows=rows):
+            db, peers = _seeded_db(ctx, rows)
+            return lambda: db.get_conversation(PEER_A, peers[7])
+
+        def conversation_page(ctx, rows=rows):
+            db, peers = _seeded_db(ctx, rows)
+            return lambda: db.get_conversation_page(PEER_A, peers[7], limit=50)
+
+        def upsert(ctx, rows=rows):
+            db, peers = _seeded_db(ctx, rows)
+            counter = itertools.count()
+            return lambda: db.upsert_neighbor(peers[next(counter) % 100], "renamed", "127.0.0.1", 9999)
+
+        bench(f"db.save_message.{label}")(save)
+        bench(f"db.save_message.write_behind.{label}")(save_write_behind)
+        bench(f"db.get_conversation.{label}")(conversation)
+        bench(f"db.get_conversation_page.{label}")(conversation_page)
+        bench(f"db.upsert_neighbor.{label}")(upsert)
+
+
+# a name lookup per incoming message without "from_n"
+@bench("peers.username.sqlite")
+def _username_sqlite(ctx):
+    db, peers = _seeded_db(ctx, 0)
+    return lambda: db.get_username(peers[7])
+
+
+@bench("peers.username.directory")
+def _username_directory(ctx):
+    db, peers = _seeded_db(ctx, 0)
+    directory = PeerDirectory(db)
+    directory.load()
+    return lambda: directory.username(peers[7])
+
+
+# ---------- dispatch ----------
+class _NullLink:
+    running = True
+
+    def send(self, data, priority=False):
+        return True
+
+
+class _BenchConfig:
+    def __init__(self, tmp):
+        self.peer_id = PEER_A
+        self.username = "user_A"
+        self.node = os.path.join(tmp, f"node-{len(os.listdir(tmp))}")
+        self.ip = "127.0.0.1"
+        self.port = 0
+        self.encryption_enabled = True
+        self.aes_key = base64.b64encode(KEY).decode("ascii")
+
+
+def _manager(ctx):
+    manager = ChatManager(_BenchConfig(ctx.tmp))
+    manager.clients = {PEER_B: _NullLink(), str(uuid.UUID(int=3, version=4)): _NullLink()}
+    ctx.on_close(manager.db.close)
+    return manager
+
+
+HANDLE_FRAMES = 100_000
+
+
+@bench("chat.handle_incoming.new_broadcast", limit=HANDLE_FRAMES)
+def _handle_new(ctx):
+    manager = _manager(ctx)
+    token = encrypt_text(TEXT, KEY)
+    frames = iter([
+        encode_message(PEER_B, "*", token, sender_name="user_B", message_id=str(uuid.uuid4()))
+        for _ in range(HANDLE_FRAMES)
+    ])
+    return lambda: manager.handle_incoming(next(frames))
+
+
+@bench("chat.handle_incoming.duplicate")
+def _handle_duplicate(ctx):
+    manager = _manager(ctx)
+    frame = encode_message(PEER_B, "*", TEXT, sender_name="user_B", message_id=str(uuid.uuid4()))
+    manager.handle_incoming(frame)
+    return lambda: manager.handle_incoming(frame)
+
+
+# ---------- runner ----------
+def measure(op, min_time=0.2, repeat=5, limit=None):
+    """(fastest, median) seconds per call of `op`."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 4 or (limit and number * 2 * (repeat + 2) > limit):
+            break
+        number *= 2
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    if limit:
+        number = max(1, min(number, limit // (repeat + 2)))
+
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        per_call.append((time.perf_counter() - start) / number)
+    return min(per_call), statistics.median(per_call)
+
+
+def run(pattern="", sizes=DB_SIZES, min_time=0.2, repeat=5, progress=None):
+    """{case: {"best_us", "median_us"}} for cases whose name contains `pattern`."""
+    _register_db_cases(sizes)
+    results = {}
+    for name, (factory, limit) in CASES.items():
+        if pattern and pattern not in name:
+            continue
+        if name.startswith("db.") and not any(name.endswith("." + _label(s)) for s in sizes):
+            continue
+        ctx = Context(sizes)
+        try:
+            best, median = measure(factory(ctx), min_time, repeat, limit)
+        finally:
+            ctx.close()
+        results[name] = {"best_us": round(best * 1e6, 3), "median_us": round(median * 1e6, 3)}
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+def _label(rows):
+    return f"{rows // 1000}k" if rows < 1_000_000 else f"{rows // 1_000_000}M"
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(BASELINE)).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(terse=True),
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%d"),
+    }
+
+
+def compare(results, baseline, threshold=0.2) -> list:
+    """Rows of (case, baseline us, current us, change, verdict)."""
+    rows = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            rows.append((name, None, current["best_us"], None, "new"))
+            continue
+        change = current["best_us"] / before["best_us"] - 1 if before["best_us"] else 0.0
+        verdict = "REGRESSION" if change > threshold else "faster" if change < -threshold else "ok"
+        rows.append((name, before["best_us"], current["best_us"], change, verdict))
+    return rows
+
+
+def format_table(rows) -> str:
+    lines = [f"{'case':44} {'baseline us':>12} {'now us':>12} {'change':>8}  verdict"]
+    for name, before, now, change, verdict in rows:
+        b = f"{before:12.2f}" if before is not None else f"{'-':>12}"
+        c = f"{change:+8.1%}" if change is not None else f"{'-':>8}"
+        lines.append(f"{name:44} {b} {now:12.2f} {c}  {verdict}")
+    return "\n".join(lines)
+
+
+def load_baseline(path=BASELINE) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run peer chat microbenchmarks.")
+    parser.add_argument("-k", dest="pattern", default="", help="only cases whose name contains this")
+    parser.add_argument("--sizes", default=",".join(map(str, DB_SIZES)), help="DB row counts, comma separated")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per measured batch")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--compare", nargs="?", const=BASELINE, help="baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression")
+    parser.add_argument("--fail", action="store_true", help="exit 1 if any case regressed")
+    parser.add_argument("--save", help="write results to this file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write results to {BASELINE}")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = tuple(int(s) for s in args.sizes.split(",") if s.strip())
+    results = run(args.pattern, sizes, args.min_time, args.repeat,
+                  progress=lambda name, r: print(f"{name:44} {r['best_us']:12.2f} us", file=sys.stderr))
+
+    baseline = {}
+    if args.compare:
+        baseline = load_baseline(args.compare)
+        print(f"baseline: {baseline.get('environment', {})}")
+    rows = compare(results, baseline.get("results", {}), args.threshold)
+    print(format_table(rows))
+
+    document = {"environment": environment(), "results": results}
+    for path in filter(None, (args.save, BASELINE if args.save_baseline else None)):
+        if path == BASELINE and args.pattern:
+            # keep the cases that were not re-run
+            try:
+                document["results"] = {**load_baseline(path).get("results", {}), **results}
+            except FileNotFoundError:
+                pass
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.fail and any(r[4] == "REGRESSION" for r in rows):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
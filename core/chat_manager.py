@@ -1,31 +1,103 @@
-from PyQt5.QtCore import QObject, QThread, pyqtSignal
+import base64
+import random
+import time
+from time import perf_counter
 from uuid import uuid4
-from network.client_worker import ClientWorker
-from network.server_worker import ServerWorker
-from network.server_client_worker import ServerClientWorker
-from network.protocol import encode_message, decode_message
+from network.async_engine import AsyncNetworkEngine, EngineEvents
+from network.protocol import encode_message, decode_message, forward_frame, frame_attempt, retry_frame
 from core.db import ChatDatabase
-from crypto.encrypt import derive_aes256_key, encrypt_text, decrypt_text
+from core.dedup import SeenCache
+from core.discovery import PeerSampler
+from core.inflight import InflightTable
+from core.metrics import MetricsRegistry, MetricsServer
+from core.outbox import Outbox
+from core.peers import PeerDirectory
+from core.routing import RoutingTable
+from crypto.encrypt import derive_aes256_key, get_cipher
+from crypto.key_exchange import derive_session_key
+from crypto.session import SessionKeyCache, parse_sealed, session_id
+from utils.events import Signal
+from utils.logger import get_logger
 import os
 
-class ChatManager(QObject):
-    message_received = pyqtSignal(dict)
-    log_received = pyqtSignal(str)
-    update_peers = pyqtSignal(list)
-    update_discovered_peers = pyqtSignal(list)  # New signal for discovered peers
-    status = pyqtSignal(str)
+log = get_logger(__name__)
+
+HANDSHAKE_TIMEOUT = 5        # seconds before an unanswered handshake is re-sent
+OUTBOX_BATCH = 25            # queued frames sent per drain step
+OUTBOX_EXPIRE_INTERVAL = 60  # seconds between sweeps for outbox entries past max_age
+
+
+class ChatManager:
+    """Routing, storage and crypto core of a node.
+
+    Has no Qt dependency: events are plain Signals (connect/emit), and the
+    network bridge decides which thread handlers run on. The UI passes a
+    NetworkBridge so everything lands on the Qt thread; headless nodes use
+    the default EngineEvents and run on their own asyncio loop.
+    """
+
+    def __init__(self, config, bridge=None):
+        self.message_received = Signal()          # dict
+        self.log_received = Signal()              # str
+        self.update_peers = Signal()              # list
+        self.update_discovered_peers = Signal()   # list, discovered peers
+        self.status = Signal()                    # str
 
-    def __init__(self, config):
-        super().__init__()
         self.config = config
-        self.clients = {}            # peer_id -> ClientWorker
-        self.server_clients = []     # list ServerClientWorker
-        self.seen_messages = set()   # chống loop
+        self.clients = {}            # peer_id -> PeerLink (outbound)
+        self.metrics = MetricsRegistry()
+        self.metrics_server = None
+        # chống loop: bounded + time-expiring so long-running relays stay flat
+        self.seen_messages = SeenCache(
+            capacity=int(getattr(self.config, "dedup_capacity", 100000)),
+            ttl=float(getattr(self.config, "dedup_ttl", 600)),
+        )
 
-        self.db = ChatDatabase(f'{self.config.node}.db')
-        self.neigbors = self.db.get_neighbors()
+        # next hops toward non-neighbour peers, learned from traffic
+        self.routing = RoutingTable(self.config.peer_id)
+
+        # gossip peer sampling: bounded neighbour-to-neighbour shuffles
+        # instead of TTL-flooded FIND_NODES
+        self.discovery = PeerSampler(
+            {
+                "peer_id": self.config.peer_id,
+                "username": self.config.username,
+                "ip": self.config.ip,
+                "port": self.config.port,
+            },
+            view_size=int(getattr(self.config, "discovery_view_size", 20)),
+            shuffle_len=int(getattr(self.config, "discovery_shuffle_len", 8)),
+            fanout=int(getattr(self.config, "discovery_fanout", 2)),
+        )
+
+        # write-behind: incoming messages are batched off the network path
+        self.db = ChatDatabase(f'{self.config.node}.db', write_behind=True, metrics=self.metrics)
+        # neighbors live in memory: lookups on the message path never hit SQLite
+        self.peers = PeerDirectory(self.db)
+        self.peers.load()
+        self.peers.changed.connect(self._on_peer_changed)
         self.active_peer = []
 
+        # store-and-forward: direct messages wait here until the receiver ACKs
+        self.outbox = Outbox(
+            self.db,
+            rate=float(getattr(self.config, "outbox_rate", 200)),
+            burst=int(getattr(self.config, "outbox_burst", 50)),
+            max_age=float(getattr(self.config, "outbox_max_age", 86400)),
+            relay_cap=int(getattr(self.config, "outbox_relay_cap", 1000)),
+        )
+        self.outbox.load()
+        self._drain_scheduled = set()
+        # sent but not acknowledged yet: RTT, timeouts, selective retransmit
+        self.inflight = InflightTable(
+            initial_rto=float(getattr(self.config, "ack_timeout", 3)),
+            max_rto=float(getattr(self.config, "ack_timeout_max", 30)),
+            max_attempts=int(getattr(self.config, "ack_max_attempts", 5)),
+        )
+        self._retransmit_scheduled = False
+        # known neighbours seed the partial view
+        self.discovery.merge(self.peers.neighbors())
+
         # --- Crypto runtime flags ---
         # Allow env overrides for quick A/B testing without changing JSON config.
         self._crypto_enabled = self._read_bool_env("PEERCHAT_ENCRYPTION", getattr(self.config, "encryption_enabled", False))
@@ -35,8 +107,93 @@ class ChatManager(QObject):
         self._crypto_key = derive_aes256_key(env_key or cfg_key)
 
         if self._crypto_enabled and not self._crypto_key:
-            print("[CRYPTO] Encryption enabled but no key provided (set PEERCHAT_AES_KEY or config aes_key). Falling back to plaintext.")
+            log.warning("Encryption enabled but no key provided (set PEERCHAT_AES_KEY or config aes_key). Falling back to plaintext.")
             self._crypto_enabled = False
+        # one AES-GCM context for the node key, reused for every message
+        self._cipher = get_cipher(self._crypto_key) if self._crypto_enabled else None
+
+        # --- End-to-end sessions: X25519 handshake -> per-peer AES key ---
+        self._x25519_priv = getattr(self.config, "x25519_priv", "") or ""
+        self._x25519_pub = getattr(self.config, "x25519_pub", "") or ""
+        self._e2e_enabled = bool(self._x25519_priv and self._x25519_pub)
+        self.sessions = SessionKeyCache(
+            max_messages=int(getattr(self.config, "session_rekey_messages", 10000)),
+            max_age=float(getattr(self.config, "session_max_age", 3600)),
+        )
+        self._handshakes = {}            # peer_id -> {"nonce", "started"} we initiated
+        self._e2e_unsupported = set()    # peers that answered without a public key
+        self._peer_pubs = {}             # peer_id -> public key seen first (pinned)
+
+        # --- Network: one asyncio loop for every connection ---
+        self.bridge = bridge if bridge is not None else EngineEvents()
+        self.bridge.new_data.connect(self.handle_incoming)
+        self.bridge.status.connect(self.status.emit)
+        self.bridge.connected.connect(self.add_active_peer)  # peer_id
+        self.bridge.disconnected.connect(self.remove_active_peer)  # peer_id
+        # When an inbound connection identifies its peer id, mark it active
+        self.bridge.peer_identified.connect(self.add_new_active_peer)
+        # engine timers (call_later) run their callback through the bridge
+        self.bridge.invoke.connect(self._invoke)
+        self.engine = AsyncNetworkEngine(self.config.ip, self.config.port, self.bridge)
+        self._init_metrics()
+
+    def _init_metrics(self):
+        m = self.metrics
+        self._m_in = m.counter("peerchat_messages_in_total", "Frames received, by message type", ("type",))
+        self._m_deduped = m.counter("peerchat_messages_deduped_total", "Received frames dropped as already seen", ("type",))
+        self._m_out = m.counter("peerchat_messages_out_total", "Frames originated by this node", ("type",))
+        self._m_forwarded = m.counter("peerchat_messages_forwarded_total", "Frames relayed for other nodes", ("type",))
+        self._m_bytes_in = m.counter("peerchat_wire_bytes_in_total", "Bytes of frames received")
+        self._m_handle = m.histogram("peerchat_handle_seconds", "handle_incoming latency, by message type", ("type",))
+        self._m_decode = m.histogram("peerchat_decode_seconds", "decode_message latency")
+        self._m_encode = m.histogram("peerchat_encode_seconds", "encode_message latency")
+        self._m_rtt = m.histogram("peerchat_ack_rtt_seconds", "Send -> ACK time of direct messages sent once, by peer", ("peer",))
+        self._m_delivery = m.histogram("peerchat_delivery_seconds", "First send -> ACK time of direct messages, by peer", ("peer",))
+        self._m_retransmits = m.counter("peerchat_retransmits_total", "Direct messages re-sent after an ACK timeout, by peer", ("peer",))
+        crypto = m.histogram("peerchat_crypto_seconds", "Payload encrypt/decrypt latency", ("op",))
+        self._m_encrypt = crypto.labels("encrypt")
+        self._m_decrypt = crypto.labels("decrypt")
+
+        # read at scrape time from the structures that already count them
+        links = lambda: list(self.engine.links.items())
+        m.counter("peerchat_wire_bytes_out_total", "Bytes written to current outbound links",
+                  fn=lambda: sum(link.sent_bytes for _, link in links()))
+        m.counter("peerchat_link_writes_total", "Socket writes per outbound link", ("peer",),
+                  fn=lambda: {peer: link.writes for peer, link in links()})
+        m.counter("peerchat_link_dropped_frames_total", "Frames dropped by a full send queue", ("peer",),
+                  fn=lambda: {peer: link.dropped_frames for peer, link in links()})
+        m.gauge("peerchat_link_queued_bytes", "Bytes waiting in a link's send queue", ("peer",),
+                fn=lambda: {peer: link.queued_bytes() for peer, link in links()})
+        m.gauge("peerchat_links_connected", "Outbound links currently connected",
+                fn=lambda: sum(1 for _, link in links() if link.running))
+        m.gauge("peerchat_inbound_connections", "Accepted inbound connections",
+                fn=lambda: len(self.engine._inbound))
+        m.gauge("peerchat_active_peers", "Peers shown as online", fn=lambda: len(self.active_peer))
+        m.gauge("peerchat_seen_cache_size", "Message ids in the dedup cache", fn=lambda: len(self.seen_messages))
+        m.counter("peerchat_seen_cache_evictions_total", "Ids forgotten by the dedup cache",
+                  fn=lambda: self.seen_messages.evictions)
+        m.gauge("peerchat_routes", "Learned next-hop routes", fn=lambda: len(self.routing))
+        m.gauge("peerchat_e2e_sessions", "Cached end-to-end session keys", fn=lambda: len(self.sessions))
+        m.gauge("peerchat_outbox_pending", "Direct messages waiting for an ACK", fn=lambda: self.outbox.pending())
+        m.counter("peerchat_outbox_acked_total", "Queued messages acknowledged", fn=lambda: self.outbox.acked)
+        m.counter("peerchat_outbox_resent_total", "Queued messages sent again", fn=lambda: self.outbox.resent)
+        m.counter("peerchat_outbox_expired_total", "Queued messages dropped after outbox_max_age",
+                  fn=lambda: self.outbox.expired)
+        m.counter("peerchat_outbox_relay_dropped_total", "Relayed frames dropped over outbox_relay_cap",
+                  fn=lambda: self.outbox.dropped)
+        m.gauge("peerchat_inflight", "Direct messages sent and waiting for an ACK", fn=lambda: len(self.inflight))
+        m.counter("peerchat_ack_timeouts_total", "ACK timeouts (each retransmit or give-up)", fn=lambda: self.inflight.timeouts)
+        m.counter("peerchat_ack_given_up_total", "Messages left for the next reconnect after max attempts",
+                  fn=lambda: self.inflight.given_up)
+
+    def _encode(self, **fields) -> bytes:
+        """encode_message, timed; counts frames we originate."""
+        t0 = perf_counter()
+        packet = encode_message(**fields)
+        self._m_encode.observe(perf_counter() - t0)
+        if not fields.get("forwarder"):
+            self._m_out.labels(fields.get("message_type", "MESSAGE")).inc()
+        return packet
 
     @staticmethod
     def _read_bool_env(name: str, default: bool = False) -> bool:
@@ -47,47 +204,47 @@ class ChatManager(QObject):
         return v in {"1", "true", "yes", "y", "on"}
 
     def _maybe_encrypt_for_wire(self, plaintext: str) -> str:
-        if not self._crypto_enabled or not self._crypto_key:
+        if self._cipher is None:
             return plaintext
 
-        ciphertext = encrypt_text(plaintext, self._crypto_key)
+        t0 = perf_counter()
+        ciphertext = self._cipher.encrypt(plaintext)
+        self._m_encrypt.observe(perf_counter() - t0)
         if self._crypto_log_compare:
-            print(f"[CRYPTO][SEND] plain={plaintext!r}")
-            print(f"[CRYPTO][SEND] cipher={ciphertext!r}")
-        else:
-            print(f"[CRYPTO][SEND] cipher={ciphertext!r}")
+            log.info("send plain=%r cipher=%r", plaintext, ciphertext)
         return ciphertext
 
-    def _maybe_decrypt_for_ui(self, wire_payload: str) -> str:
-        if not self._crypto_enabled or not self._crypto_key:
+    def _maybe_decrypt_for_ui(self, wire_payload: str, sender=None):
+        """Plaintext of an incoming payload; None for an E2E payload we cannot open."""
+        sealed = parse_sealed(wire_payload)
+        if sealed is not None:
+            session = self.sessions.lookup(sender, sealed[0])
+            if session is None:
+                log.warning("No E2E session %s for %s", sealed[0], sender)
+                return None
+            try:
+                t0 = perf_counter()
+                plaintext = session.open(wire_payload)
+                self._m_decrypt.observe(perf_counter() - t0)
+                return plaintext
+            except ValueError as e:
+                log.warning("E2E decrypt from %s failed: %s", sender, e)
+                return None
+
+        if self._cipher is None:
             return wire_payload
 
         try:
-            plaintext = decrypt_text(wire_payload, self._crypto_key)
+            t0 = perf_counter()
+            plaintext = self._cipher.decrypt(wire_payload)
+            self._m_decrypt.observe(perf_counter() - t0)
             if self._crypto_log_compare and plaintext != wire_payload:
-                print(f"[CRYPTO][RECV] cipher={wire_payload!r}")
-                print(f"[CRYPTO][RECV] plain={plaintext!r}")
+                log.info("recv cipher=%r plain=%r", wire_payload, plaintext)
             return plaintext
         except Exception as e:
-            print(f"[CRYPTO][RECV] Decrypt failed: {e}")
+            log.warning("Decrypt from %s failed: %s", sender, e)
             return wire_payload
 
-    def init_server(self):
-        self.server_thread = QThread()
-        self.server_worker = ServerWorker()
-        self.server_worker.set_config(self.config)
-
-        self.server_worker.moveToThread(self.server_thread)
-        self.server_thread.started.connect(self.server_worker.run)
-
-        self.server_worker.new_connection.connect(self._on_new_connection)
-        self.server_worker.status.connect(self.status.emit)
-        # self.server_worker.new_data.connect(self.handle_incoming)
-
-        self.server_worker.finished.connect(self.server_thread.quit)
-        self.server_worker.finished.connect(self.server_worker.deleteLater)
-        self.server_thread.finished.connect(self.server_thread.deleteLater)
-    
     def init_client(self, peer_id, host, port):
         # Guard against invalid endpoints (common cause of WinError 10049 on Windows)
         try:
@@ -101,88 +258,50 @@ class ChatManager(QObject):
 
         host = str(host).strip()
 
-        print('[LOG] Creat client threat:', peer_id, host, port)
         self.status.emit(f"Create client: {peer_id} {host}:{port}")
+        # The engine keeps reconnecting in the background until remove_peer/stop
+        self.clients[peer_id] = self.engine.connect_peer(peer_id, host, port)
 
-        thread = QThread()
-        worker = ClientWorker(peer_id, host, port)
+    def start(self, loop=None):
+        """Start networking; pass an asyncio loop to run on it (headless)."""
+        self.engine.start(loop=loop)
+        self._start_metrics_server()
 
-        worker.moveToThread(thread)
-        thread.started.connect(worker.connect_to_peer)
-
-        worker.new_data.connect(self.handle_incoming)
-        worker.status.connect(self.status.emit)
-        worker.connected.connect(self.add_active_peer)  # peer_id
-        worker.disconnected.connect(self.remove_active_peer)  # peer_id
-
-        worker.finished.connect(thread.quit)
-        worker.finished.connect(worker.deleteLater)
-        thread.finished.connect(thread.deleteLater)
-
-        # ensure we remove worker safely when it finishes
-        worker.finished.connect(lambda pid=peer_id: self._on_worker_finished(pid))
-
-        self.clients[peer_id] = {
-            "thread": thread,
-            "worker": worker
-        }
-        print("[LOG] Creat client threat success!")
-
-        thread.start()
-
-    def start(self):
-        self.init_server()
-        self.server_thread.start()
-
-        for neigbor in self.neigbors:
+        for neigbor in self.peers.neighbors():
             peer_id = neigbor["peer_id"]
             self.init_client(peer_id, neigbor.get("ip"), neigbor.get("port"))
 
-    # Handle new client connection to server
-    def _on_new_connection(self, conn):
-        worker = ServerClientWorker(conn)
-        thread = QThread()
+        self._schedule_gossip()
+        self._schedule_outbox_expiry()
+        self._arm_retransmit()      # anything sent before the loop ran
 
-        worker.moveToThread(thread)
-        thread.started.connect(worker.run)
-
-        worker.new_data.connect(self.handle_incoming)
-        # When server client identifies its peer id, mark it active
-        worker.peer_identified.connect(self.add_new_active_peer)
-        # When the server client disconnects, remove active peer (use worker.peer_id)
-        worker.disconnected.connect(lambda w=worker: self.remove_active_peer(getattr(w, 'peer_id', None)))
+    @staticmethod
+    def _invoke(fn):
+        try:
+            fn()
+        except Exception as e:
+            log.error("scheduled %s failed: %s", getattr(fn, "__name__", fn), e)
 
-        worker.disconnected.connect(thread.quit)
-        worker.disconnected.connect(worker.deleteLater)
-        thread.finished.connect(thread.deleteLater)
-        
-        self.server_clients.append({
-            "thread": thread,
-            "worker": worker
-        })
-        thread.start()
+    def _start_metrics_server(self):
+        """Serve self.metrics over HTTP when metrics_port (or PEERCHAT_METRICS_PORT) is set."""
+        try:
+            port = int(os.getenv("PEERCHAT_METRICS_PORT") or getattr(self.config, "metrics_port", 0) or 0)
+        except ValueError:
+            port = 0
+        if port <= 0 or self.metrics_server is not None:
+            return
+        host = getattr(self.config, "metrics_host", "127.0.0.1") or "127.0.0.1"
+        try:
+            self.metrics_server = MetricsServer(self.metrics, host, port).start()
+            self.status.emit(f"[METRICS] Serving http://{host}:{self.metrics_server.port}/metrics")
+        except OSError as e:
+            log.error("metrics endpoint on %s:%s failed: %s", host, port, e)
 
     # add active peer to list
     def add_active_peer(self, peer_id):
-        # Try to find neighbor in cached list
-        neighbor = None
-        for n in self.neigbors:
-            if n["peer_id"] == peer_id:
-                neighbor = n
-                break
+        neighbor = self.peers.get(peer_id)
 
-        # If not found, refresh from DB (newly discovered peer)
-        if neighbor is None:
-            try:
-                self.neigbors = self.db.get_neighbors()
-                for n in self.neigbors:
-                    if n["peer_id"] == peer_id:
-                        neighbor = n
-                        break
-            except Exception:
-                pass
-
-        # Fallback neighbor object if still missing
+        # Fallback neighbor object for a peer we have no record of
         if neighbor is None:
             neighbor = {
                 "peer_id": peer_id,
@@ -193,6 +312,18 @@ class ChatManager(QObject):
                 "last_seen": None
             }
 
+        # A live link is always the best route to that neighbour
+        self.routing.learn(peer_id, peer_id, 1)
+        # ...and may be the first path to peers still waiting for a handshake
+        for waiting in self.outbox.unsealed_destinations():
+            self._start_handshake(waiting)
+        # ...and brings back whatever is queued for it, routed through it or
+        # (no route known) flooded: it may be the path a lost copy needed
+        for dest in self.outbox.destinations():
+            if dest == peer_id or self.routing.next_hop(dest) in (peer_id, None):
+                self.outbox.rewind(dest)
+            self._drain(dest)
+
         # Add to active list if not already
         if not any(p.get("peer_id") == peer_id for p in self.active_peer):
             self.active_peer.append(neighbor)
@@ -204,9 +335,9 @@ class ChatManager(QObject):
                 port = int(neighbor.get("port") or 0)
                 # Only persist if we actually know a connectable endpoint; otherwise avoid polluting DB.
                 if ip and ip != "0.0.0.0" and port > 0:
-                    self.db.upsert_neighbor(peer_id, neighbor.get("username", peer_id[:8]), ip, port, status=1)
+                    self.peers.upsert(peer_id, neighbor.get("username", peer_id[:8]), ip, port, status=1)
             except Exception as e:
-                print(f"[DB_ERROR] Failed to mark neighbor online: {e}")
+                log.error("Failed to mark neighbor online: %s", e)
     
     def add_new_active_peer(self, peer):
         # Add to active list if not already
@@ -220,143 +351,486 @@ class ChatManager(QObject):
         if not peer_id:
             return
 
+        self.routing.drop_next_hop(peer_id)
+        # it may be restarting: handshake again rather than seal with a key it lost
+        self.sessions.drop(peer_id)
+
         for peer in list(self.active_peer):
             if peer.get("peer_id") == peer_id:
                 self.active_peer.remove(peer)
                 self.update_peers.emit(self.active_peer)
                 break
-        # Mark neighbor as offline in DB, preserving existing username/ip/port when available
-        try:
-            neighbor = self.db.get_neighbor(peer_id)
-            if neighbor:
-                username = neighbor.get("username")
-                ip = neighbor.get("ip")
-                port = neighbor.get("port")
-                self.db.upsert_neighbor(peer_id, username, ip, int(port or 0), status=0)
-        except Exception as e:
-            print(f"[DB_ERROR] Failed to mark neighbor offline: {e}")
+        # Mark neighbor as offline (username/ip/port are kept)
+        self.peers.set_status(peer_id, 0)
+
+    def _on_peer_changed(self, peer_id, peer):
+        # a renamed neighbour is shown under its new name right away
+        for active in self.active_peer:
+            if active.get("peer_id") == peer_id:
+                if peer and peer.get("username") and active.get("username") != peer["username"]:
+                    active["username"] = peer["username"]
+                    self.update_peers.emit(self.active_peer)
+                break
 
     def remove_peer(self, peer_id):
-        """Safely stop worker thread and remove peer entry."""
-        obj = self.clients.get(peer_id)
-        if not obj:
-            return
+        """Close the outbound link to peer_id and forget it."""
+        self.engine.disconnect_peer(peer_id)
+        self.clients.pop(peer_id, None)
+
+    def _route_link(self, dest, exclude=()):
+        """Running link toward dest: the direct one, else the learned next hop."""
+        link = self.clients.get(dest)
+        if link is not None and link.running and dest not in exclude:
+            return link
+        hop = self.routing.next_hop(dest)
+        if hop is None or hop in exclude:
+            return None
+        link = self.clients.get(hop)
+        if link is None or not link.running:
+            return None
+        return link
+
+    def _send_directed(self, dest, packet, exclude=(), priority=False) -> bool:
+        """Unicast along the best route; flood only when no route is known.
+
+        priority frames are kept even when a link's send queue is congested.
+        """
+        link = self._route_link(dest, exclude)
+        if link is not None:
+            return link.send(packet, priority=priority)
 
-        thread = obj.get("thread")
-        worker = obj.get("worker")
+        sent = False
+        for peer_id, link in list(self.clients.items()):
+            if peer_id in exclude or not link.running:
+                continue
+            try:
+                sent = link.send(packet, priority=priority) or sent
+            except Exception as e:
+                log.error("Failed to send to %s: %s", peer_id, e)
+        return sent
 
-        try:
-            # Ask worker to stop
-            if worker:
-                worker.stop()
-        except Exception:
-            pass
+    def send_message(self, peer_id, text):
+        """Send a direct message; returns its message id.
+
+        The frame stays in the outbox until peer_id acknowledges it, so a
+        peer that is offline now gets it when it (or a route to it) is back.
+        """
+        msg_id = str(uuid4())
+        # a flooded copy may come back around; don't relay our own message
+        self.seen_messages.add(msg_id)
 
         try:
-            # Quit and wait for thread to finish
-            if thread:
-                thread.quit()
-                thread.wait(2000)
-        except Exception:
-            pass
-    
-        # Finally remove reference
-        if peer_id in self.clients:
-            del self.clients[peer_id]
+            self.db.save_message(msg_id, self.config.peer_id, peer_id, text, sender_name=self.config.username, receiver_name=self.peers.username(peer_id), is_sent=1)
+        except Exception as e:
+            log.error("save_message failed for send_message: %s", e)
+
+        if self._e2e_enabled and peer_id not in self._e2e_unsupported:
+            # the text is held until the ACK: sealed now if there is a
+            # session (else after the handshake), resealed on a NACK
+            self.outbox.hold(peer_id, msg_id, text)
+            self._flush_pending(peer_id)
+            return msg_id
+        self._send_direct(peer_id, msg_id, self._maybe_encrypt_for_wire(text))
+        return msg_id
+
+    def _send_direct(self, peer_id, msg_id, wire_content):
+        packet = self._encode(
+            sender=self.config.peer_id,
+            sender_name=self.config.username,
+            receiver=peer_id,
+            content=wire_content,
+            message_type="MESSAGE",
+            message_id=msg_id
+        )
+        self.outbox.put(peer_id, msg_id, packet)
+        if not self._drain(peer_id):
+            self.status.emit(f"[OUTBOX] {peer_id} not reachable, {self.outbox.pending(peer_id)} message(s) queued")
 
-    def _on_worker_finished(self, peer_id):
-        """Callback when a worker emits finished; ensure it's cleaned up."""
-        # Ensure cleanup is performed in main thread context
-        self.remove_peer(peer_id)
+    # ---------- store-and-forward ----------
+    def _drain(self, dest) -> bool:
+        """Send dest's queued frames, one rate-limited batch per step.
 
-    def send_message(self, peer_id, text):
-        if peer_id not in self.clients:
-            self.status.emit("Peer not connected")
+        Direct link, else routed over the mesh (flooded if no route yet).
+        False when no link took the frame; add_active_peer drains again.
+        """
+        self._drain_scheduled.discard(dest)
+        for seq, msg_id, frame in self.outbox.next_batch(dest, OUTBOX_BATCH):
+            if not self._send_directed(dest, self._numbered(msg_id, seq, frame), priority=True):
+                return False
+            self.outbox.mark_sent(dest, seq)
+            self.inflight.sent(dest, msg_id, seq)
+        self._arm_retransmit()
+        if self.outbox.has_unsent(dest) and dest not in self._drain_scheduled:
+            if self.engine.call_later(self.outbox.wait_time(dest), lambda: self._drain(dest)):
+                self._drain_scheduled.add(dest)
+        return True
+
+    def _schedule_outbox_expiry(self):
+        self.engine.call_later(OUTBOX_EXPIRE_INTERVAL, self._outbox_expiry_tick)
+
+    def _outbox_expiry_tick(self):
+        try:
+            self.outbox.expire()
+        finally:
+            self._schedule_outbox_expiry()
+
+    def _numbered(self, msg_id, seq, frame) -> bytes:
+        """frame stamped with its attempt: relays that forwarded an earlier
+        copy would drop an identical one as a duplicate."""
+        attempt = self.outbox.next_attempt(msg_id, seq)
+        if not attempt:
+            return frame
+        # a frame held for a relay keeps counting from the sender's attempt
+        return retry_frame(frame, frame_attempt(frame) + attempt)
+
+    def _arm_retransmit(self):
+        if self._retransmit_scheduled or not self.inflight:
             return
-
+        # no loop yet (or stopped): leave it unarmed, the next send arms it
+        self._retransmit_scheduled = self.engine.call_later(self.inflight.next_deadline(),
+                                                            self._retransmit_tick)
+
+    def _retransmit_tick(self):
+        """Re-send only the frames whose ACK timed out."""
+        self._retransmit_scheduled = False
+        for dest, msg_id, seq in self.inflight.expired():
+            frame = self.outbox.frame(msg_id)
+            if frame is not None and self._send_directed(dest, self._numbered(msg_id, seq, frame), priority=True):
+                self.inflight.sent(dest, msg_id, seq)
+                self._m_retransmits.labels(dest).inc()
+            else:
+                # acknowledged meanwhile, or no link at all: add_active_peer resends
+                self.inflight.forget(msg_id)
+        self._arm_retransmit()
+
+    def _on_ack(self, msg):
+        msg_id = msg.get("content")
+        if not isinstance(msg_id, str):
+            return
+        # delivered: stop retrying (a relay holding a copy drops it too)
+        self.outbox.ack(msg_id)
+        sample = self.inflight.acked(msg_id)
+        if sample is None or msg.get("to") != self.config.peer_id:
+            return
+        dest, rtt, delivery = sample
+        if rtt is not None:
+            self._m_rtt.labels(dest).observe(rtt)
+        self._m_delivery.labels(dest).observe(delivery)
+
+    def _send_ack(self, msg):
+        """Tell the sender of a direct message that it arrived."""
+        ack = self._encode(
+            sender=self.config.peer_id,
+            sender_name=self.config.username,
+            receiver=msg["from"],
+            content=msg["message_id"],
+            message_type="ACK",
+        )
+        self._send_directed(msg["from"], ack)
+
+    # ---------- end-to-end session handshake ----------
+    # A -> B  HANDSHAKE {"pub": A_pub, "nonce": nA}
+    # B -> A  HANDSHAKE {"pub": B_pub, "nonce": nB, "ack": nA}
+    # Both derive HKDF(X25519(priv, peer_pub), salt=nA||nB) and cache it
+    # under session_id(nA, nB); sealed payloads name the sid they used.
+    def _start_handshake(self, peer_id):
+        pending = self._handshakes.get(peer_id)
+        if pending is not None and time.monotonic() - pending["started"] < HANDSHAKE_TIMEOUT:
+            return
+        nonce = os.urandom(16)
+        # recorded before sending: the answer may arrive before send returns
+        self._handshakes[peer_id] = {"nonce": nonce, "started": time.monotonic()}
+        content = {"pub": self._x25519_pub, "nonce": base64.b64encode(nonce).decode("ascii")}
+        if self._send_handshake(peer_id, content):
+            self.status.emit(f"[E2E] Handshake sent to {peer_id}")
+            # lost on the way (or never answered): re-sent after the timeout
+            self.engine.call_later(HANDSHAKE_TIMEOUT, lambda: self._handshake_timeout(peer_id))
+        elif self._handshakes.get(peer_id, {}).get("nonce") == nonce:
+            # nowhere to send it yet; retried when a link comes up
+            del self._handshakes[peer_id]
+
+    def _send_handshake(self, peer_id, content) -> bool:
         msg_id = str(uuid4())
-        wire_content = self._maybe_encrypt_for_wire(text)
-        packet = encode_message(
+        self.seen_messages.add(msg_id)
+        packet = self._encode(
             sender=self.config.peer_id,
             sender_name=self.config.username,
             receiver=peer_id,
-            content=wire_content,
-            message_type="MESSAGE",
+            content=content,
+            message_type="HANDSHAKE",
             message_id=msg_id
         )
+        return self._send_directed(peer_id, packet, priority=True)
 
+    def _session_info(self, peer_id) -> bytes:
+        return ("peer-chat-session|" + "|".join(sorted([self.config.peer_id, peer_id]))).encode("utf-8")
+
+    def handle_handshake(self, msg):
+        peer_id = msg.get("from")
+        content = msg.get("content")
+        if not peer_id or not isinstance(content, dict):
+            return
+        peer_pub = content.get("pub") or ""
+        ack = content.get("ack")
+
+        if not self._e2e_enabled:
+            # no keypair here: tell the initiator to use the shared-key path
+            if ack is None:
+                self._send_handshake(peer_id, {"pub": "", "nonce": "", "ack": content.get("nonce", "")})
+            return
+
+        ours = self._handshakes.get(peer_id)
+        if ack is not None and (ours is None or base64.b64encode(ours["nonce"]).decode("ascii") != ack):
+            return   # stale or unsolicited answer
+        if not peer_pub:
+            self._handshakes.pop(peer_id, None)
+            self._e2e_unsupported.add(peer_id)
+            self.status.emit(f"[E2E] {peer_id} has no keypair, using the shared key")
+            self._flush_pending(peer_id)
+            return
+
+        pinned = self._peer_pubs.setdefault(peer_id, peer_pub)
+        if pinned != peer_pub:
+            self.status.emit(f"[E2E] Public key of {peer_id} changed, handshake refused")
+            return
         try:
-            self.db.save_message(msg_id, self.config.peer_id, peer_id, text, sender_name=self.config.username, receiver_name=self.db.get_username(peer_id), is_sent=1)
-        except Exception as e:
-            print(f"[DB_ERROR] save_message failed for send_message: {e}")
+            peer_nonce = base64.b64decode(content.get("nonce") or "", validate=True)
+        except Exception:
+            return
 
-        self.clients[peer_id]["worker"].send_data.emit(packet)
+        if ack is None:
+            # we are the responder
+            my_nonce = os.urandom(16)
+            initiator_nonce, responder_nonce = peer_nonce, my_nonce
+        else:
+            del self._handshakes[peer_id]
+            initiator_nonce, responder_nonce = ours["nonce"], peer_nonce
+
+        key = derive_session_key(self._x25519_priv, peer_pub, initiator_nonce + responder_nonce, self._session_info(peer_id))
+        if key is None:
+            self.status.emit(f"[E2E] Key derivation with {peer_id} failed")
+            return
+        # installed before answering: sealed messages may follow the answer at once
+        self.sessions.put(peer_id, session_id(initiator_nonce, responder_nonce), key)
+        if ack is None:
+            self._send_handshake(peer_id, {
+                "pub": self._x25519_pub,
+                "nonce": base64.b64encode(responder_nonce).decode("ascii"),
+                "ack": content.get("nonce"),
+            })
+        self.status.emit(f"[E2E] Session established with {peer_id}")
+        self._flush_pending(peer_id)
+
+    def _flush_pending(self, peer_id):
+        """Seal and send the messages held for peer_id, as far as a session allows."""
+        for msg_id, text in self.outbox.unsealed(peer_id):
+            session = None
+            if peer_id not in self._e2e_unsupported:
+                session = self.sessions.current(peer_id)
+                if session is None:
+                    # no (fresh) key: the rest waits for the handshake
+                    self._start_handshake(peer_id)
+                    return
+            if not self.outbox.mark_sealed(peer_id, msg_id):
+                continue    # sealed meanwhile by a nested flush
+            if session is None:
+                wire_content = self._maybe_encrypt_for_wire(text)
+            else:
+                t0 = perf_counter()
+                wire_content = session.seal(text)
+                self._m_encrypt.observe(perf_counter() - t0)
+            self._send_direct(peer_id, msg_id, wire_content)
+
+    def _send_nack(self, msg, sid):
+        """Tell the sender we cannot open its message (we lost session `sid`)."""
+        nack = self._encode(
+            sender=self.config.peer_id,
+            sender_name=self.config.username,
+            receiver=msg["from"],
+            content={"id": msg["message_id"], "sid": sid},
+            message_type="NACK",
+        )
+        self._send_directed(msg["from"], nack, priority=True)
+
+    def _on_nack(self, msg):
+        """peer_id could not open a sealed message: forget that session and
+        reseal the message from the outbox under a new one."""
+        peer_id, content = msg.get("from"), msg.get("content")
+        if not isinstance(content, dict):
+            return
+        self.sessions.forget(peer_id, content.get("sid"))
+        msg_id = content.get("id")
+        if not self.outbox.reseal(msg_id):
+            return
+        self.inflight.forget(msg_id)
+        log.info("%s lost E2E session %s, resealing %s", peer_id, content.get("sid"), msg_id)
+        self._flush_pending(peer_id)
+
+    def _handshake_timeout(self, peer_id):
+        """Messages still wait for peer_id: ask again."""
+        if self.outbox.unsealed(peer_id) and peer_id not in self._e2e_unsupported \
+                and self.sessions.current(peer_id) is None:
+            self._start_handshake(peer_id)
 
     def send_broadcast_message(self, text):
-        """Broadcast MESSAGE to all connected peers (safe iteration)."""
+        """Broadcast MESSAGE to all connected peers; returns its message id."""
         msg_id = str(uuid4())
+        self.seen_messages.add(msg_id)
         # Persist the broadcast message as a single outgoing record
         try:
             self.db.save_message(msg_id, self.config.peer_id, "", text, sender_name=self.config.username, receiver_name="", is_sent=1)
         except Exception as e:
-            print(f"[DB_ERROR] save_message failed for broadcast: {e}")
+            log.error("save_message failed for broadcast: %s", e)
+
+        # Same bytes for every neighbour: encrypt and encode once
+        try:
+            wire_content = self._maybe_encrypt_for_wire(text)
+            packet = self._encode(
+                sender=self.config.peer_id,
+                sender_name=self.config.username,
+                receiver="*",
+                content=wire_content,
+                message_type="MESSAGE",
+                message_id=msg_id
+            )
+        except Exception as e:
+            log.error("send_broadcast_message failure: %s", e)
+            return None
 
-        for peer_id, obj in list(self.clients.items()):
-            if obj["worker"].running is False:
+        for peer_id, link in list(self.clients.items()):
+            if link.running is False:
                 continue
+            log.debug("Broadcasting %s to %s", msg_id, peer_id)
             try:
-                wire_content = self._maybe_encrypt_for_wire(text)
-                packet = encode_message(
-                    sender=self.config.peer_id,
-                    sender_name=self.config.username,
-                    receiver="*",
-                    content=wire_content,
-                    message_type="MESSAGE",
-                    message_id=msg_id
-                )
-                print(f'[LOG] Broadcasting message to {peer_id}: {text}')
-                try:
-                    obj["worker"].send_data.emit(packet)
-                except Exception as e:
-                    print(f'[ERROR] Failed to send MESSAGE to {peer_id}: {e}')
+                link.send(packet)
             except Exception as e:
-                print(f'[ERROR] send_broadcast_message failure for {peer_id}: {e}')
+                log.error("Failed to send MESSAGE to %s: %s", peer_id, e)
+        return msg_id
 
     def find_nodes(self):
-        """Broadcast FIND_NODES to all connected peers (safe iteration).
-        Iterate over a snapshot to avoid mutation during callbacks.
+        """Gossip with every connected neighbour now (menu "Find Nodes").
+
+        Shows what is already known right away; replies extend the
+        discovered list as they arrive.
         """
-        for peer_id, obj in list(self.clients.items()):
-            try:
-                packet = encode_message(
-                    sender=self.config.peer_id,
-                    sender_name=self.config.username,
-                    receiver=peer_id,
-                    content="",
-                    message_type="FIND_NODES"
-                )
+        self.gossip_round(everyone=True)
+        self.update_discovered_peers.emit(self.discovery.member_list())
+
+    # ---------- gossip discovery ----------
+    def _schedule_gossip(self):
+        try:
+            interval = float(getattr(self.config, "discovery_interval", 30) or 0)
+        except (TypeError, ValueError):
+            interval = 0
+        if interval <= 0:
+            return
+        # jitter so nodes started together don't gossip in lockstep
+        self.engine.call_later(interval * (0.5 + random.random()), self._gossip_tick)
+
+    def _gossip_tick(self):
+        try:
+            self.gossip_round()
+        finally:
+            self._schedule_gossip()
+
+    def gossip_round(self, everyone=False) -> list:
+        """One shuffle: send FIND_NODES to `fanout` random direct neighbours."""
+        neighbours = [peer_id for peer_id, link in list(self.clients.items()) if link.running]
+        targets = self.discovery.start_round(neighbours)
+        if everyone:
+            targets = neighbours
+        for peer_id in targets:
+            self._send_gossip(peer_id, "FIND_NODES")
+        return targets
+
+    def _gossip_content(self, peer_id) -> dict:
+        # "neighbors" stays our real online neighbours (older nodes read it)
+        neighbors = []
+        for n in self.peers.neighbors():
+            if n.get("status", 0) == 1 and n.get("peer_id") != peer_id:
+                neighbors.append({k: n.get(k) for k in ("peer_id", "username", "ip", "port")})
+                if len(neighbors) >= self.discovery.shuffle_len:
+                    break
+        return {
+            "self": dict(self.discovery.me),
+            "peers": self.discovery.sample_for(peer_id),
+            "neighbors": neighbors,
+        }
+
+    def _send_gossip(self, peer_id, message_type) -> bool:
+        """Send a shuffle frame over the direct link only (ttl=1, never relayed)."""
+        link = self.clients.get(peer_id)
+        if link is None or not link.running:
+            return False
+        packet = self._encode(
+            sender=self.config.peer_id,
+            sender_name=self.config.username,
+            receiver=peer_id,
+            content=self._gossip_content(peer_id),
+            ttl=1,
+            message_type=message_type,
+        )
+        try:
+            return link.send(packet)
+        except Exception as e:
+            log.error("Failed to send %s to %s: %s", message_type, peer_id, e)
+            return False
+
+    def _merge_discovered(self, content, from_peer=None) -> bool:
+        """Fold a FIND_NODES/FIND_ACK payload into the sampler."""
+        if not isinstance(content, dict):
+            return False
+        descriptors = [content.get("self")]
+        me = content.get("self")
+        if from_peer and isinstance(me, dict) and me.get("peer_id") == from_peer:
+            # a neighbour's own descriptor is the authority on its name
+            self.peers.rename(from_peer, me.get("username"))
+        for key in ("peers", "neighbors"):
+            if isinstance(content.get(key), list):
+                descriptors.extend(content[key])
+        learned = self.discovery.merge(descriptors, from_peer=from_peer)
+        if learned:
+            # the UI replaces its whole discovered list on every update
+            self.update_discovered_peers.emit(self.discovery.member_list())
+        return learned
 
-                try:
-                    obj["worker"].send_data.emit(packet)
-                except Exception as e:
-                    print(f'[ERROR] Failed to send FIND_NODES to {peer_id}: {e}')
-            except Exception as e:
-                print(f'[ERROR] find_nodes failure for {peer_id}: {e}')
-        
     def handle_incoming(self, raw: bytes):
+        t0 = perf_counter()
         msg = decode_message(raw)
-        print(f'[LOG] Received message: {msg}')
+        t1 = perf_counter()
+        self._m_decode.observe(t1 - t0)
+        log.debug("Received %r", msg)
 
+        msg_type = msg["type"]
+        self._m_in.labels(msg_type).inc()
+        self._m_bytes_in.inc(len(raw))
+        try:
+            self._dispatch(msg, raw)
+        finally:
+            self._m_handle.labels(msg_type).observe(perf_counter() - t1)
+
+    def _dispatch(self, msg, raw):
         msg_id = msg["message_id"]
-        # Check if we've seen this message before to prevent loops
-        if msg_id in self.seen_messages:
+        msg_type = msg["type"]
+        # Learn the reverse path even from duplicates: they may be shorter
+        self.routing.learn_from_message(msg)
+
+        # Check if we've seen this message before to prevent loops. A relay
+        # dedups a retransmit per attempt so it passes the copy on; the
+        # destination still dedups (and re-ACKs) on the message id.
+        dedup_id = msg_id
+        if msg.get("attempt") and msg_type == "MESSAGE" and msg.get("from") != self.config.peer_id \
+                and msg.get("to") not in {"", "*", self.config.peer_id}:
+            dedup_id = f"{msg_id}#{msg['attempt']}"
+        if self.seen_messages.seen(dedup_id):
+            self._m_deduped.labels(msg_type).inc()
+            if msg_type == "MESSAGE" and msg.get("to") == self.config.peer_id:
+                self._send_ack(msg)     # a retry: our first ACK may have been lost
             return
-        self.seen_messages.add(msg_id)
         
         # Forward message to other neigbors
-        self.handle_forward_msg(msg)
+        self.handle_forward_msg(msg, raw)
 
-        msg_type = msg["type"]
         # Dispatch based on message type
         # =====================================================
         #               INCOMING MESSAGE HANDLING
@@ -368,23 +842,34 @@ class ChatManager(QObject):
             if receiver and receiver not in {"*"} and receiver != self.config.peer_id:
                 return
 
-            try:
-                # Decrypt only for local persistence/UI AFTER forwarding.
-                wire_content = msg.get("content", "")
-                plain_content = self._maybe_decrypt_for_ui(wire_content)
+            # Decrypt only for local persistence/UI AFTER forwarding.
+            wire_content = msg.get("content", "")
+            plain_content = self._maybe_decrypt_for_ui(wire_content, msg.get("from"))
+            if plain_content is None:
+                # sealed with a session we no longer have (we restarted):
+                # neither stored nor ACKed, the sender reseals it
+                self.seen_messages.discard(msg_id)
+                self._send_nack(msg, parse_sealed(wire_content)[0])
+                return
 
+            try:
                 # Persist incoming message (received) with sender/receiver names when available
                 sender = msg.get("from")
-                sender_name = msg.get("from_n") or self.db.get_username(sender)
-                receiver_name = msg.get("to_n") or self.db.get_username(receiver)
+                if receiver == "*":
+                    # stored like our own broadcasts so they show up in broadcast history
+                    receiver = ""
+                sender_name = msg.get("from_n") or self.peers.username(sender)
+                receiver_name = msg.get("to_n") or self.peers.username(receiver)
                 self.db.save_message(msg_id, sender, receiver, plain_content, sender_name=sender_name, receiver_name=receiver_name, is_sent=0)
             except Exception as e:
-                print(f"[DB_ERROR] save_message failed: {e}")
+                log.error("save_message failed: %s", e)
 
             msg_out = dict(msg)
             msg_out["content"] = plain_content
-            print(f'[LOG] Delivered message to UI: {msg_out}')
+            log.debug("Delivered %s from %s", msg_id, msg.get("from"))
             self.message_received.emit(msg_out)
+            if msg.get("to") == self.config.peer_id:
+                self._send_ack(msg)
 
         # =====================================================
         #               INCOMING FIND_NODES HANDLING
@@ -392,13 +877,35 @@ class ChatManager(QObject):
         elif msg_type == "FIND_NODES":
             self.handle_find_nodes(msg)
 
+        # =====================================================
+        #               INCOMING ACK HANDLING
+        # =====================================================
+        elif msg_type == "ACK":
+            self._on_ack(msg)
+
+        # =====================================================
+        #               INCOMING NACK HANDLING
+        # =====================================================
+        elif msg_type == "NACK":
+            if msg.get("to") == self.config.peer_id:
+                self._on_nack(msg)
+
+        # =====================================================
+        #               INCOMING HANDSHAKE HANDLING
+        # =====================================================
+        elif msg_type == "HANDSHAKE":
+            if msg.get("to") == self.config.peer_id:
+                self.handle_handshake(msg)
+
         # =====================================================
         #               INCOMING FIND_ACK HANDLING
         # =====================================================
         elif msg_type == "FIND_ACK":
+            if msg.get("to") not in {"", "*", self.config.peer_id}:
+                return
             content = msg.get("content", {})
-            # Only add the sender ('self') of each FIND_ACK to the discovered list, not their neighbors
-            discovered_peers = []
+            self._merge_discovered(content, from_peer=msg.get("from"))
+            # The responder itself is online: show it as an active peer
             if isinstance(content, dict) and "self" in content and isinstance(content["self"], dict):
                 p = content["self"]
                 try:
@@ -415,13 +922,6 @@ class ChatManager(QObject):
                     elif status != 1:
                         pass
                     else:
-                        discovered_peers.append({
-                            "peer_id": peer_id,
-                            "username": username,
-                            "ip": ip,
-                            "port": port
-                        })
-                        
                         # check if already in active peers
                         is_new_peer = True
                         for _peer in self.active_peer:
@@ -438,117 +938,84 @@ class ChatManager(QObject):
                         # self.status.emit(f"[DISCOVER] Found peer {username} ({ip}:{port})")
                 except Exception:
                     pass
-            if discovered_peers:
-                self.update_discovered_peers.emit(discovered_peers)
 
-    def handle_forward_msg(self, msg):
+    def handle_forward_msg(self, msg, raw=None):
+        if msg["type"] == "FIND_NODES":
+            return  # discovery is neighbour-to-neighbour gossip, never relayed
         ttl = msg["ttl"] - 1
         if ttl <= 0:
             return
+        receiver = msg.get("to") or ""
+        if receiver == self.config.peer_id:
+            return  # we are the destination, nothing to relay
         sender = msg["from"]
         forwarder = msg["forward"]
         msg["forward"] = self.config.peer_id
+        self._m_forwarded.labels(msg["type"]).inc()
 
-        forward_msg = encode_message(
-            sender=msg["from"],
-            sender_name=msg["from_n"],
-            receiver=msg["to"],
-            receiver_name=msg["to_n"],
-            forwarder=self.config.peer_id,
-            content=msg["content"],
-            ttl=ttl,
-            message_type=msg["type"],
-            message_id=msg["message_id"]
-        )
+        if raw is not None:
+            # fast path: patch ttl/forward in the route header, reuse the body
+            forward_msg = forward_frame(raw, ttl, self.config.peer_id)
+        else:
+            forward_msg = self._encode(
+                sender=msg["from"],
+                sender_name=msg["from_n"],
+                receiver=msg["to"],
+                receiver_name=msg["to_n"],
+                forwarder=self.config.peer_id,
+                content=msg["content"],
+                ttl=ttl,
+                message_type=msg["type"],
+                message_id=msg["message_id"],
+                attempt=msg.get("attempt", 0)
+            )
+
+        # Directed traffic follows the routing table; broadcasts still flood
+        if receiver not in {"", "*"}:
+            link = self.clients.get(receiver)
+            if msg["type"] == "MESSAGE" and link is not None and not link.running:
+                # our neighbour is mid-reconnect: hold it until the link is back
+                self.outbox.put(receiver, msg["message_id"], forward_msg, relayed=True)
+                return
+            self._send_directed(receiver, forward_msg, exclude=(sender, forwarder))
+            return
 
-        for peer_id, obj in list(self.clients.items()):
+        for peer_id, link in list(self.clients.items()):
             if peer_id != forwarder and peer_id != sender:
                 try:
-                    obj["worker"].send_data.emit(forward_msg)
+                    link.send(forward_msg)
                 except Exception as e:
-                    print(f"[ERROR] Failed to forward FIND_NODES to {peer_id}: {e}")
+                    log.error("Failed to forward %s to %s: %s", msg["type"], peer_id, e)
 
     def handle_find_nodes(self, msg):
-        sender = msg["from"]
-        ttl = msg["ttl"] - 1
-
-        # Prepare neighbors payload (only online peers with minimal fields)
-        neighbors_payload = []
-        try:
-            for n in self.neigbors:
-                if n.get("status", 0) == 1:
-                    neighbors_payload.append({
-                        "peer_id": n.get("peer_id"),
-                        "username": n.get("username"),
-                        "ip": n.get("ip"),
-                        "port": n.get("port"),
-                    })
-        except Exception:
-            pass
-
-        ack = encode_message(
-            sender=self.config.peer_id,
-            sender_name=self.config.username,
-            receiver=sender,
-            message_type="FIND_ACK",
-            content={
-                "self": {
-                    "peer_id": self.config.peer_id,
-                    "username": self.config.username,
-                    "ip": self.config.ip,
-                    "port": self.config.port
-                },
-                "neighbors": neighbors_payload
-            }
-        )
-
-        # gửi ngược về (direct hoặc broadcast để forward)
-        for peer_id, obj in list(self.clients.items()):
-            try:
-                obj["worker"].send_data.emit(ack)
-            except Exception:
-                pass
-
-        if ttl <= 0:
+        """Answer a shuffle request with a sample of our own, then merge theirs."""
+        requester = msg["from"]
+        if requester == self.config.peer_id:
             return
-
-        forward = encode_message(
-            sender=msg["from"],
-            sender_name=msg["from_n"],
-            receiver="*",
-            forwarder=self.config.peer_id,
-            content=msg["content"],
-            ttl=ttl,
-            message_type="FIND_NODES",
-            message_id=msg["message_id"]
-        )
-
-        for peer_id, obj in list(self.clients.items()):
-            if peer_id != sender and peer_id != msg.get("forward"):
-                try:
-                    obj["worker"].send_data.emit(forward)
-                except Exception as e:
-                    print(f"[ERROR] Failed to forward FIND_NODES to {peer_id}: {e}")
+        # build the reply first so merging can replace what we hand out
+        direct = msg.get("forward") in {"", requester}
+        if not (direct and self._send_gossip(requester, "FIND_ACK")):
+            # relayed by an older node, or no link back: route the answer
+            ack = self._encode(
+                sender=self.config.peer_id,
+                sender_name=self.config.username,
+                receiver=requester,
+                message_type="FIND_ACK",
+                content=self._gossip_content(requester),
+            )
+            self._send_directed(requester, ack)
+        self._merge_discovered(msg.get("content"), from_peer=requester)
 
     def stop(self):
-        if self.server_worker:
-            self.server_worker.stop()
-        if self.server_thread:
-            self.server_thread.quit()
-            self.server_thread.wait()
-
-        for peer_id in list(self.clients.keys()):
-            entry = self.clients.pop(peer_id, None)
-            if not entry:
-                return
-
-            entry["worker"].stop()
-            entry["thread"].quit()
-            entry["thread"].wait()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        self.engine.stop()
+        self.clients.clear()
 
-        # Close DB connection cleanly
+        # Flush queued messages and close DB connection cleanly
         try:
-            if hasattr(self, 'db') and self.db and getattr(self.db, 'conn', None):
-                self.db.conn.close()
-        except Exception:
-            pass
+            if getattr(self, 'db', None):
+                self.db.close()
+        except Exception as e:
+            log.error("close failed: %s", e)
@@ -1,35 +1,213 @@
+import functools
 import os
+import re
 import sqlite3
+import threading
+import time
 import uuid
+from concurrent.futures import Future
+from core.db_executor import DBExecutor
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# Bumped whenever migrate() learns a new step; stored in PRAGMA user_version
+SCHEMA_VERSION = 4
+
+MESSAGES_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS messages (
+    id VARCHAR(36) PRIMARY KEY,
+    sender TEXT,
+    sender_name TEXT,
+    receiver TEXT,
+    receiver_name TEXT,
+    content TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    is_sent INTEGER DEFAULT 1
+)
+"""
+
+# Store-and-forward queue (core/outbox.py): encoded frames waiting for an ACK
+OUTBOX_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id VARCHAR(36) NOT NULL UNIQUE,
+    dest TEXT NOT NULL,
+    frame BLOB NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+# Direct messages waiting for an end-to-end session, kept as plaintext until
+# they can be sealed; they move to `outbox` as frames once sealed
+OUTBOX_UNSEALED_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS outbox_unsealed (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id VARCHAR(36) NOT NULL UNIQUE,
+    dest TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+# Full-text index over message content and sender names (schema v4). It is an
+# external-content FTS5 table: it stores only the index and reads text back
+# from messages by rowid; triggers keep it in step with every insert/delete.
+# remove_diacritics: "chao" finds "chào"; prefix indexes make the
+# type-ahead query ("dead*") a lookup instead of a scan over the term list.
+SEARCH_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, sender_name,
+        content='messages', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, sender_name) VALUES (new.rowid, new.content, new.sender_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, sender_name)
+        VALUES ('delete', old.rowid, old.content, old.sender_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, sender_name ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, sender_name)
+        VALUES ('delete', old.rowid, old.content, old.sender_name);
+        INSERT INTO messages_fts(rowid, content, sender_name) VALUES (new.rowid, new.content, new.sender_name);
+    END
+    """,
+]
+
+INDEXES_SQL = [
+    # one conversation = two (sender, receiver) ranges, already in time order
+    "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(sender, receiver, timestamp)",
+    # broadcast history only (same predicate as get_broadcasts)
+    "CREATE INDEX IF NOT EXISTS idx_messages_broadcast ON messages(timestamp) WHERE receiver = '' OR receiver IS NULL",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_neighbor_peer_id ON neighbor(peer_id)",
+    # one destination's queue, oldest first
+    "CREATE INDEX IF NOT EXISTS idx_outbox_dest ON outbox(dest, seq)",
+]
+
+# Display names are resolved when reading: the neighbor table wins, the name
+# stored with the message is the fallback. Renames never touch history rows.
+SENDER_NAME_SQL = "COALESCE(NULLIF(ns.username, ''), m.sender_name) AS sender_name"
+RECEIVER_NAME_SQL = "COALESCE(NULLIF(nr.username, ''), m.receiver_name) AS receiver_name"
+NAME_JOINS_SQL = """
+    LEFT JOIN neighbor ns ON ns.peer_id = m.sender
+    LEFT JOIN neighbor nr ON nr.peer_id = m.receiver
+"""
+
+# Duplicate ids (a message delivered twice) are ignored
+INSERT_MESSAGE_SQL = """
+    INSERT OR IGNORE INTO messages (id, sender, sender_name, receiver, receiver_name, content, is_sent)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _on_writer(method):
+    """Run a ChatDatabase method on the writer thread; it gets the read-write conn."""
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        return self.executor.write(lambda conn: method(self, conn, *args, **kwargs))
+    call.db_writes = True
+    return call
+
+
+def _on_reader(method):
+    """Run a ChatDatabase method on a reader thread; it gets a read-only conn."""
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        if not self.executor.on_executor():
+            # rows still in the write-behind queue go out before this read
+            self._request_flush()
+        return self.executor.read(lambda conn: method(self, conn, *args, **kwargs))
+    return call
+
 
 class ChatDatabase:
-    def __init__(self, db_filename="chat.db"):
+    def __init__(self, db_filename="chat.db", write_behind=False, batch_size=500, flush_interval=0.05,
+                 metrics=None, readers=2):
+        """Open (and migrate) db/<db_filename>.
+
+        All SQLite work runs on a DBExecutor (core/db_executor.py): one
+        writer thread plus `readers` read-only connections, so a slow query
+        never stalls the Qt or network thread that asked for it. Methods
+        block until their result is ready; `submit()` runs any of them (or a
+        function calling them) in the background and returns a Future.
+
+        With write_behind=True, save_message only queues the row; the writer
+        thread writes queued rows in one transaction (executemany) once
+        `batch_size` rows are waiting or every `flush_interval` seconds.
+        Reads flush first, so callers always see their own writes, and
+        close() flushes before closing.
+
+        `metrics` (a core.metrics.MetricsRegistry) receives write latency,
+        rows written and the write-behind backlog.
+        """
         self.db_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "db")
         self.db_path = os.path.join(self.db_dir, db_filename)
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_queued = False
+
+        self._m_write = self._m_rows = None
+        if metrics is not None:
+            self._m_write = metrics.histogram("peerchat_db_write_seconds", "Time per INSERT transaction (one batch)")
+            self._m_rows = metrics.counter("peerchat_db_rows_written_total", "Messages written to SQLite")
+            metrics.gauge("peerchat_db_pending_rows", "Messages waiting for the write-behind flush",
+                          fn=lambda: len(self._pending))
+
+        self.executor = DBExecutor(
+            self.db_path, readers=readers, setup=self._apply_pragmas,
+            tick=self._write_pending, tick_interval=flush_interval,
+        )
+        # the writer's connection: only ever used on the writer thread
+        self.conn = self.executor.conn
+
         self.create_tables()
-        # Ensure older DBs are migrated to current schema (populate message IDs)
+        # Ensure older DBs are migrated to current schema
         try:
             self.migrate()
-        except Exception:
-            # Non-fatal: keep app running even if migration fails; log elsewhere if needed
-            pass
+        except Exception as e:
+            # Non-fatal: keep app running even if migration fails
+            log.error("migration failed for %s: %s", self.db_path, e)
 
-    def create_tables(self):
-        self.conn.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id VARCHAR(36),
-            sender TEXT,
-            sender_name TEXT,
-            receiver TEXT,
-            receiver_name TEXT,
-            content TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            is_sent INTEGER DEFAULT 1
-        )
-        """)
+    @staticmethod
+    def _apply_pragmas(conn):
+        # WAL: readers don't block the writer; NORMAL sync is durable across
+        # app crashes (only an OS crash can lose the last commits)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-16000")      # ~16 MB page cache
+        conn.execute("PRAGMA busy_timeout=5000")
 
-        self.conn.execute("""
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Run fn(*args, **kwargs) on the DB threads and return a Future.
+
+        fn is a ChatDatabase method or any function calling them: write
+        methods queue on the writer, everything else runs on a reader. Use it
+        from the Qt and network threads so they never wait on SQLite.
+        """
+        if getattr(fn, "db_writes", False):
+            return self.executor.submit_write(lambda conn: fn(*args, **kwargs))
+        self._request_flush()
+        return self.executor.submit_read(lambda conn: fn(*args, **kwargs))
+
+    @_on_writer
+    def create_tables(self, conn):
+        conn.execute(MESSAGES_TABLE_SQL)
+
+        conn.execute("""
         CREATE TABLE IF NOT EXISTS neighbor (
             peer_id TEXT ,          -- UUID
             username TEXT,
@@ -40,18 +218,49 @@ class ChatDatabase:
             is_neighbor INTEGER DEFAULT 1      -- 1=neighbor, 0=not neighbor
         )
         """)
+        conn.execute(OUTBOX_TABLE_SQL)
+        conn.execute(OUTBOX_UNSEALED_TABLE_SQL)
 
-        self.conn.commit()
+        conn.commit()
 
-    def reset_db(self):
-        self.conn.execute("DROP TABLE IF EXISTS messages")
-        self.conn.execute("DROP TABLE IF EXISTS neighbor")
+    @_on_writer
+    def reset_db(self, conn):
+        with self._pending_lock:
+            self._pending.clear()
+        conn.execute("DROP TABLE IF EXISTS messages")
+        conn.execute("DROP TABLE IF EXISTS neighbor")
+        conn.execute("DROP TABLE IF EXISTS outbox")
+        conn.execute("DROP TABLE IF EXISTS outbox_unsealed")
+        conn.execute("DROP TABLE IF EXISTS messages_fts")
 
         self.create_tables()
+        self._create_indexes(conn)
+        self._create_search_index(conn)
+
+    @staticmethod
+    def _create_indexes(conn):
+        for sql in INDEXES_SQL:
+            conn.execute(sql)
+        conn.commit()
 
-    def migrate(self):
+    @_on_writer
+    def migrate(self, conn):
+        """Bring the DB up to SCHEMA_VERSION, one versioned step at a time."""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            self._migrate_v1(conn)
+        if version < 2:
+            self._migrate_v2(conn)
+        if version < 4:
+            self._migrate_v4(conn)
+        self._create_indexes(conn)
+        if version < SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+
+    def _migrate_v1(self, conn):
         """Ensure 'id', 'sender_name', and 'receiver_name' columns exist and backfill missing values."""
-        cur = self.conn.cursor()
+        cur = conn.cursor()
 
         # Ensure messages table exists
         cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='messages'")
@@ -65,15 +274,15 @@ class ChatDatabase:
         # Add 'id' column if missing
         if 'id' not in cols:
             cur.execute("ALTER TABLE messages ADD COLUMN id VARCHAR(36)")
-            self.conn.commit()
+            conn.commit()
 
         # Add sender_name/receiver_name if missing
         if 'sender_name' not in cols:
             cur.execute("ALTER TABLE messages ADD COLUMN sender_name TEXT")
-            self.conn.commit()
+            conn.commit()
         if 'receiver_name' not in cols:
             cur.execute("ALTER TABLE messages ADD COLUMN receiver_name TEXT")
-            self.conn.commit()
+            conn.commit()
 
         # Backfill missing or empty ids
         cur.execute("SELECT rowid, id, sender, receiver, sender_name, receiver_name FROM messages")
@@ -101,31 +310,235 @@ class ChatDatabase:
                 else:
                     cur.execute("UPDATE messages SET receiver_name = ? WHERE rowid = ?", ('', rowid))
 
-        self.conn.commit()
+        conn.commit()
+
+    def _migrate_v2(self, conn):
+        """Primary key on messages.id, unique neighbor.peer_id (indexes follow)."""
+        cols = conn.execute("PRAGMA table_info(messages)").fetchall()
+        id_is_pk = any(c[1] == 'id' and c[5] for c in cols)
+
+        conn.execute("BEGIN")
+        try:
+            if not id_is_pk:
+                # SQLite cannot add a primary key in place: rebuild the table
+                conn.execute("ALTER TABLE messages RENAME TO messages_v1")
+                conn.execute(MESSAGES_TABLE_SQL)
+                conn.execute("""
+                    INSERT OR IGNORE INTO messages (id, sender, sender_name, receiver, receiver_name, content, timestamp, is_sent)
+                    SELECT id, sender, sender_name, receiver, receiver_name, content, timestamp, is_sent
+                    FROM messages_v1 ORDER BY rowid
+                """)
+                conn.execute("DROP TABLE messages_v1")
+
+            # keep only the most recent row per peer before peer_id becomes unique
+            conn.execute("""
+                DELETE FROM neighbor
+                WHERE rowid NOT IN (SELECT MAX(rowid) FROM neighbor GROUP BY peer_id)
+            """)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def _create_search_index(conn):
+        for sql in SEARCH_INDEX_SQL:
+            conn.execute(sql)
+        conn.commit()
+
+    def _migrate_v4(self, conn):
+        """Full-text index: create it and index the existing history once."""
+        self._create_search_index(conn)
+        self.rebuild_search_index()
+
+    @_on_writer
+    def rebuild_search_index(self, conn):
+        """Re-index every message (after bulk edits outside these triggers)."""
+        conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+        conn.commit()
 
     def save_message(self, message_id, sender, receiver, content, sender_name=None, receiver_name=None, is_sent=1):
-        sql = """
-            INSERT INTO messages (id, sender, sender_name, receiver, receiver_name, content, is_sent)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+        row = (message_id, sender, sender_name, receiver, receiver_name, content, is_sent)
+        if not self.write_behind:
+            self._insert_rows([row])
+            return
+
+        with self._pending_lock:
+            self._pending.append(row)
+            queued = len(self._pending)
+        if queued >= self.batch_size:
+            self._request_flush()
+
+    @_on_writer
+    def _insert_rows(self, conn, rows):
+        t0 = time.perf_counter()
+        conn.executemany(INSERT_MESSAGE_SQL, rows)
+        conn.commit()
+        if self._m_write is not None:
+            self._m_write.observe(time.perf_counter() - t0)
+            self._m_rows.inc(len(rows))
+
+    # ---------- write-behind ----------
+    def flush(self) -> int:
+        """Write all queued messages in one transaction; return how many."""
+        return self.executor.write(self._write_pending)
+
+    def _request_flush(self):
+        """Queue a flush on the writer; reads submitted after it wait for it."""
+        with self._pending_lock:
+            if not self._pending or self._flush_queued:
+                return
+            self._flush_queued = True
+        try:
+            self.executor.submit_write(self._write_pending)
+        except RuntimeError:
+            pass        # closed: close() already wrote what was queued
+
+    def _write_pending(self, conn) -> int:
+        # writer thread only (flush, _request_flush and the executor tick)
+        with self._pending_lock:
+            self._flush_queued = False
+            if not self._pending:
+                return 0
+            rows, self._pending = self._pending, []
+        try:
+            self._insert_rows(rows)
+        except sqlite3.OperationalError:
+            # e.g. database locked: keep the rows for the next flush
+            with self._pending_lock:
+                self._pending[:0] = rows
+            raise
+        return len(rows)
+
+    def close(self):
+        """Flush queued writes durably, stop the DB threads and close the connections."""
+        try:
+            self.flush()
+        except RuntimeError:
+            return      # already closed
+        finally:
+            self.executor.close()
+
+    @_on_reader
+    def get_conversation(self, conn, user1, user2):
+        sql = f"""
+        SELECT m.sender, m.receiver, m.content, m.timestamp, {SENDER_NAME_SQL}, {RECEIVER_NAME_SQL}
+        FROM messages m {NAME_JOINS_SQL}
+        WHERE (m.sender=? AND m.receiver=?)
+           OR (m.sender=? AND m.receiver=?)
+        ORDER BY m.timestamp, m.rowid
         """
-        self.conn.execute(sql, (message_id, sender, sender_name, receiver, receiver_name, content, is_sent))
-        self.conn.commit()
+        return conn.execute(sql, (user1, user2, user2, user1)).fetchall()
     
-    def get_conversation(self, user1, user2):
-        sql = """
-        SELECT sender, receiver, content, timestamp, sender_name, receiver_name
-        FROM messages
-        WHERE (sender=? AND receiver=?)
-           OR (sender=? AND receiver=?)
-        ORDER BY timestamp
+    # ---------- paginated history ----------
+    # Keyset pagination: a page is the `limit` newest rows strictly older than
+    # the cursor (timestamp, rowid) of the previous page, so every page is an
+    # index range scan no matter how long the history is.
+    def get_conversation_page(self, user1, user2, before=None, limit=50):
+        """Return (rows, cursor) for one page of a conversation.
+
+        rows have the same columns as get_conversation and are oldest-first;
+        pass `cursor` back as `before` for the next older page. cursor is None
+        once the start of the history is reached.
         """
-        cursor = self.conn.execute(sql, (user1, user2, user2, user1))
-        return cursor.fetchall()
-    
-    def get_neighbors(self):
-        self.conn.row_factory = sqlite3.Row
-        cursor = self.conn.cursor()
+        older = "AND (timestamp, rowid) < (?, ?)" if before else ""
+        branch = f"""
+            SELECT * FROM (
+                SELECT rowid AS seq, * FROM messages
+                WHERE sender = ? AND receiver = ? {older}
+                ORDER BY timestamp DESC, rowid DESC LIMIT ?
+            )
+        """
+        cursor_args = tuple(before) if before else ()
+        # one branch per direction; talking to ourselves both would return the same rows
+        directions = [(user1, user2)] if user1 == user2 else [(user1, user2), (user2, user1)]
+        source = " UNION ALL ".join([branch] * len(directions))
+        sql = f"""
+        SELECT m.seq, m.timestamp, m.sender, m.receiver, m.content, m.timestamp, {SENDER_NAME_SQL}, {RECEIVER_NAME_SQL}
+        FROM ({source}) m {NAME_JOINS_SQL}
+        ORDER BY m.timestamp DESC, m.seq DESC
+        LIMIT ?
+        """
+        params = []
+        for sender, receiver in directions:
+            params += [sender, receiver, *cursor_args, limit]
+        return self._page(sql, (*params, limit), limit)
+
+    def get_broadcasts_page(self, before=None, limit=50):
+        """Return (rows, cursor) for one page of broadcasts; rows as get_broadcasts."""
+        older = "AND (m.timestamp, m.rowid) < (?, ?)" if before else ""
+        sql = f"""
+        SELECT m.rowid, m.timestamp, m.id, m.sender, {SENDER_NAME_SQL}, m.receiver, {RECEIVER_NAME_SQL}, m.content, m.timestamp, m.is_sent
+        FROM messages m {NAME_JOINS_SQL}
+        WHERE (m.receiver = '' OR m.receiver IS NULL) {older}
+        ORDER BY m.timestamp DESC, m.rowid DESC
+        LIMIT ?
+        """
+        return self._page(sql, (*(tuple(before) if before else ()), limit), limit)
+
+    @_on_reader
+    def _page(self, conn, sql, params, limit):
+        # every page query selects (rowid, timestamp) first, for the cursor
+        rows = [tuple(r) for r in conn.execute(sql, params).fetchall()]
+        rows.reverse()
+        cursor = (rows[0][1], rows[0][0]) if len(rows) == limit else None
+        return [r[2:] for r in rows], cursor
+
+    # ---------- search ----------
+    @staticmethod
+    def search_query(text):
+        """FTS5 query for free text: every word must match, the last as a prefix.
 
+        Words are quoted, so user input can't inject FTS syntax. None if the
+        text has no words.
+        """
+        words = re.findall(r"\w+", text or "")
+        if not words:
+            return None
+        terms = ['"%s"' % w for w in words]
+        terms[-1] += "*"
+        return " ".join(terms)
+
+    @_on_reader
+    def search_messages(self, conn, text, peer=None, offset=0, limit=50, window=1000):
+        """Return (rows, next_offset) for one page of messages matching `text`.
+
+        Best match first (bm25; content weighs more than the sender name)
+        among the `window` newest matches: FTS5 walks those straight from the
+        index, so a word found in half the history costs the same as a rare
+        one. rows are (id, sender, sender_name, receiver, receiver_name, content,
+        timestamp, snippet) with the match in the snippet marked by [ ].
+        `peer` limits the search to messages from or to that peer.
+        next_offset is None after the last page.
+        """
+        query = self.search_query(text)
+        if query is None:
+            return [], None
+        scope = "AND (m.sender = ? OR m.receiver = ?)" if peer else ""
+        sql = f"""
+        SELECT m.id, m.sender, {SENDER_NAME_SQL}, m.receiver, {RECEIVER_NAME_SQL}, m.content, m.timestamp, hit.snippet
+        FROM (
+            SELECT f.rowid AS rid, bm25(messages_fts, 4.0, 1.0) AS score,
+                   snippet(messages_fts, 0, '[', ']', '…', 12) AS snippet
+            FROM messages_fts f JOIN messages m ON m.rowid = f.rowid
+            WHERE messages_fts MATCH ? {scope}
+            ORDER BY f.rowid DESC LIMIT ?
+        ) hit
+        JOIN messages m ON m.rowid = hit.rid
+        {NAME_JOINS_SQL}
+        ORDER BY hit.score, hit.rid DESC
+        LIMIT ? OFFSET ?
+        """
+        params = (query, *((peer, peer) if peer else ()), window, limit + 1, offset)
+        rows = [tuple(r) for r in conn.execute(sql, params).fetchall()]
+        if len(rows) > limit:
+            return rows[:limit], offset + limit
+        return rows, None
+
+    @_on_reader
+    def get_neighbors(self, conn):
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
         cursor.execute("""
             SELECT peer_id, username, ip, port, last_seen, status
             FROM neighbor
@@ -140,22 +553,27 @@ class ChatDatabase:
         """Return a neighbor dict for given peer_id or None if not found."""
         if not peer_id:
             return None
-        self.conn.row_factory = sqlite3.Row
-        cur = self.conn.cursor()
+        return self._get_neighbor(peer_id)
+
+    @_on_reader
+    def _get_neighbor(self, conn, peer_id):
+        cur = conn.cursor()
+        cur.row_factory = sqlite3.Row
         cur.execute("SELECT peer_id, username, ip, port, last_seen, status FROM neighbor WHERE peer_id = ?", (peer_id,))
         row = cur.fetchone()
         if row:
             return dict(row)
         return None
 
-    def get_broadcasts(self):
+    @_on_reader
+    def get_broadcasts(self, conn):
         """Return broadcast messages (receiver empty string) ordered by timestamp."""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT id, sender, sender_name, receiver, receiver_name, content, timestamp, is_sent
-            FROM messages
-            WHERE receiver = '' OR receiver IS NULL
-            ORDER BY timestamp
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT m.id, m.sender, {SENDER_NAME_SQL}, m.receiver, {RECEIVER_NAME_SQL}, m.content, m.timestamp, m.is_sent
+            FROM messages m {NAME_JOINS_SQL}
+            WHERE m.receiver = '' OR m.receiver IS NULL
+            ORDER BY m.timestamp, m.rowid
         """)
         return cursor.fetchall()
 
@@ -164,59 +582,107 @@ class ChatDatabase:
         short peer id if username not found."""
         if not peer_id:
             return ""
-        cur = self.conn.cursor()
         try:
-            cur.execute("SELECT username FROM neighbor WHERE peer_id = ?", (peer_id,))
-            row = cur.fetchone()
+            row = self._get_username(peer_id)
             if row and row[0]:
                 return row[0]
         except Exception:
             pass
         return peer_id[:8]
 
-    def upsert_neighbor(self, peer_id: str, username: str, ip: str, port: int, status: int = 1):
+    @_on_reader
+    def _get_username(self, conn, peer_id):
+        return conn.execute("SELECT username FROM neighbor WHERE peer_id = ?", (peer_id,)).fetchone()
+
+    @_on_writer
+    def upsert_neighbor(self, conn, peer_id: str, username: str, ip: str, port: int, status: int = 1):
         """Insert or update a neighbor by peer_id.
         If the neighbor exists, update fields and last_seen; otherwise insert.
+        Message history is not touched: names are resolved at read time.
         """
         try:
-            cur = self.conn.execute("SELECT COUNT(1) FROM neighbor WHERE peer_id = ?", (peer_id,))
-            exists = cur.fetchone()[0] > 0
-
-            if exists:
-                self.conn.execute(
-                    """
-                    UPDATE neighbor
-                    SET username = ?, ip = ?, port = ?, status = ?, last_seen = CURRENT_TIMESTAMP
-                    WHERE peer_id = ?
-                    """,
-                    (username, ip, port, status, peer_id)
-                )
-            else:
-                self.conn.execute(
-                    """
-                    INSERT INTO neighbor (peer_id, username, ip, port, status)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (peer_id, username, ip, port, status)
-                )
-            self.conn.commit()
-
-            # Propagate username into existing messages so stored history displays names
-            try:
-                # Update messages where this peer is the sender
-                self.conn.execute(
-                    "UPDATE messages SET sender_name = ? WHERE sender = ?",
-                    (username, peer_id)
-                )
-                # Update messages where this peer is the receiver
-                self.conn.execute(
-                    "UPDATE messages SET receiver_name = ? WHERE receiver = ?",
-                    (username, peer_id)
-                )
-                self.conn.commit()
-            except Exception:
-                # Non-fatal: don't let propagation failures crash caller
-                pass
+            # peer_id is unique (schema v2), so this is a single statement
+            conn.execute(
+                """
+                INSERT INTO neighbor (peer_id, username, ip, port, status)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(peer_id) DO UPDATE SET
+                    username = excluded.username, ip = excluded.ip, port = excluded.port,
+                    status = excluded.status, last_seen = CURRENT_TIMESTAMP
+                """,
+                (peer_id, username, ip, port, status)
+            )
+            conn.commit()
         except Exception:
             # Keep DB errors from crashing the app; caller can decide next steps
-            pass
\ No newline at end of file
+            conn.rollback()
+
+    @_on_writer
+    def set_neighbor_status(self, conn, peer_id: str, status: int):
+        """Mark a known neighbor online (1) / offline (0); True if it exists."""
+        cur = conn.execute(
+            "UPDATE neighbor SET status = ?, last_seen = CURRENT_TIMESTAMP WHERE peer_id = ?",
+            (status, peer_id),
+        )
+        conn.commit()
+        return cur.rowcount > 0
+
+    # ---------- outbox ----------
+    # The Outbox keeps the queue in memory and writes each change here through
+    # ChatDatabase.submit, in order on the writer thread.
+    @_on_writer
+    def outbox_add(self, conn, message_id, dest, frame, created=None):
+        """Queue a frame for dest; return its seq, or None if the id is already queued."""
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO outbox (id, dest, frame, created) VALUES (?, ?, ?, ?)",
+            (message_id, dest, sqlite3.Binary(frame), time.time() if created is None else created),
+        )
+        conn.commit()
+        return cur.lastrowid if cur.rowcount else None
+
+    @_on_writer
+    def outbox_remove(self, conn, message_id):
+        """Delete a queued frame; return the dest it was queued for, or None."""
+        row = conn.execute("SELECT dest FROM outbox WHERE id = ?", (message_id,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+        conn.commit()
+        return row[0]
+
+    @_on_reader
+    def outbox_rows(self, conn) -> list:
+        """Every queued (seq, id, dest, frame, created), oldest first."""
+        rows = conn.execute("SELECT seq, id, dest, frame, created FROM outbox ORDER BY seq").fetchall()
+        return [(seq, mid, dest, bytes(frame), created) for seq, mid, dest, frame, created in rows]
+
+    @_on_writer
+    def outbox_expire(self, conn, older_than) -> int:
+        """Drop frames (and unsealed messages) queued before `older_than`
+        (time.time()); return how many."""
+        cur = conn.execute("DELETE FROM outbox WHERE created < ?", (older_than,))
+        expired = cur.rowcount
+        cur = conn.execute("DELETE FROM outbox_unsealed WHERE created < ?", (older_than,))
+        conn.commit()
+        return expired + cur.rowcount
+
+    @_on_writer
+    def outbox_hold(self, conn, message_id, dest, content, created=None) -> bool:
+        """Keep a message for dest until it can be sealed; False if already held."""
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO outbox_unsealed (id, dest, content, created) VALUES (?, ?, ?, ?)",
+            (message_id, dest, content, time.time() if created is None else created),
+        )
+        conn.commit()
+        return cur.rowcount > 0
+
+    @_on_reader
+    def outbox_held(self, conn) -> list:
+        """Every (dest, id, content, created) waiting to be sealed, oldest first."""
+        return conn.execute("SELECT dest, id, content, created FROM outbox_unsealed ORDER BY seq").fetchall()
+
+    @_on_writer
+    def outbox_release(self, conn, message_id):
+        """Forget a held message (it was sealed and queued in `outbox`)."""
+        conn.execute("DELETE FROM outbox_unsealed WHERE id = ?", (message_id,))
+        conn.commit()
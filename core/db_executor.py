@@ -0,0 +1,166 @@
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+_STOP = object()
+
+
+def _done_future(result=None) -> Future:
+    fut = Future()
+    fut.set_result(result)
+    return fut
+
+
+class DBExecutor:
+    """Dedicated threads for one SQLite file: a single writer and a read pool.
+
+    All writes run on one writer thread, in submission order, on the only
+    read-write connection. Reads run on a pool of `readers` threads, each
+    with its own read-only connection; in WAL mode a reader sees the last
+    commit and never waits for, or holds up, the writer.
+
+    `submit_write` / `submit_read` return a concurrent.futures.Future
+    (`asyncio.wrap_future` turns it into an awaitable). A read waits for the
+    writes submitted before it, so callers always see their own writes.
+    `write` / `read` are the blocking forms; called from the executor's own
+    threads they run inline instead of queueing behind themselves.
+
+    `tick(conn)` runs on the writer thread every `tick_interval` seconds
+    (ChatDatabase flushes its write-behind queue there).
+    """
+
+    def __init__(self, path, readers=2, setup=None, tick=None, tick_interval=None, name="peerchat-db"):
+        self.path = path
+        self._setup = setup
+        self._tick = tick
+        self._tick_interval = tick_interval
+        # owned by the writer thread; check_same_thread=False only so close()
+        # (and tests peeking at the file) may use it once the writer is idle
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if setup is not None:
+            setup(self.conn)
+
+        self._tasks = queue.SimpleQueue()
+        self._last_write = _done_future()
+        self._submit_lock = threading.Lock()
+        self._local = threading.local()
+        self._reader_conns = []
+        self._closed = False
+
+        self._writer = threading.Thread(target=self._write_loop, name=f"{name}-writer", daemon=True)
+        self._writer.start()
+        self._pool = ThreadPoolExecutor(max_workers=readers, thread_name_prefix=f"{name}-read")
+
+    # ---------- submitting ----------
+    def submit_write(self, fn, *args, **kwargs) -> Future:
+        """Run fn(conn, *args, **kwargs) on the writer thread."""
+        fut = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("database is closed")
+            self._last_write = fut
+            self._tasks.put((fut, fn, args, kwargs))
+        return fut
+
+    def submit_read(self, fn, *args, **kwargs) -> Future:
+        """Run fn(conn, *args, **kwargs) on a reader, after earlier writes commit."""
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("database is closed")
+            barrier = self._last_write
+            return self._pool.submit(self._run_read, barrier, fn, args, kwargs)
+
+    def write(self, fn, *args, **kwargs):
+        if self.on_writer():
+            return fn(self.conn, *args, **kwargs)
+        return self.submit_write(fn, *args, **kwargs).result()
+
+    def read(self, fn, *args, **kwargs):
+        if self.on_writer():
+            return fn(self.conn, *args, **kwargs)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return fn(conn, *args, **kwargs)
+        return self.submit_read(fn, *args, **kwargs).result()
+
+    def on_writer(self) -> bool:
+        return threading.current_thread() is self._writer
+
+    def on_executor(self) -> bool:
+        """True on the writer or a reader thread (where blocking calls run inline)."""
+        return self.on_writer() or getattr(self._local, "conn", None) is not None
+
+    def close(self, timeout=5.0):
+        """Finish queued writes, stop the threads and close every connection."""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._tasks.put(_STOP)
+        self._writer.join(timeout)
+        self._pool.shutdown(wait=True)
+        for conn in self._reader_conns:
+            conn.close()
+        self._reader_conns.clear()
+        self.conn.close()
+
+    # ---------- threads ----------
+    def _write_loop(self):
+        next_tick = time.monotonic() + (self._tick_interval or 0)
+        while True:
+            timeout = None
+            if self._tick is not None:
+                timeout = max(0.0, next_tick - time.monotonic())
+            try:
+                item = self._tasks.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            if item is not None:
+                self._run_write(*item)
+            if self._tick is not None and time.monotonic() >= next_tick:
+                try:
+                    self._tick(self.conn)
+                except Exception as e:
+                    log.error("db writer tick failed: %s", e)
+                next_tick = time.monotonic() + self._tick_interval
+
+    def _run_write(self, fut, fn, args, kwargs):
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(self.conn, *args, **kwargs)
+        except BaseException as e:
+            # never leave a half-done transaction for the next task
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            fut.set_exception(e)
+        else:
+            fut.set_result(result)
+
+    def _run_read(self, barrier, fn, args, kwargs):
+        if not barrier.done():
+            try:
+                barrier.result()
+            except Exception:
+                pass        # the failed write has reported to its own caller
+        return fn(self._reader(), *args, **kwargs)
+
+    def _reader(self):
+        """This pool thread's read-only connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            uri = pathlib.Path(self.path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            with self._submit_lock:
+                self._reader_conns.append(conn)
+        return conn
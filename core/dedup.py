@@ -0,0 +1,111 @@
+import time
+from collections import deque
+
+
+class SeenCache:
+    """Bounded, time-expiring set of message ids for loop suppression.
+
+    Ids are kept in `buckets` generations. A new generation starts every
+    ttl / buckets seconds, or earlier once the current one holds
+    capacity / buckets ids; starting one drops the oldest generation whole.
+    So without capacity pressure an id is remembered for between
+    ttl * (buckets - 1) / buckets and ttl seconds, and memory never exceeds
+    `capacity` ids however long the node runs.
+
+    Only the 64-bit hash of each id is stored, not the string itself. Two
+    different ids collide with probability len(cache) / 2**64 per lookup
+    (about 5e-14 at 1M entries). That is the false-positive budget: the rare
+    collision drops one message as a duplicate.
+    """
+
+    def __init__(self, capacity=100_000, ttl=600.0, buckets=4, clock=time.monotonic):
+        if capacity < buckets:
+            raise ValueError("capacity must be at least the number of buckets")
+        self.capacity = capacity
+        self.ttl = ttl
+        self.buckets = buckets
+        self._clock = clock
+        self._slice = ttl / buckets
+        self._bucket_capacity = capacity // buckets
+
+        self._generations = deque([set()])   # oldest ... newest
+        self._started = clock()
+        self._size = 0
+
+        self.hits = 0          # duplicates suppressed
+        self.misses = 0        # first sightings
+        self.evictions = 0     # ids forgotten (expired or pushed out)
+
+    def seen(self, msg_id) -> bool:
+        """Record msg_id; return True if it was already seen (a duplicate)."""
+        self._expire()
+        key = hash(msg_id)
+        for gen in self._generations:
+            if key in gen:
+                self.hits += 1
+                return True
+        self.misses += 1
+        self._insert(key)
+        return False
+
+    def add(self, msg_id):
+        self._expire()
+        key = hash(msg_id)
+        if not any(key in gen for gen in self._generations):
+            self._insert(key)
+
+    def discard(self, msg_id):
+        """Forget msg_id, so its next copy is taken as new."""
+        key = hash(msg_id)
+        for gen in self._generations:
+            if key in gen:
+                gen.discard(key)
+                self._size -= 1
+                return
+
+    def __contains__(self, msg_id):
+        self._expire()
+        key = hash(msg_id)
+        return any(key in gen for gen in self._generations)
+
+    def __len__(self):
+        return self._size
+
+    def stats(self) -> dict:
+        return {
+            "size": self._size,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    # ---------- internals ----------
+    def _insert(self, key):
+        newest = self._generations[-1]
+        if len(newest) >= self._bucket_capacity:
+            self._rotate()
+            self._started = self._clock()    # the new generation gets a full slice
+            newest = self._generations[-1]
+        newest.add(key)
+        self._size += 1
+
+    def _expire(self):
+        elapsed = self._clock() - self._started
+        if elapsed < self._slice:
+            return
+        # Several slices may have passed while idle; never rotate more than
+        # a full cycle, that already empties the cache.
+        steps = int(elapsed // self._slice)
+        for _ in range(min(steps, self.buckets)):
+            self._rotate()
+        # advance by whole slices: rotations stay on schedule however late
+        # the lookup that noticed them came
+        self._started += steps * self._slice
+
+    def _rotate(self):
+        self._generations.append(set())
+        while len(self._generations) > self.buckets:
+            old = self._generations.popleft()
+            self._size -= len(old)
+            self.evictions += len(old)
@@ -0,0 +1,152 @@
+import random
+import time
+from collections import OrderedDict
+
+
+DESCRIPTOR_FIELDS = ("peer_id", "username", "ip", "port")
+
+
+def make_descriptor(peer) -> dict:
+    """Wire form of a peer: id, name and endpoint, or None if unusable."""
+    if not isinstance(peer, dict):
+        return None
+    peer_id = peer.get("peer_id")
+    ip = peer.get("ip")
+    try:
+        port = int(peer.get("port") or 0)
+    except (TypeError, ValueError):
+        return None
+    if not peer_id or not ip or ip == "0.0.0.0" or port <= 0:
+        return None
+    return {
+        "peer_id": peer_id,
+        "username": peer.get("username") or peer_id[:8],
+        "ip": ip,
+        "port": port,
+    }
+
+
+class PeerSampler:
+    """Gossip peer sampling with a bounded partial view (Cyclon-style shuffle).
+
+    Every round a node picks `fanout` random direct neighbours and sends each
+    a sample of at most `shuffle_len` descriptors from its partial view plus
+    itself; the neighbour answers with a sample of its own and both merge.
+    Frames never leave the link they were sent on, so a node's discovery
+    cost per round is about 2 * fanout frames of bounded size, however large
+    the mesh. Descriptors still spread mesh-wide, one hop per round.
+
+    The partial view holds at most `view_size` descriptors with an age in
+    rounds. Merging keeps the younger copy of a peer; when the view is full,
+    incoming peers first replace the ones we just sent away, then older ones.
+
+    Everything ever merged also lands in the membership view (`members`): the
+    deduplicated list shown as discovered peers. It holds at most `capacity`
+    peers, least recently heard of first out, and forgets a peer nobody has
+    mentioned for `member_ttl` seconds.
+    """
+
+    def __init__(self, me, view_size=20, shuffle_len=8, fanout=2, capacity=1000,
+                 member_ttl=600.0, rng=None, clock=time.monotonic):
+        self.me = make_descriptor(me) or {"peer_id": me.get("peer_id")}
+        self.view_size = view_size
+        self.shuffle_len = max(1, shuffle_len)
+        self.fanout = fanout
+        self.capacity = capacity
+        self.member_ttl = member_ttl
+        self._rng = rng if rng is not None else random.Random()
+        self._clock = clock
+
+        self.view = {}                   # peer_id -> descriptor + "age"
+        self.members = OrderedDict()     # peer_id -> descriptor, least recently heard first
+        self._heard = {}                 # peer_id -> clock() when last mentioned
+        self._sent = {}                  # neighbour -> ids offered in our open request
+
+        self.rounds = 0
+
+    # ---------- rounds ----------
+    def start_round(self, neighbours) -> list:
+        """Age the view and pick this round's gossip partners."""
+        self.rounds += 1
+        for entry in self.view.values():
+            entry["age"] += 1
+        self.expire()
+        neighbours = list(neighbours)
+        return self._rng.sample(neighbours, min(self.fanout, len(neighbours)))
+
+    def sample_for(self, peer_id) -> list:
+        """Part of the view to send `peer_id` (the caller adds our own descriptor)."""
+        candidates = [e for pid, e in self.view.items() if pid != peer_id]
+        picked = self._rng.sample(candidates, min(self.shuffle_len - 1, len(candidates)))
+        self._sent[peer_id] = {e["peer_id"] for e in picked}
+        return [dict(e) for e in picked]
+
+    def merge(self, descriptors, from_peer=None) -> bool:
+        """Fold a received sample into both views; True if new peers were learned."""
+        sent = self._sent.pop(from_peer, set()) if from_peer is not None else set()
+        learned = False
+        now = self._clock()
+        for raw in descriptors or ():
+            d = make_descriptor(raw)
+            if d is None or d["peer_id"] == self.me.get("peer_id"):
+                continue
+            try:
+                age = max(0, int(raw.get("age", 0)))
+            except (TypeError, ValueError):
+                age = 0
+            learned |= self._remember(d, now)
+            self._offer(d, age, sent)
+        return learned
+
+    def forget(self, peer_id):
+        self.view.pop(peer_id, None)
+        self.members.pop(peer_id, None)
+        self._heard.pop(peer_id, None)
+        self._sent.pop(peer_id, None)
+
+    def expire(self):
+        limit = self._clock() - self.member_ttl
+        while self.members:
+            peer_id = next(iter(self.members))
+            if self._heard.get(peer_id, 0) >= limit:
+                break
+            self.members.popitem(last=False)
+            self._heard.pop(peer_id, None)
+            self.view.pop(peer_id, None)
+
+    def member_list(self) -> list:
+        return [dict(d) for d in self.members.values()]
+
+    def stats(self) -> dict:
+        return {"rounds": self.rounds, "view": len(self.view), "members": len(self.members)}
+
+    # ---------- internals ----------
+    def _remember(self, d, now) -> bool:
+        peer_id = d["peer_id"]
+        is_new = peer_id not in self.members
+        self.members[peer_id] = d
+        self.members.move_to_end(peer_id)
+        self._heard[peer_id] = now
+        while len(self.members) > self.capacity:
+            old, _ = self.members.popitem(last=False)
+            self._heard.pop(old, None)
+            self.view.pop(old, None)
+        return is_new
+
+    def _offer(self, d, age, sent):
+        peer_id = d["peer_id"]
+        current = self.view.get(peer_id)
+        if current is not None:
+            if age < current["age"]:
+                self.view[peer_id] = dict(d, age=age)
+            return
+        if len(self.view) >= self.view_size:
+            victim = next((pid for pid in sent if pid in self.view), None)
+            if victim is not None:
+                sent.discard(victim)
+            else:
+                victim = max(self.view, key=lambda pid: self.view[pid]["age"])
+                if self.view[victim]["age"] <= age:
+                    return
+            del self.view[victim]
+        self.view[peer_id] = dict(d, age=age)
@@ -0,0 +1,122 @@
+import time
+
+
+class _Estimator:
+    """Smoothed RTT and retransmit timeout for one destination (RFC 6298)."""
+
+    def __init__(self, initial_rto):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+
+    def sample(self, rtt, min_rto, max_rto):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max_rto, max(min_rto, self.srtt + 4 * self.rttvar))
+
+
+class InflightTable:
+    """Direct messages sent but not yet acknowledged.
+
+    Every ACK yields a delivery time (first send -> ACK). Only frames sent
+    exactly once give an RTT sample (Karn's rule: an ACK after a retransmit
+    cannot tell which copy it answers), which feeds a per-destination
+    smoothed RTT and timeout: srtt + 4 * rttvar, kept within
+    [min_rto, max_rto].
+
+    A frame not acknowledged within its timeout is reported by `expired()`
+    for retransmission, with the timeout doubled on every attempt. After
+    `max_attempts` sends it is given up here; it stays in the outbox and
+    goes out again when a link to its destination comes back.
+    """
+
+    def __init__(self, initial_rto=3.0, min_rto=0.5, max_rto=30.0, max_attempts=5, clock=time.monotonic):
+        self.initial_rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._entries = {}       # msg_id -> [dest, seq, first_sent, last_sent, attempts]
+        self._estimators = {}    # dest -> _Estimator
+
+        self.timeouts = 0
+        self.given_up = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, msg_id):
+        return msg_id in self._entries
+
+    def sent(self, dest, msg_id, seq):
+        """Record a (re)transmission of msg_id."""
+        now = self._clock()
+        entry = self._entries.get(msg_id)
+        if entry is None:
+            self._entries[msg_id] = [dest, seq, now, now, 1]
+        else:
+            entry[3] = now
+            entry[4] += 1
+
+    def acked(self, msg_id):
+        """Return (dest, rtt or None, delivery seconds), or None if not in flight."""
+        entry = self._entries.pop(msg_id, None)
+        if entry is None:
+            return None
+        dest, _, first_sent, last_sent, attempts = entry
+        now = self._clock()
+        rtt = None
+        if attempts == 1:
+            rtt = now - last_sent
+            self._estimator(dest).sample(rtt, self.min_rto, self.max_rto)
+        return dest, rtt, now - first_sent
+
+    def expired(self) -> list:
+        """(dest, msg_id, seq) of frames whose timeout ran out, oldest first."""
+        now = self._clock()
+        due = []
+        for msg_id, (dest, seq, _, last_sent, attempts) in list(self._entries.items()):
+            # same sum as next_deadline(): a timer armed for that moment
+            # must find the frame due, however the floats round
+            if last_sent + self.timeout(dest, attempts) > now:
+                continue
+            self.timeouts += 1
+            if attempts >= self.max_attempts:
+                del self._entries[msg_id]
+                self.given_up += 1
+                continue
+            due.append((dest, msg_id, seq))
+        return due
+
+    def next_deadline(self):
+        """Seconds until the earliest timeout (None when nothing is in flight)."""
+        if not self._entries:
+            return None
+        now = self._clock()
+        return max(0.0, min(
+            last_sent + self.timeout(dest, attempts) - now
+            for dest, _, _, last_sent, attempts in self._entries.values()
+        ))
+
+    def timeout(self, dest, attempts=1) -> float:
+        est = self._estimators.get(dest)
+        rto = est.rto if est is not None else self.initial_rto
+        return min(self.max_rto, rto * (2 ** (attempts - 1)))
+
+    def forget(self, msg_id):
+        self._entries.pop(msg_id, None)
+
+    def rtt(self, dest):
+        """Smoothed RTT to dest in seconds, or None before the first sample."""
+        est = self._estimators.get(dest)
+        return est.srtt if est is not None else None
+
+    def _estimator(self, dest) -> _Estimator:
+        est = self._estimators.get(dest)
+        if est is None:
+            est = self._estimators[dest] = _Estimator(self.initial_rto)
+        return est
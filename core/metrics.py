@@ -0,0 +1,328 @@
+"""In-process metrics: counters, gauges and histograms for one node.
+
+    registry = MetricsRegistry()
+    received = registry.counter("peerchat_messages_in_total", "Frames received", ("type",))
+    received.labels("MESSAGE").inc()
+
+    latency = registry.histogram("peerchat_decode_seconds", "decode_message latency")
+    latency.observe(0.00012)
+
+    registry.gauge("peerchat_seen_cache_size", "Ids in the dedup cache", fn=lambda: len(cache))
+
+Values that already live somewhere else (queue depths, cache sizes, link
+counters) are read by a `fn` at collection time instead of being updated
+on the hot path. `fn` returns a number, or for labelled metrics a dict of
+{label value tuple: number}.
+
+Updates are plain attribute arithmetic with no locking. Each metric is meant
+to be updated from one thread (the network/UI thread, or the DB flusher);
+readers may see a value one update behind.
+
+`render()` produces the Prometheus text format, `snapshot()` a plain dict;
+MetricsServer serves both over HTTP (/metrics and /metrics.json).
+"""
+import json
+import math
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# seconds; spans a fast in-memory step (tens of us) up to a slow disk flush
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0,
+)
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _GaugeValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last slot: above the largest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return math.inf
+
+
+class _Timer:
+    __slots__ = ("_hist", "_start")
+
+    def __init__(self, hist):
+        self._hist = hist
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._start)
+        return False
+
+
+class Metric:
+    """A named metric; with labelnames, one child value per label combination."""
+
+    kind = ""
+    _value_type = None
+
+    def __init__(self, name, help="", labelnames=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self._children = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_value()
+
+    def _new_value(self):
+        return self._value_type()
+
+    def labels(self, *values):
+        """Child for these label values (created on first use)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_value()
+        return child
+
+    def samples(self):
+        """[(label values, value object or number)] at this moment."""
+        if self.fn is None:
+            return list(self._children.items())
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [(k if isinstance(k, tuple) else (k,), v) for k, v in value.items()]
+        return [((), value)]
+
+
+class Counter(Metric):
+    kind = "counter"
+    _value_type = _CounterValue
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+    _value_type = _GaugeValue
+
+    def set(self, value):
+        self._default.value = value
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+    def dec(self, amount=1):
+        self._default.value -= amount
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help="", labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return _Timer(self._default)
+
+
+class MetricsRegistry:
+    """Named metrics of one node; asking twice for a name returns the same metric."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help="", labelnames=(), fn=None) -> Counter:
+        return self._get(Counter, name, help=help, labelnames=labelnames, fn=fn)
+
+    def gauge(self, name, help="", labelnames=(), fn=None) -> Gauge:
+        return self._get(Gauge, name, help=help, labelnames=labelnames, fn=fn)
+
+    def histogram(self, name, help="", labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help=help, labelnames=labelnames, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def _get(self, cls, name, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    # ---------- export ----------
+    def snapshot(self) -> dict:
+        """{name: value}; labelled metrics map "k=v,..." to values.
+
+        Histograms become {"count", "sum", "p50", "p90", "p99"}, the
+        quantiles being bucket upper bounds.
+        """
+        out = {}
+        for metric in list(self._metrics.values()):
+            values = {}
+            for labels, value in metric.samples():
+                key = ",".join(f"{k}={v}" for k, v in zip(metric.labelnames, labels))
+                values[key] = _plain(value)
+            out[metric.name] = values.get("", 0) if not metric.labelnames else values
+        return out
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, value in metric.samples():
+                pairs = [f'{k}="{_escape(v)}"' for k, v in zip(metric.labelnames, labels)]
+                if isinstance(value, _HistogramValue):
+                    cumulative = 0
+                    for bound, n in zip(value.bounds + (math.inf,), value.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == math.inf else repr(bound)
+                        bucket_pairs = pairs + [f'le="{le}"']
+                        lines.append(f"{metric.name}_bucket{_labels(bucket_pairs)} {cumulative}")
+                    lines.append(f"{metric.name}_sum{_labels(pairs)} {value.sum!r}")
+                    lines.append(f"{metric.name}_count{_labels(pairs)} {value.count}")
+                else:
+                    lines.append(f"{metric.name}{_labels(pairs)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _plain(value):
+    if isinstance(value, _HistogramValue):
+        return {
+            "count": value.count,
+            "sum": value.sum,
+            "p50": value.quantile(0.5),
+            "p90": value.quantile(0.9),
+            "p99": value.quantile(0.99),
+        }
+    return getattr(value, "value", value)
+
+
+def _number(value):
+    return repr(getattr(value, "value", value))
+
+
+def _labels(pairs):
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# ---------- HTTP endpoint ----------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.registry.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(self.registry.snapshot(), default=str).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """Serve a registry on http://host:port/metrics from a daemon thread.
+
+    Binds to localhost by default: the numbers include peer ids.
+    """
+
+    def __init__(self, registry, host="127.0.0.1", port=0):
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="peerchat-metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join(5)
+            self._thread = None
+        self._server.server_close()
@@ -0,0 +1,316 @@
+import time
+from collections import OrderedDict
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+class _Queue:
+    """One destination's state: queued frames, send cursor, token bucket."""
+
+    def __init__(self, tokens, now):
+        self.frames = OrderedDict()  # msg_id -> (seq, frame, queued at), oldest first
+        self.relayed = OrderedDict() # msg_ids held for a neighbour, oldest first
+        self.cursor = 0              # highest seq sent in this pass
+        self.high_water = 0          # highest seq ever sent
+        self.tokens = tokens
+        self.stamp = now
+
+
+class Outbox:
+    """Persistent per-destination store-and-forward queue.
+
+    Direct messages are queued here as encoded frames before they are sent
+    and stay until the receiver answers with an ACK. The queue lives in
+    memory and is the authority; every change is written through to the
+    `outbox` table of ChatDatabase in the background (ChatDatabase.submit),
+    so sending, draining and ACKs never wait for SQLite. `load()` reads the
+    table back once at startup.
+
+    Sending walks a cursor through the queue. `rewind()` moves it back to the
+    start so every unacknowledged frame goes out again when a link comes
+    back; single lost frames are re-sent by `frame()` lookup (see
+    core/inflight.py). `next_attempt()` numbers every send of a frame so a
+    re-send is not taken for a duplicate by relays on the way.
+    Each destination has a token bucket (`rate` frames/s, `burst` at most),
+    so a long backlog catches up quickly without flooding one link.
+
+    End-to-end messages are held as text (`hold()`, table `outbox_unsealed`)
+    until the receiver ACKs them: `unsealed()` lists those still waiting for
+    a session, `mark_sealed()` claims one before its sealed frame is put(),
+    and `reseal()` takes the frame back when the receiver could not open it
+    (it lost the session, e.g. by restarting).
+
+    A relay holding a frame for a neighbour that is reconnecting queues it
+    with `put(..., relayed=True)`: it is kept in memory only (the sender's
+    own outbox has the message until its ACK) and at most `relay_cap` are
+    held per destination, the oldest dropped first.
+
+    Frames and held messages older than `max_age` seconds are dropped by
+    `expire()` (ChatManager runs it on a timer) and before a batch is sent.
+    """
+
+    def __init__(self, db, rate=200.0, burst=50, max_age=86400.0, relay_cap=1000,
+                 clock=time.monotonic):
+        self.db = db
+        self.rate = rate
+        self.burst = burst
+        self.max_age = max_age
+        self.relay_cap = relay_cap
+        self._clock = clock
+        self._queues = {}          # dest -> _Queue
+        self._index = {}           # msg_id -> dest, for every queued frame
+        self._seq = 0              # last seq handed out (queue order)
+        self._attempts = {}        # msg_id -> sends so far (this run)
+        self._carried_seq = 0      # frames up to here were queued by a previous run
+        self._held = {}            # dest -> OrderedDict msg_id -> (text, held at) of E2E messages
+        self._sealed = set()       # held msg_ids whose sealed frame is queued
+
+        self.acked = 0
+        self.resent = 0
+        self.expired = 0
+        self.dropped = 0           # relayed frames over relay_cap
+
+    def load(self):
+        """Pick up frames queued by a previous run (blocking: once at startup)."""
+        if self.max_age:
+            self.expired += self.db.outbox_expire(time.time() - self.max_age)
+        # created is wall-clock time; queue ages run on self._clock
+        now, wall = self._clock(), time.time()
+        for _, msg_id, dest, frame, created in self.db.outbox_rows():
+            self._add(dest, msg_id, frame, now - max(0.0, wall - created))
+        self._carried_seq = self._seq
+        for dest, msg_id, text, created in self.db.outbox_held():
+            self._held.setdefault(dest, OrderedDict())[msg_id] = (text, now - max(0.0, wall - created))
+            if msg_id in self._index:
+                self._sealed.add(msg_id)
+
+    # ---------- queue ----------
+    def put(self, dest, msg_id, frame, relayed=False) -> bool:
+        """Queue a frame; False if msg_id is already queued.
+
+        relayed: held for a neighbour on someone else's behalf (memory only,
+        capped at relay_cap per destination).
+        """
+        if msg_id in self._index:
+            return False
+        q = self._add(dest, msg_id, frame, self._clock())
+        if not relayed:
+            self._persist(self.db.outbox_add, msg_id, dest, frame)
+            return True
+        q.relayed[msg_id] = None
+        if len(q.relayed) > self.relay_cap:
+            oldest = next(iter(q.relayed))
+            self._drop(oldest)
+            self.dropped += 1
+            log.warning("outbox: more than %d frames held for %s, dropped %s", self.relay_cap, dest, oldest)
+        return True
+
+    def ack(self, msg_id) -> bool:
+        """The receiver has the message: drop it for good."""
+        dest = self._drop(msg_id)
+        if dest is None:
+            return False    # not ours: relayed, or acknowledged already
+        self._attempts.pop(msg_id, None)
+        self._release(dest, msg_id)
+        self.acked += 1
+        return True
+
+    # ---------- end-to-end messages ----------
+    def hold(self, dest, msg_id, text) -> bool:
+        """Keep an E2E message's text until it is acknowledged; False if already held."""
+        held = self._held.setdefault(dest, OrderedDict())
+        if msg_id in held:
+            return False
+        held[msg_id] = (text, self._clock())
+        self._persist(self.db.outbox_hold, msg_id, dest, text)
+        return True
+
+    def unsealed(self, dest) -> list:
+        """(msg_id, text) held for dest and not sealed yet, oldest first."""
+        return [(msg_id, text) for msg_id, (text, _) in self._held.get(dest, {}).items()
+                if msg_id not in self._sealed]
+
+    def unsealed_destinations(self) -> list:
+        return [dest for dest in self._held if self.unsealed(dest)]
+
+    def mark_sealed(self, dest, msg_id) -> bool:
+        """Claim a held message for sealing; False if it is not waiting."""
+        if msg_id in self._sealed or msg_id not in self._held.get(dest, {}):
+            return False
+        self._sealed.add(msg_id)
+        return True
+
+    def reseal(self, msg_id) -> bool:
+        """Drop msg_id's sealed frame and wait for a session again.
+
+        False unless msg_id is a held message whose frame is queued.
+        """
+        if msg_id not in self._sealed:
+            return False
+        self._sealed.discard(msg_id)
+        self._drop(msg_id)
+        return True
+
+    def expire(self, dest=None) -> int:
+        """Drop frames and held messages older than max_age; return how many.
+
+        Queues are in arrival order, so only their heads are looked at.
+        """
+        if not self.max_age:
+            return 0
+        cutoff = self._clock() - self.max_age
+        count = 0
+        for d in [dest] if dest is not None else list(set(self._queues) | set(self._held)):
+            q = self._queues.get(d)
+            while q is not None and q.frames:
+                msg_id, (_, _, queued) = next(iter(q.frames.items()))
+                if queued > cutoff:
+                    break
+                self._drop(msg_id)
+                self._attempts.pop(msg_id, None)
+                self._release(d, msg_id)
+                count += 1
+                q = self._queues.get(d)
+            # a sealed message goes with its frame (above)
+            for msg_id, (_, held_at) in list(self._held.get(d, {}).items()):
+                if held_at > cutoff:
+                    break
+                if msg_id not in self._sealed:
+                    self._release(d, msg_id)
+                    count += 1
+        if count:
+            self.expired += count
+            log.info("outbox: dropped %d message(s) older than %ss", count, self.max_age)
+        return count
+
+    def pending(self, dest=None) -> int:
+        if dest is not None:
+            q = self._queues.get(dest)
+            return len(q.frames) if q is not None else 0
+        return sum(len(q.frames) for q in self._queues.values())
+
+    def destinations(self) -> list:
+        return list(self._queues)
+
+    # ---------- sending ----------
+    def next_batch(self, dest, limit) -> list:
+        """Up to `limit` unsent (seq, msg_id, frame), as the token bucket allows."""
+        self.expire(dest)
+        q = self._queues.get(dest)
+        if q is None:
+            return []
+        self._refill_tokens(q)
+        limit = min(limit, int(q.tokens))
+        if limit <= 0:
+            return []
+        batch = []
+        for msg_id, (seq, frame, _) in q.frames.items():
+            if seq > q.cursor:
+                batch.append((seq, msg_id, frame))
+                if len(batch) >= limit:
+                    break
+        return batch
+
+    def mark_sent(self, dest, seq):
+        q = self._queues.get(dest)
+        if q is None:
+            return
+        q.cursor = max(q.cursor, seq)
+        if seq <= q.high_water:
+            self.resent += 1
+        q.high_water = max(q.high_water, seq)
+        q.tokens -= 1
+
+    def next_attempt(self, msg_id, seq) -> int:
+        """Count a send of msg_id and return its attempt: 0 for the first.
+
+        A frame queued by a previous run may have gone out already, so its
+        attempts this run start at 1.
+        """
+        attempt = self._attempts.get(msg_id, 1 if seq <= self._carried_seq else 0)
+        self._attempts[msg_id] = attempt + 1
+        return attempt
+
+    def has_unsent(self, dest) -> bool:
+        q = self._queues.get(dest)
+        if q is None:
+            return False
+        # frames are in seq order: only the newest can be past the cursor
+        return bool(q.frames) and next(reversed(q.frames.values()))[0] > q.cursor
+
+    def wait_time(self, dest) -> float:
+        """Seconds until the token bucket allows the next frame."""
+        q = self._queues.get(dest)
+        if q is None or q.tokens >= 1:
+            return 0.0
+        return (1 - q.tokens) / self.rate
+
+    def rewind(self, dest) -> bool:
+        """Send every unacknowledged frame again; True if there is any."""
+        q = self._queues.get(dest)
+        if q is None:
+            return False
+        q.cursor = 0
+        return True
+
+    def frame(self, msg_id):
+        """The queued frame for msg_id (None once acknowledged or expired)."""
+        dest = self._index.get(msg_id)
+        if dest is None:
+            return None
+        return self._queues[dest].frames[msg_id][1]
+
+    # ---------- internals ----------
+    def _add(self, dest, msg_id, frame, queued) -> _Queue:
+        self._seq += 1
+        q = self._queue(dest)
+        q.frames[msg_id] = (self._seq, frame, queued)
+        self._index[msg_id] = dest
+        return q
+
+    def _drop(self, msg_id):
+        """Take msg_id's frame out of its queue; return its dest, or None."""
+        dest = self._index.pop(msg_id, None)
+        if dest is None:
+            return None
+        q = self._queues[dest]
+        del q.frames[msg_id]
+        if msg_id in q.relayed:
+            del q.relayed[msg_id]     # never written to the table
+        else:
+            self._persist(self.db.outbox_remove, msg_id)
+        if not q.frames:
+            del self._queues[dest]
+        return dest
+
+    def _release(self, dest, msg_id):
+        """Delivered: forget the held text of an E2E message."""
+        held = self._held.get(dest)
+        if held is None or held.pop(msg_id, None) is None:
+            return
+        self._sealed.discard(msg_id)
+        if not held:
+            del self._held[dest]
+        self._persist(self.db.outbox_release, msg_id)
+
+    def _queue(self, dest) -> _Queue:
+        q = self._queues.get(dest)
+        if q is None:
+            q = self._queues[dest] = _Queue(self.burst, self._clock())
+        return q
+
+    def _refill_tokens(self, q):
+        now = self._clock()
+        q.tokens = min(self.burst, q.tokens + (now - q.stamp) * self.rate)
+        q.stamp = now
+
+    def _persist(self, fn, *args):
+        """Queue a DB write (in order, on the writer); failures are only logged."""
+        def done(future):
+            if future.exception() is not None:
+                log.error("%s(%s) failed: %s", fn.__name__, args[0], future.exception())
+        try:
+            self.db.submit(fn, *args).add_done_callback(done)
+        except Exception as e:
+            log.error("%s(%s) failed: %s", fn.__name__, args[0], e)
@@ -0,0 +1,134 @@
+import time
+from utils.events import Signal
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+PEER_FIELDS = ("peer_id", "username", "ip", "port", "last_seen", "status")
+
+
+def _now() -> str:
+    # same text SQLite stores for CURRENT_TIMESTAMP (UTC)
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+
+class PeerDirectory:
+    """In-memory neighbor table, indexed by peer_id and by (ip, port).
+
+    Loaded once from ChatDatabase.get_neighbors(); afterwards lookups are
+    dict hits and never touch SQLite. Changes are applied here first and
+    written through to the `neighbor` table in the background
+    (ChatDatabase.submit), so callers never wait for the DB writer.
+
+    `changed` emits (peer_id, peer) after a peer is added or its name,
+    endpoint or status changes. Lookups return copies: edit through
+    upsert()/set_status() so the indexes and the DB stay in step.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.changed = Signal()
+        self._by_id = {}          # peer_id -> record
+        self._by_endpoint = {}    # (ip, port) -> peer_id
+
+    def load(self):
+        """(Re)read the neighbor table: once at startup."""
+        self._by_id.clear()
+        self._by_endpoint.clear()
+        for row in self.db.get_neighbors():
+            self._index({k: row.get(k) for k in PEER_FIELDS})
+
+    # ---------- lookups ----------
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, peer_id):
+        return peer_id in self._by_id
+
+    def get(self, peer_id):
+        peer = self._by_id.get(peer_id)
+        return dict(peer) if peer is not None else None
+
+    def by_endpoint(self, ip, port):
+        """The peer last seen listening on ip:port, or None."""
+        peer_id = self._by_endpoint.get(self._endpoint(ip, port))
+        return self.get(peer_id) if peer_id is not None else None
+
+    def username(self, peer_id) -> str:
+        """Display name for peer_id: its neighbor name, else the short id."""
+        if not peer_id:
+            return ""
+        peer = self._by_id.get(peer_id)
+        if peer is not None and peer.get("username"):
+            return peer["username"]
+        return peer_id[:8]
+
+    def neighbors(self) -> list:
+        """Every neighbor, online first (like ChatDatabase.get_neighbors)."""
+        return sorted((dict(p) for p in self._by_id.values()), key=lambda p: -(p.get("status") or 0))
+
+    # ---------- changes (written through) ----------
+    def upsert(self, peer_id, username, ip, port, status=1) -> bool:
+        """Add or update a neighbor; True if anything visible changed."""
+        if not peer_id:
+            return False
+        port = int(port or 0)
+        peer = self._by_id.get(peer_id)
+        changed = peer is None or (peer["username"], peer["ip"], peer["port"], peer["status"]) != (username, ip, port, status)
+        if peer is not None:
+            self._unindex(peer)
+        self._index({"peer_id": peer_id, "username": username, "ip": ip, "port": port,
+                     "last_seen": _now(), "status": status})
+        self._persist(self.db.upsert_neighbor, peer_id, username, ip, port, status=status)
+        if changed:
+            self.changed.emit(peer_id, self.get(peer_id))
+        return changed
+
+    def set_status(self, peer_id, status) -> bool:
+        """Mark a known neighbor online (1) / offline (0); False if unknown."""
+        peer = self._by_id.get(peer_id)
+        if peer is None:
+            return False
+        changed = peer["status"] != status
+        peer["status"] = status
+        peer["last_seen"] = _now()
+        self._persist(self.db.set_neighbor_status, peer_id, status)
+        if changed:
+            self.changed.emit(peer_id, self.get(peer_id))
+        return True
+
+    def rename(self, peer_id, username) -> bool:
+        """New display name for a known neighbor; True if it changed."""
+        peer = self._by_id.get(peer_id)
+        if peer is None or not username or peer["username"] == username:
+            return False
+        return self.upsert(peer_id, username, peer["ip"], peer["port"], peer["status"])
+
+    # ---------- internals ----------
+    @staticmethod
+    def _endpoint(ip, port):
+        try:
+            return ((ip or "").strip(), int(port or 0))
+        except (TypeError, ValueError):
+            return ((ip or "").strip(), 0)
+
+    def _index(self, peer):
+        self._by_id[peer["peer_id"]] = peer
+        endpoint = self._endpoint(peer.get("ip"), peer.get("port"))
+        if endpoint[0] and endpoint[1] > 0:
+            self._by_endpoint[endpoint] = peer["peer_id"]
+
+    def _unindex(self, peer):
+        endpoint = self._endpoint(peer.get("ip"), peer.get("port"))
+        if self._by_endpoint.get(endpoint) == peer["peer_id"]:
+            del self._by_endpoint[endpoint]
+
+    def _persist(self, fn, *args, **kwargs):
+        """Queue the DB write; failures are only logged (memory stays authoritative)."""
+        def done(future):
+            if future.exception() is not None:
+                log.error("%s(%s) failed: %s", fn.__name__, args[0], future.exception())
+        try:
+            self.db.submit(fn, *args, **kwargs).add_done_callback(done)
+        except Exception as e:
+            log.error("%s(%s) failed: %s", fn.__name__, args[0], e)
@@ -0,0 +1,77 @@
+import time
+from network.protocol import DEFAULT_TTL
+
+
+class RoutingTable:
+    """Next-hop table learned from traffic (distance-vector style).
+
+    Every message says how to reach its origin. It arrived from the
+    neighbour named in "forward" (or straight from "from" when nobody
+    relayed it), after DEFAULT_TTL - ttl + 1 hops (1 when not relayed: gossip
+    frames are sent with ttl=1). A FIND_ACK also lists the
+    responder's neighbours, one hop further along the same path.
+
+    A route is replaced by a shorter one and refreshed when its next hop
+    reports it again. It is forgotten after `route_ttl` seconds or when its
+    next hop disconnects.
+    """
+
+    def __init__(self, self_id, route_ttl=300.0, clock=time.monotonic):
+        self.self_id = self_id
+        self.route_ttl = route_ttl
+        self._clock = clock
+        self._routes = {}    # dest -> {"next_hop", "hops", "updated"}
+
+    def learn(self, dest, next_hop, hops) -> bool:
+        """Offer a route; return True if the table changed."""
+        if not dest or not next_hop or dest == self.self_id or next_hop == self.self_id:
+            return False
+        now = self._clock()
+        route = self._routes.get(dest)
+        if (
+            route is None
+            or hops < route["hops"]
+            or route["next_hop"] == next_hop
+            or now - route["updated"] > self.route_ttl
+        ):
+            self._routes[dest] = {"next_hop": next_hop, "hops": hops, "updated": now}
+            return True
+        return False
+
+    def learn_from_message(self, msg, initial_ttl=DEFAULT_TTL):
+        origin = msg.get("from")
+        via = msg.get("forward") or origin
+        try:
+            hops = max(1, initial_ttl - int(msg.get("ttl", initial_ttl)) + 1)
+        except (TypeError, ValueError):
+            return
+        if not msg.get("forward"):
+            hops = 1    # nobody relayed it, whatever ttl it was sent with
+        self.learn(origin, via, hops)
+
+        # FIND_ACK: the responder's neighbours sit one hop behind it
+        content = msg.get("content")
+        if msg.get("type") == "FIND_ACK" and isinstance(content, dict):
+            for n in content.get("neighbors") or []:
+                if isinstance(n, dict):
+                    self.learn(n.get("peer_id"), via, hops + 1)
+
+    def next_hop(self, dest):
+        route = self._routes.get(dest)
+        if route is None:
+            return None
+        if self._clock() - route["updated"] > self.route_ttl:
+            del self._routes[dest]
+            return None
+        return route["next_hop"]
+
+    def drop_next_hop(self, next_hop):
+        """Forget every route through a neighbour that went away."""
+        for dest in [d for d, r in self._routes.items() if r["next_hop"] == next_hop]:
+            del self._routes[dest]
+
+    def routes(self) -> dict:
+        return {dest: dict(route) for dest, route in self._routes.items()}
+
+    def __len__(self):
+        return len(self._routes)
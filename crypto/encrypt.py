@@ -3,7 +3,8 @@ from __future__ import annotations
 import base64
 import hashlib
 import os
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional
 
 
 ENC_PREFIX = "ENC1:AES256GCM:"  # stable prefix to detect encrypted payloads
@@ -44,25 +45,78 @@ def derive_aes256_key(key_material: Optional[str]) -> Optional[bytes]:
     return hashlib.sha256(key_material.encode("utf-8")).digest()
 
 
-def encrypt_text(plaintext: str, key: bytes) -> str:
-    """Encrypt UTF-8 plaintext to a printable string.
+class CipherContext:
+    """AES-256-GCM context bound to one key.
 
-    Output format: ENC_PREFIX + base64(nonce || ciphertext_with_tag)
+    Building AESGCM(key) sets up the key schedule; doing it once per key
+    instead of once per message leaves only the raw AEAD work per call.
+    Get instances through get_cipher() so every caller shares them.
     """
-    _require_cryptography()
-    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-
-    if plaintext is None:
-        plaintext = ""
 
+    NONCE_SIZE = 12  # 96-bit nonce recommended for GCM
+
+    def __init__(self, key: bytes):
+        _require_cryptography()
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        if not isinstance(key, (bytes, bytearray)) or len(key) != 32:
+            raise ValueError("AES-256 key must be exactly 32 bytes")
+        self._aesgcm = AESGCM(bytes(key))
+
+    def encrypt(self, plaintext: str) -> str:
+        if plaintext is None:
+            plaintext = ""
+        nonce = os.urandom(self.NONCE_SIZE)
+        ct = self._aesgcm.encrypt(nonce, plaintext.encode("utf-8"), None)
+        return ENC_PREFIX + base64.b64encode(nonce + ct).decode("ascii")
+
+    def decrypt(self, payload: str) -> str:
+        if payload is None:
+            return ""
+        if not isinstance(payload, str):
+            return str(payload)
+        if not payload.startswith(ENC_PREFIX):
+            return payload
+        try:
+            raw = base64.b64decode(payload[len(ENC_PREFIX):], validate=True)
+            pt = self._aesgcm.decrypt(raw[:self.NONCE_SIZE], raw[self.NONCE_SIZE:], None)
+            return pt.decode("utf-8")
+        except Exception as e:
+            raise ValueError("Failed to decrypt payload (wrong key or corrupted data)") from e
+
+    def encrypt_many(self, plaintexts) -> List[str]:
+        """Encrypt each plaintext (fresh nonce each)."""
+        return [self.encrypt(p) for p in plaintexts]
+
+    def decrypt_many(self, payloads) -> List[Optional[str]]:
+        """Decrypt each payload; a payload that fails gives None instead of raising."""
+        out = []
+        for p in payloads:
+            try:
+                out.append(self.decrypt(p))
+            except ValueError:
+                out.append(None)
+        return out
+
+
+@lru_cache(maxsize=64)
+def _cached_cipher(key: bytes) -> CipherContext:
+    return CipherContext(key)
+
+
+def get_cipher(key: bytes) -> CipherContext:
+    """Shared CipherContext for `key` (LRU cache keyed by the key bytes)."""
     if not isinstance(key, (bytes, bytearray)) or len(key) != 32:
         raise ValueError("AES-256 key must be exactly 32 bytes")
+    return _cached_cipher(bytes(key))
 
-    nonce = os.urandom(12)  # 96-bit nonce recommended for GCM
-    aesgcm = AESGCM(key)
-    ct = aesgcm.encrypt(nonce, plaintext.encode("utf-8"), None)
-    token = base64.b64encode(nonce + ct).decode("ascii")
-    return f"{ENC_PREFIX}{token}"
+
+def encrypt_text(plaintext: str, key: bytes) -> str:
+    """Encrypt UTF-8 plaintext to a printable string.
+
+    Output format: ENC_PREFIX + base64(nonce || ciphertext_with_tag)
+    """
+    return get_cipher(key).encrypt(plaintext)
 
 
 def decrypt_text(payload: str, key: bytes) -> str:
@@ -71,30 +125,24 @@ def decrypt_text(payload: str, key: bytes) -> str:
     - If payload doesn't start with ENC_PREFIX: return payload unchanged.
     - If decrypt fails (wrong key/corrupt): raise ValueError.
     """
-    _require_cryptography()
-    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-
     if payload is None:
         return ""
     if not isinstance(payload, str):
         # Keep backward compatibility in case content is dict/other types
         return str(payload)
-
     if not payload.startswith(ENC_PREFIX):
         return payload
+    return get_cipher(key).decrypt(payload)
 
-    if not isinstance(key, (bytes, bytearray)) or len(key) != 32:
-        raise ValueError("AES-256 key must be exactly 32 bytes")
 
-    token = payload[len(ENC_PREFIX) :]
-    try:
-        raw = base64.b64decode(token, validate=True)
-        nonce, ct = raw[:12], raw[12:]
-        aesgcm = AESGCM(key)
-        pt = aesgcm.decrypt(nonce, ct, None)
-        return pt.decode("utf-8")
-    except Exception as e:
-        raise ValueError("Failed to decrypt payload (wrong key or corrupted data)") from e
+def encrypt_many(plaintexts, key: bytes) -> List[str]:
+    """Batch encrypt_text with one cipher context."""
+    return get_cipher(key).encrypt_many(plaintexts)
+
+
+def decrypt_many(payloads, key: bytes) -> List[Optional[str]]:
+    """Batch decrypt_text; failed payloads come back as None."""
+    return get_cipher(key).decrypt_many(payloads)
 
 
 # Backward-compatible names (used elsewhere in repo historically)
@@ -42,3 +42,24 @@ def derive_shared_key(priv_b64: str, peer_pub_b64: str) -> str:
         return base64.b64encode(key).decode('ascii')
     except Exception:
         return None
+
+
+def derive_session_key(priv_b64: str, peer_pub_b64: str, salt: bytes, info: bytes = b'peer-chat-session') -> bytes:
+    """Derive a raw 32-byte session key via X25519 + HKDF-SHA256.
+
+    `salt` carries both handshake nonces, so the same static keypairs give a
+    fresh key for every session. Returns None if either key is invalid.
+    """
+    try:
+        priv = x25519.X25519PrivateKey.from_private_bytes(base64.b64decode(priv_b64))
+        peer_pub = x25519.X25519PublicKey.from_public_bytes(base64.b64decode(peer_pub_b64))
+        shared = priv.exchange(peer_pub)
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            info=info
+        )
+        return hkdf.derive(shared)
+    except Exception:
+        return None
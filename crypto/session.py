@@ -0,0 +1,135 @@
+import hashlib
+import time
+from collections import OrderedDict
+from crypto.encrypt import CipherContext
+
+
+E2E_PREFIX = "E2E1:"    # E2E1:<sid>:<ENC1 token>, sealed with a per-peer session key
+
+
+def session_id(initiator_nonce: bytes, responder_nonce: bytes) -> str:
+    """Short id naming the key derived from this pair of handshake nonces."""
+    return hashlib.sha256(initiator_nonce + responder_nonce).hexdigest()[:16]
+
+
+def parse_sealed(payload):
+    """Return (sid, token) for an E2E payload, or None for anything else."""
+    if not isinstance(payload, str) or not payload.startswith(E2E_PREFIX):
+        return None
+    sid, sep, token = payload[len(E2E_PREFIX):].partition(":")
+    if not sep or not sid:
+        return None
+    return sid, token
+
+
+class Session:
+    """One negotiated AES-256-GCM key shared with one peer."""
+
+    def __init__(self, peer_id, sid, key: bytes, created: float):
+        self.peer_id = peer_id
+        self.sid = sid
+        self.created = created
+        self.sent = 0
+        self.received = 0
+        self._cipher = CipherContext(key)
+
+    def seal(self, plaintext: str) -> str:
+        self.sent += 1
+        return f"{E2E_PREFIX}{self.sid}:{self._cipher.encrypt(plaintext)}"
+
+    def open(self, payload: str) -> str:
+        parsed = parse_sealed(payload)
+        if parsed is None or parsed[0] != self.sid:
+            raise ValueError("Payload was not sealed with this session")
+        plaintext = self._cipher.decrypt(parsed[1])
+        self.received += 1
+        return plaintext
+
+
+class SessionKeyCache:
+    """LRU of per-peer session keys.
+
+    The X25519 exchange and HKDF run once per handshake; every message after
+    that only pays for AES-GCM with the cached context.
+
+    Each peer has one current session used for sending. It stops being
+    offered (so the caller re-handshakes) after `max_messages` sends or
+    `max_age` seconds. Older sessions stay available for decrypting
+    in-flight messages until they expire or are pushed out by `capacity`.
+    """
+
+    def __init__(self, capacity=256, max_messages=10000, max_age=3600.0, clock=time.monotonic):
+        self.capacity = capacity
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self._clock = clock
+        self._sessions = OrderedDict()   # (peer_id, sid) -> Session, oldest first
+        self._current = {}               # peer_id -> sid used for sending
+
+        self.hits = 0
+        self.misses = 0
+        self.rekeys = 0
+
+    def put(self, peer_id, sid, key: bytes) -> Session:
+        """Install a freshly derived key and make it the peer's current session."""
+        if peer_id in self._current:
+            self.rekeys += 1
+        session = Session(peer_id, sid, key, self._clock())
+        self._sessions[(peer_id, sid)] = session
+        self._sessions.move_to_end((peer_id, sid))
+        self._current[peer_id] = sid
+        while len(self._sessions) > self.capacity:
+            (old_peer, old_sid), _ = self._sessions.popitem(last=False)
+            if self._current.get(old_peer) == old_sid:
+                del self._current[old_peer]
+        return session
+
+    def current(self, peer_id):
+        """Session to send with, or None when a (re)handshake is needed."""
+        sid = self._current.get(peer_id)
+        session = self._live(peer_id, sid) if sid else None
+        if session is None or session.sent >= self.max_messages:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return session
+
+    def lookup(self, peer_id, sid):
+        """Session that sealed an incoming message, if still cached."""
+        return self._live(peer_id, sid)
+
+    def forget(self, peer_id, sid):
+        """Drop one session (the peer no longer has it)."""
+        self._sessions.pop((peer_id, sid), None)
+        if self._current.get(peer_id) == sid:
+            del self._current[peer_id]
+
+    def drop(self, peer_id):
+        for key in [k for k in self._sessions if k[0] == peer_id]:
+            del self._sessions[key]
+        self._current.pop(peer_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "peers": len(self._current),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rekeys": self.rekeys,
+        }
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # ---------- internals ----------
+    def _live(self, peer_id, sid):
+        session = self._sessions.get((peer_id, sid))
+        if session is None:
+            return None
+        if self._clock() - session.created > self.max_age:
+            del self._sessions[(peer_id, sid)]
+            if self._current.get(peer_id) == sid:
+                del self._current[peer_id]
+            return None
+        self._sessions.move_to_end((peer_id, sid))
+        return session
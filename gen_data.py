@@ -63,7 +63,7 @@ for node in nodes:
     for j in range(0, len(node_map[index])):
         # print("j", j)
         if node_map[index][j] == 1:
-            insert_neighbor(chat_db.conn, nodes[j]["peer_id"], nodes[j]["username"], nodes[j]["ip"], nodes[j]["port"], 1)
+            chat_db.executor.write(insert_neighbor, nodes[j]["peer_id"], nodes[j]["username"], nodes[j]["ip"], nodes[j]["port"], 1)
     
     index += 1
 
@@ -1,8 +1,10 @@
 import sys
 from PyQt5.QtWidgets import QApplication
 from ui.main_window import MainWindow
+from utils.logger import configure as configure_logging
 
 def main():
+    configure_logging()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
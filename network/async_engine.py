@@ -0,0 +1,546 @@
+import asyncio
+import threading
+from collections import deque
+from network.protocol import (
+    CODEC_JSON,
+    FRAME_TYPE_HELLO,
+    SUPPORTED_CODECS,
+    SUPPORTED_VERSIONS,
+    FrameDecoder,
+    ProtocolError,
+    choose_codec,
+    choose_version,
+    decode_hello,
+    decode_message,
+    encode_hello,
+    frame_codec,
+    frame_type,
+    frame_version,
+    transcode_frame,
+)
+from network.reconnect import ReconnectScheduler
+from utils.events import Signal
+
+
+class EngineEvents:
+    """Default engine bridge: plain callbacks, no Qt.
+
+    Slots run on the engine loop, which in headless mode is the caller's
+    own event loop.
+    """
+
+    def __init__(self):
+        self.new_data = Signal()
+        self.connected = Signal()
+        self.disconnected = Signal()
+        self.peer_identified = Signal()
+        self.status = Signal()
+        self.invoke = Signal()      # callable to run on the consumer's side
+
+
+class PeerLink:
+    """Outbound connection to one neighbour.
+
+    The connection itself lives on the engine loop; `send` may be called from
+    any thread and only appends to a bounded per-link queue. A flusher task on
+    the loop joins everything queued into one write and waits for the socket
+    to drain before the next one, so a slow peer backs up its own queue and
+    nothing else.
+
+    Once a frame would take the queue past `queue_high` bytes the link is
+    congested until it drains to `queue_low`. While congested, `drop_policy`
+    "newest" refuses new frames and "oldest" evicts the oldest queued ones to
+    make room; frames sent with priority=True (handshakes, our own messages)
+    are never evicted and are accepted up to twice `queue_high`.
+
+    On connect the link offers SUPPORTED_CODECS and SUPPORTED_VERSIONS in a
+    HELLO frame and sends JSON version 1 frames until the peer answers with
+    what it picked; frames the peer cannot read are transcoded on the way out.
+
+    Reconnect delays come from engine.reconnect (see network/reconnect.py).
+    """
+
+    def __init__(self, engine, peer_id, host, port):
+        self.engine = engine
+        self.peer_id = peer_id
+        self.host = host
+        self.port = port
+
+        self.running = False        # connected and writable
+        self.codec = CODEC_JSON     # what the peer agreed to decode
+        self.version = 1            # highest frame version the peer reads
+        self._stopped = False       # no more reconnects
+        self._writer = None
+        self._task = None
+        self._retry_now = None      # asyncio.Event that cuts a backoff wait short
+
+        # outbound queue, shared between senders and the loop
+        self.queue_high = engine.queue_high
+        self.queue_low = engine.queue_low
+        self.drop_policy = engine.drop_policy
+        self._lock = threading.Lock()
+        self._queue = deque()       # (frame, priority)
+        self._queued_bytes = 0
+        self._wake_pending = False  # a flusher wakeup is already scheduled
+        self._wakeup = None         # asyncio.Event, per connection
+        self.congested = False
+
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.writes = 0
+        self.dropped_frames = 0
+
+    def send(self, data: bytes, priority=False) -> bool:
+        """Queue a frame; False if the link is down or the frame was dropped."""
+        if not self.running:
+            return False
+        if frame_codec(data) != self.codec or frame_version(data) > self.version:
+            try:
+                data = transcode_frame(data, self.codec, self.version)
+            except (ProtocolError, ValueError) as e:
+                self.engine.bridge.status.emit(f"[CLIENT_ERROR] {self.peer_id}: cannot transcode frame: {e}")
+                return False
+
+        size = len(data)
+        with self._lock:
+            if self._queue and self._queued_bytes + size > self.queue_high:
+                self.congested = True
+            if self.congested and not self._make_room(size, priority):
+                self.dropped_frames += 1
+                return False
+            self._queue.append((data, priority))
+            self._queued_bytes += size
+            wake = not self._wake_pending
+            self._wake_pending = True
+        if wake:
+            self.engine.call_soon(self._wake)
+        return True
+
+    def _make_room(self, size, priority) -> bool:
+        """Congested: may this frame be queued? (caller holds self._lock)"""
+        if not self._queue:
+            return True     # a single oversized frame still goes out
+        if priority:
+            return self._queued_bytes + size <= self.queue_high * 2
+        if self.drop_policy != "oldest":
+            return False
+        kept = deque()
+        while self._queue and self._queued_bytes + size > self.queue_high:
+            frame, frame_priority = self._queue.popleft()
+            if frame_priority:
+                kept.append((frame, frame_priority))
+                continue
+            self._queued_bytes -= len(frame)
+            self.dropped_frames += 1
+        self._queue.extendleft(reversed(kept))
+        return self._queued_bytes + size <= self.queue_high
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def queued_bytes(self) -> int:
+        return self._queued_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued_frames": len(self._queue),
+                "queued_bytes": self._queued_bytes,
+                "congested": self.congested,
+                "sent_frames": self.sent_frames,
+                "sent_bytes": self.sent_bytes,
+                "writes": self.writes,
+                "dropped_frames": self.dropped_frames,
+            }
+
+    def stop(self):
+        self._stopped = True
+        self.running = False
+        self.engine.call_soon(self._cancel)
+
+    def wake(self):
+        """Retry now if the link is waiting to reconnect (any thread)."""
+        self.engine.call_soon(self._wake_retry)
+
+    # ---------- loop side ----------
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _take_batch(self):
+        """Pop queued frames up to engine.coalesce_bytes (at least one)."""
+        limit = self.engine.coalesce_bytes
+        batch = []
+        size = 0
+        with self._lock:
+            while self._queue and (not batch or size + len(self._queue[0][0]) <= limit):
+                frame, _ = self._queue.popleft()
+                batch.append(frame)
+                size += len(frame)
+            self._queued_bytes -= size
+            if not batch:
+                self._wake_pending = False
+            elif self.congested and self._queued_bytes <= self.queue_low:
+                self.congested = False
+        return batch, size
+
+    async def _flush_loop(self, writer):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while True:
+                    batch, size = self._take_batch()
+                    if not batch:
+                        break
+                    writer.write(batch[0] if len(batch) == 1 else b"".join(batch))
+                    self.writes += 1
+                    self.sent_frames += len(batch)
+                    self.sent_bytes += size
+                    # socket backpressure: let the kernel take it before writing more
+                    await writer.drain()
+        except OSError as e:
+            # the connection is broken: drop it so run() sees EOF and reconnects
+            self.engine.bridge.status.emit(f"[CLIENT_ERROR] {self.peer_id}: write failed: {e}")
+            writer.transport.abort()
+
+    def _drop_queue(self):
+        with self._lock:
+            self.dropped_frames += len(self._queue)
+            self._queue.clear()
+            self._queued_bytes = 0
+            self._wake_pending = False
+            self.congested = False
+
+    def _cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def _wake_retry(self):
+        self.engine.reconnect.wake(self.peer_id)
+        if self._retry_now is not None:
+            self._retry_now.set()
+
+    async def _backoff(self):
+        scheduler = self.engine.reconnect
+        was_parked = scheduler.is_parked(self.peer_id)
+        delay = scheduler.failed(self.peer_id)
+        if scheduler.is_parked(self.peer_id) and not was_parked:
+            self.engine.bridge.status.emit(
+                f"[CLIENT] {self.peer_id} unreachable, retrying every {scheduler.park_delay:.0f}s")
+        self._retry_now.clear()
+        try:
+            await asyncio.wait_for(self._retry_now.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def _on_frame(self, frame):
+        if frame_type(frame) == FRAME_TYPE_HELLO:
+            hello = decode_hello(frame)
+            if hello.get("codec") in SUPPORTED_CODECS:
+                self.codec = hello["codec"]
+            if hello.get("version") in SUPPORTED_VERSIONS:
+                self.version = hello["version"]
+            return
+        self.engine.bridge.new_data.emit(frame)
+
+    async def run(self):
+        engine = self.engine
+        self._retry_now = asyncio.Event()
+        while not self._stopped:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port),
+                    engine.connect_timeout
+                )
+            except (OSError, asyncio.TimeoutError):
+                await self._backoff()
+                continue
+
+            self._writer = writer
+            self.codec = CODEC_JSON
+            self.version = 1
+            writer.write(encode_hello({"codecs": list(SUPPORTED_CODECS), "versions": list(SUPPORTED_VERSIONS)}))
+            self._drop_queue()      # anything that raced the last disconnect
+            self._wakeup = asyncio.Event()
+            flusher = asyncio.get_running_loop().create_task(self._flush_loop(writer))
+            self.running = True
+            engine.reconnect.connected(self.peer_id)
+            engine.bridge.status.emit(f"[CLIENT] Connected to {self.host}:{self.port}")
+            engine.bridge.connected.emit(self.peer_id)
+            try:
+                await engine.read_frames(reader, self._on_frame)
+            except ProtocolError as e:
+                engine.bridge.status.emit(f"[CLIENT_ERROR] {self.peer_id}: {e}")
+            except (OSError, asyncio.IncompleteReadError) as e:
+                engine.bridge.status.emit(f"[CLIENT_ERROR] {e}")
+            finally:
+                self.running = False
+                self._writer = None
+                flusher.cancel()
+                try:
+                    await flusher
+                except (asyncio.CancelledError, OSError):
+                    pass
+                # what was not written is stale by the time we reconnect
+                self._drop_queue()
+                writer.close()
+                engine.reconnect.disconnected(self.peer_id)
+                engine.bridge.disconnected.emit(self.peer_id)
+
+            if not self._stopped:
+                await self._backoff()
+
+
+class AsyncNetworkEngine:
+    """Single-threaded asyncio transport for one node.
+
+    One event loop serves the listening socket, every inbound connection and
+    every outbound PeerLink. Events are reported through `bridge`, an object
+    exposing `new_data`, `connected`, `disconnected`, `peer_identified`,
+    `status` and `invoke` signals (EngineEvents by default, network/qt_bridge.py for Qt).
+
+    The loop either runs on a background thread owned by the engine (UI
+    mode) or is the caller's loop (headless mode, see node.py).
+    """
+
+    def __init__(self, host, port, bridge=None, connect_timeout=3, retry_interval=1, reconnect=None,
+                 queue_high=1024 * 1024, queue_low=256 * 1024, coalesce_bytes=64 * 1024, drop_policy="newest"):
+        self.host = host
+        self.port = port
+        self.bridge = bridge if bridge is not None else EngineEvents()
+        self.connect_timeout = connect_timeout
+        # retry_interval is the first backoff step; a custom scheduler overrides it
+        self.retry_interval = retry_interval
+        self.reconnect = reconnect if reconnect is not None else ReconnectScheduler(base=retry_interval)
+
+        # per-link outbound queue limits (see PeerLink)
+        if drop_policy not in ("newest", "oldest"):
+            raise ValueError(f"Unknown drop policy {drop_policy!r}")
+        self.queue_high = queue_high
+        self.queue_low = min(queue_low, queue_high)
+        self.coalesce_bytes = coalesce_bytes
+        self.drop_policy = drop_policy
+
+        self.loop = None
+        self.links = {}             # peer_id -> PeerLink (outbound)
+        self._inbound = set()       # StreamWriter of accepted connections
+        self._tasks = set()         # inbound handler tasks
+        self._timers = set()        # pending call_later handles
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    # ---------- lifecycle ----------
+    def start(self, loop=None, timeout=5):
+        """Start serving.
+
+        Without `loop` the engine runs its own loop on one background thread.
+        With `loop` it attaches to that loop, which the caller runs.
+        """
+        if self.loop is not None:
+            return
+        if loop is not None:
+            self.loop = loop
+            loop.call_soon_threadsafe(self._spawn_server)
+            return
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="peerchat-net", daemon=True)
+        self._thread.start()
+        # make sure the server is bound (or has failed) before clients go out
+        self._ready.wait(timeout)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._spawn_server()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def _spawn_server(self):
+        self.loop.create_task(self._start_server())
+
+    async def _start_server(self):
+        self.bridge.status.emit("[SERVER] Server starting...")
+        try:
+            self._server = await asyncio.start_server(self._handle_inbound, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            self.bridge.status.emit(f"[SERVER] Listening on {self.host}:{self.port}")
+        except Exception as e:
+            self.bridge.status.emit(f'[SERVER_ERROR] {str(e)}')
+        finally:
+            self._ready.set()
+
+    def stop(self, timeout=5):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return None
+
+        if self._thread is None:
+            # attached to the caller's loop
+            if loop.is_running():
+                return loop.create_task(self._shutdown())
+            loop.run_until_complete(self._shutdown())
+            return None
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+        return None
+
+    async def _shutdown(self):
+        for handle in list(self._timers):
+            handle.cancel()
+        self._timers.clear()
+        links = list(self.links.values())
+        self.links.clear()
+        tasks = [link._task for link in links if link._task is not None]
+        for link in links:
+            link._stopped = True
+            link.running = False
+
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._inbound):
+            writer.close()
+
+        # only our own tasks: in headless mode the loop belongs to the caller
+        tasks += list(self._tasks)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def call_soon(self, fn, *args) -> bool:
+        """Schedule fn on the engine loop from any thread.
+
+        False when there is no running loop (not started, or stopped).
+        """
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return False
+        try:
+            loop.call_soon_threadsafe(fn, *args)
+        except RuntimeError:
+            # loop closed between the check and the call (shutdown race)
+            return False
+        return True
+
+    def call_later(self, delay, fn) -> bool:
+        """Run fn after `delay` seconds through bridge.invoke (any thread).
+
+        The bridge decides where fn runs: on the engine loop with
+        EngineEvents, on the UI thread with the Qt NetworkBridge, i.e. the
+        same place as every other ChatManager handler. False if the timer
+        could not be set (see call_soon).
+        """
+        return self.call_soon(self._arm_timer, delay, fn)
+
+    def _arm_timer(self, delay, fn):
+        handle = None
+
+        def fire():
+            self._timers.discard(handle)
+            self.bridge.invoke.emit(fn)
+
+        handle = self.loop.call_later(delay, fire)
+        self._timers.add(handle)
+
+    # ---------- outbound ----------
+    def connect_peer(self, peer_id, host, port) -> PeerLink:
+        link = self.links.get(peer_id)
+        if link is not None and (link.host, link.port) == (host, port):
+            return link
+        if link is not None:
+            link.stop()
+
+        link = PeerLink(self, peer_id, host, port)
+        self.links[peer_id] = link
+        self.call_soon(self._spawn_link, link)
+        return link
+
+    def _spawn_link(self, link):
+        if not link._stopped:
+            link._task = self.loop.create_task(link.run())
+
+    def link_stats(self) -> dict:
+        """Outbound queue depth and counters per peer."""
+        return {peer_id: link.stats() for peer_id, link in list(self.links.items())}
+
+    def disconnect_peer(self, peer_id):
+        link = self.links.pop(peer_id, None)
+        if link is not None:
+            link.stop()
+        self.call_soon(self.reconnect.forget, peer_id)
+
+    # ---------- inbound ----------
+    async def _handle_inbound(self, reader, writer):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        self._inbound.add(writer)
+        self.bridge.status.emit(f"[SERVER] Peer connected: {writer.get_extra_info('peername')}")
+        peer_id = None
+
+        def on_frame(frame):
+            nonlocal peer_id
+            if frame_type(frame) == FRAME_TYPE_HELLO:
+                # codec negotiation: answer with the best codec we share
+                hello = decode_hello(frame)
+                writer.write(encode_hello({
+                    "codec": choose_codec(hello.get("codecs")),
+                    "version": choose_version(hello.get("versions")),
+                }))
+                return
+            if peer_id is None:
+                # Identify the neighbour from the first message on the socket:
+                # a relayed message carries it in "forward", a direct one in "from".
+                try:
+                    msg = decode_message(frame)
+                    peer_id = msg.get("forward") or msg.get("from") or None
+                    if peer_id:
+                        self.bridge.peer_identified.emit({
+                            "peer_id": peer_id,
+                            "username": (msg.get("from_n") if not msg.get("forward") else None) or peer_id,
+                            "ip": "",
+                            "port": 0,
+                            "status": 1,
+                            "last_seen": None
+                        })
+                        # it is up again: no point waiting out our backoff
+                        link = self.links.get(peer_id)
+                        if link is not None and not link.running:
+                            link.wake()
+                except Exception:
+                    pass
+            self.bridge.new_data.emit(frame)
+
+        try:
+            await self.read_frames(reader, on_frame)
+        except ProtocolError as e:
+            self.bridge.status.emit(f"[S_CLIENT_ERROR] Bad stream: {e}")
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # engine shutdown; asyncio's start_server callback would log a
+            # cancelled connection handler as an error, so end quietly
+            pass
+        finally:
+            self._tasks.discard(task)
+            self._inbound.discard(writer)
+            writer.close()
+            if peer_id:
+                self.bridge.disconnected.emit(peer_id)
+
+    @staticmethod
+    async def read_frames(reader, on_frame):
+        decoder = FrameDecoder()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            for frame in decoder.feed(data):
+                on_frame(frame)
@@ -1,13 +1,702 @@
+import base64
+import binascii
 import json
+import struct
 import time
 from uuid import uuid4
+from crypto.encrypt import ENC_PREFIX
+from crypto.session import E2E_PREFIX
 
-def encode_message(sender, receiver, content, forwarder="", sender_name="", receiver_name="", ttl=5, message_type="MESSAGE", message_id=None):
+# ---------- framing ----------
+# Every message travels inside a length-prefixed frame so the receiver can
+# split a TCP byte stream back into messages no matter how it was segmented:
+#
+#   magic (2) | version (1) | type (1) | codec (1) | length (4, big endian) | payload
+#
+# Version 2 message frames start the payload with a route header holding the
+# two fields relays change, so forwarding rewrites a few header bytes and
+# reuses the encoded body as is (see forward_frame):
+#
+#   ttl (1) | forward length (1) | forward (utf-8) | body
+#
+# The body still carries "ttl"/"forward" as they were when the message was
+# created; the route header wins. Version 1 frames (no route header) are still
+# accepted, and HELLO control frames are always version 1.
+#
+# Version 3 adds the transmission attempt to the route header:
+#
+#   ttl (1) | attempt (1) | forward length (1) | forward (utf-8) | body
+#
+# A retransmit keeps its message_id (the receiver dedups and ACKs on it) but
+# carries attempt > 0, so relays that forwarded an earlier copy pass it on.
+# Decoded messages have an "attempt" key only when it is not 0.
+FRAME_MAGIC = b"PC"
+PROTOCOL_VERSION = 3
+SUPPORTED_VERSIONS = (1, 2, 3)
+FRAME_HEADER = struct.Struct(">2sBBBI")
+ROUTE_HEADER = struct.Struct(">BB")          # v2: ttl, forward length
+ROUTE_HEADER_V3 = struct.Struct(">BBB")      # v3: ttl, attempt, forward length
+MAX_ATTEMPT = 255
+MAX_FRAME_SIZE = 16 * 1024 * 1024   # refuse anything larger (corrupt stream / abuse)
+
+CODEC_JSON = 0
+CODEC_BINARY = 1
+
+DEFAULT_TTL = 5
+
+# message "type" <-> frame type byte
+MESSAGE_TYPES = {
+    "MESSAGE": 1,
+    "FIND_NODES": 2,
+    "FIND_ACK": 3,
+    "HANDSHAKE": 4,
+    "ACK": 5,
+    "NACK": 6,
+}
+FRAME_TYPE_UNKNOWN = 0
+FRAME_TYPE_HELLO = 255   # connection control, never a chat message
+
+
+class ProtocolError(ValueError):
+    """Raised when bytes on the wire are not a valid frame."""
+
+
+def encode_frame(payload: bytes, frame_type=FRAME_TYPE_UNKNOWN, codec=CODEC_JSON, route=None) -> bytes:
+    """Build a frame: route=(ttl, forward) makes a version 2 frame,
+    route=(ttl, forward, attempt) a version 3 frame."""
+    if route is None:
+        if len(payload) > MAX_FRAME_SIZE:
+            raise ProtocolError(f"Frame too large: {len(payload)} bytes")
+        return FRAME_HEADER.pack(FRAME_MAGIC, 1, frame_type, codec, len(payload)) + payload
+
+    version = 3 if len(route) > 2 else 2
+    route_bytes = _route_bytes(*route)
+    length = len(route_bytes) + len(payload)
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame too large: {length} bytes")
+    return FRAME_HEADER.pack(FRAME_MAGIC, version, frame_type, codec, length) + route_bytes + payload
+
+
+def _route_bytes(ttl, forward, attempt=None) -> bytes:
+    fwd = forward.encode("utf-8")
+    try:
+        if attempt is None:
+            return ROUTE_HEADER.pack(ttl, len(fwd)) + fwd
+        return ROUTE_HEADER_V3.pack(ttl, attempt, len(fwd)) + fwd
+    except struct.error as e:
+        raise ProtocolError(f"Route header out of range: {e}") from e
+
+
+def split_frame(data):
+    """Split one complete frame into (version, frame_type, codec, route, body).
+
+    route is (ttl, forward) for version 2+ frames and None for version 1;
+    frame_attempt() reads the version 3 attempt.
+    """
+    if len(data) < FRAME_HEADER.size:
+        raise ProtocolError("Incomplete frame header")
+    magic, version, frame_type, codec, length = FRAME_HEADER.unpack_from(data, 0)
+    if magic != FRAME_MAGIC:
+        raise ProtocolError("Bad frame magic")
+    if version not in SUPPORTED_VERSIONS:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    end = FRAME_HEADER.size + length
+    if len(data) < end:
+        raise ProtocolError("Truncated frame payload")
+
+    start = FRAME_HEADER.size
+    route = None
+    if version >= 2:
+        header = ROUTE_HEADER_V3 if version >= 3 else ROUTE_HEADER
+        if length < header.size:
+            raise ProtocolError("Truncated route header")
+        fields = header.unpack_from(data, start)
+        ttl, fwd_len = fields[0], fields[-1]
+        start += header.size
+        if start + fwd_len > end:
+            raise ProtocolError("Truncated route header")
+        route = (ttl, bytes(data[start:start + fwd_len]).decode("utf-8", "replace"))
+        start += fwd_len
+    return version, frame_type, codec, route, bytes(data[start:end])
+
+
+def decode_frame(data):
+    """Split one complete frame into (frame_type, codec, payload)."""
+    _, frame_type, codec, _, payload = split_frame(data)
+    return frame_type, codec, payload
+
+
+def frame_attempt(frame) -> int:
+    """Transmission attempt of a message frame (0 unless version 3)."""
+    if frame[:len(FRAME_MAGIC)] == FRAME_MAGIC and frame[2] >= 3:
+        return frame[FRAME_HEADER.size + 1]
+    return 0
+
+
+def forward_frame(frame: bytes, ttl: int, forwarder: str) -> bytes:
+    """Copy of a message frame with a new ttl and forwarder.
+
+    For version 2+ frames only the route header is rebuilt; the encoded body
+    is reused byte for byte, so a relay pays for one buffer copy instead of
+    a decode + encode. Version 1 frames are re-encoded.
+    """
+    return _reroute(frame, ttl, forwarder, None)
+
+
+def retry_frame(frame: bytes, attempt: int) -> bytes:
+    """Copy of a message frame stamped with another transmission attempt."""
+    return _reroute(frame, None, None, min(attempt, MAX_ATTEMPT))
+
+
+def _reroute(frame, ttl, forwarder, attempt):
+    # None keeps the frame's current ttl / forwarder / attempt
+    if frame[:len(FRAME_MAGIC)] == FRAME_MAGIC and frame[2] >= 2:
+        _, version, ftype, codec, length = FRAME_HEADER.unpack_from(frame, 0)
+        header = ROUTE_HEADER_V3 if version >= 3 else ROUTE_HEADER
+        fields = header.unpack_from(frame, FRAME_HEADER.size)
+        body_start = FRAME_HEADER.size + header.size + fields[-1]
+        if ttl is None:
+            ttl = fields[0]
+        if forwarder is None:
+            forwarder = bytes(frame[FRAME_HEADER.size + header.size:body_start]).decode("utf-8", "replace")
+        if attempt is None and version >= 3:
+            attempt = fields[1]
+        if attempt is not None:
+            version = 3
+        body = memoryview(frame)[body_start:FRAME_HEADER.size + length]
+        try:
+            route = _route_bytes(ttl, forwarder, attempt)
+            return b"".join((
+                FRAME_HEADER.pack(FRAME_MAGIC, version, ftype, codec, len(route) + len(body)),
+                route,
+                body,
+            ))
+        except (ProtocolError, struct.error):
+            pass    # ttl / forwarder do not fit the route header
+    msg = decode_message(frame)
+    if ttl is not None:
+        msg["ttl"] = ttl
+    if forwarder is not None:
+        msg["forward"] = forwarder
+    if attempt is not None:
+        msg["attempt"] = attempt
+    return pack_message(msg, frame_codec(frame) if frame[:len(FRAME_MAGIC)] == FRAME_MAGIC else DEFAULT_CODEC)
+
+
+class FrameDecoder:
+    """Incremental frame decoder for a single connection.
+
+    Feed it whatever recv() returned; it buffers partial frames and returns
+    every frame completed by that chunk (zero, one or many).
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self._buf = bytearray()
+
+    def feed(self, data: bytes):
+        self._buf += data
+        frames = []
+        offset = 0
+        header_size = FRAME_HEADER.size
+
+        while len(self._buf) - offset >= header_size:
+            magic, version, _, _, length = FRAME_HEADER.unpack_from(self._buf, offset)
+            if magic != FRAME_MAGIC:
+                raise ProtocolError("Bad frame magic")
+            if version not in SUPPORTED_VERSIONS:
+                raise ProtocolError(f"Unsupported protocol version {version}")
+            if length > self.max_frame_size:
+                raise ProtocolError(f"Frame too large: {length} bytes")
+
+            end = offset + header_size + length
+            if len(self._buf) < end:
+                break
+            frames.append(bytes(self._buf[offset:end]))
+            offset = end
+
+        if offset:
+            del self._buf[:offset]
+        return frames
+
+    def pending(self) -> int:
+        """Number of buffered bytes that do not form a complete frame yet."""
+        return len(self._buf)
+
+
+# ---------- codecs ----------
+# A codec turns a message dict into frame payload bytes and back. The codec
+# byte in the frame header says which one was used, so a receiver decodes
+# anything it supports; which one a sender may use is agreed per connection
+# with a HELLO control frame (see network/async_engine.py).
+#
+# Binary codec: a sequence of (tag, value) records. Known fields have a
+# one-byte tag; anything else is tag 0 followed by its name. Each value
+# starts with a kind byte:
+#
+#   NONE FALSE TRUE | INT zigzag varint | FLOAT 8 bytes | STR/BYTES varint len + data
+#   LIST varint n + values | DICT varint n + (str key, value)
+#   UUID 16 raw bytes | ENC raw nonce+ciphertext | E2E str sid + raw nonce+ciphertext
+#
+# Canonical UUID strings and "ENC1:"/"E2E1:" tokens are stored raw instead of
+# as hex/base64 text and come back as the exact same string.
+#
+# The usual case, a message with exactly the ten envelope fields, skips the
+# tags: ENVELOPE_MARKER, one fixed struct (type, ttl, timestamp, a flag bit
+# per id stored as a raw UUID, the six id/name lengths), the id/name bytes in
+# FIELD_TAGS order, then content as a tagged value. One struct call replaces
+# ten tag dispatches.
+
+FIELD_TAGS = {
+    "type": 1,
+    "from": 2,
+    "from_n": 3,
+    "forward": 4,
+    "to": 5,
+    "to_n": 6,
+    "message_id": 7,
+    "content": 8,
+    "ttl": 9,
+    "timestamp": 10,
+}
+_TAG_FIELDS = {tag: name for name, tag in FIELD_TAGS.items()}
+_TAG_EXTRA = 0
+_TYPE_NAMES = {code: name for name, code in MESSAGE_TYPES.items()}
+
+(_K_NONE, _K_FALSE, _K_TRUE, _K_INT, _K_FLOAT, _K_STR, _K_BYTES,
+ _K_LIST, _K_DICT, _K_UUID, _K_ENC, _K_E2E) = range(12)
+_DOUBLE = struct.Struct(">d")
+
+ENVELOPE_MARKER = 0xFF
+_ENVELOPE = struct.Struct(">BBBIB6B")
+_ENVELOPE_KEYS = frozenset(FIELD_TAGS)
+
+# peer ids repeat in nearly every message: memoize their conversions
+_UUID_CACHE_SIZE = 4096
+_uuid_raw_cache = {}
+_uuid_str_cache = {}
+
+
+def _uuid_to_raw(s: str) -> bytes:
+    """16 raw bytes for a canonical lowercase UUID string, else b''."""
+    if s[8] == s[13] == s[18] == s[23] == "-" and s.islower():
+        try:
+            raw = bytes.fromhex(s.replace("-", ""))
+        except ValueError:
+            return b""
+        if len(raw) == 16:
+            return raw
+    return b""
+
+
+def _raw_to_uuid(raw: bytes) -> str:
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _uuid_raw(s: str) -> bytes:
+    """Memoized _uuid_to_raw, for ids that repeat (peer ids)."""
+    raw = _uuid_raw_cache.get(s)
+    if raw is None:
+        raw = _uuid_to_raw(s)
+        if len(_uuid_raw_cache) >= _UUID_CACHE_SIZE:
+            _uuid_raw_cache.clear()
+        _uuid_raw_cache[s] = raw
+    return raw
+
+
+def _uuid_str(raw: bytes) -> str:
+    s = _uuid_str_cache.get(raw)
+    if s is None:
+        s = _raw_to_uuid(raw)
+        if len(_uuid_str_cache) >= _UUID_CACHE_SIZE:
+            _uuid_str_cache.clear()
+        _uuid_str_cache[raw] = s
+    return s
+
+
+def _put_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf, pos):
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n, shift = 0, 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _raw_token(token: str):
+    """Raw bytes of an ENC1 base64 token, if it round-trips exactly."""
+    try:
+        raw = base64.b64decode(token, validate=True)
+    except (ValueError, binascii.Error):
+        return None
+    # without padding, valid base64 maps 1:1 to its bytes; with padding the
+    # unused bits could be non-zero, so check it would come back unchanged
+    if token.endswith("=") and base64.b64encode(raw).decode("ascii") != token:
+        return None
+    return raw
+
+
+def _pack_str(s: str, out: bytearray):
+    if len(s) == 36:
+        raw = _uuid_raw(s)
+        if raw:
+            out.append(_K_UUID)
+            out += raw
+            return
+    elif s.startswith(ENC_PREFIX):
+        raw = _raw_token(s[len(ENC_PREFIX):])
+        if raw is not None:
+            out.append(_K_ENC)
+            _put_varint(out, len(raw))
+            out += raw
+            return
+    elif s.startswith(E2E_PREFIX):
+        sid, _, token = s[len(E2E_PREFIX):].partition(":")
+        raw = _raw_token(token[len(ENC_PREFIX):]) if token.startswith(ENC_PREFIX) else None
+        if raw is not None:
+            sid_b = sid.encode("utf-8")
+            out.append(_K_E2E)
+            _put_varint(out, len(sid_b))
+            out += sid_b
+            _put_varint(out, len(raw))
+            out += raw
+            return
+    data = s.encode("utf-8")
+    out.append(_K_STR)
+    _put_varint(out, len(data))
+    out += data
+
+
+def _pack_value(v, out: bytearray):
+    t = type(v)
+    if t is str:
+        _pack_str(v, out)
+    elif t is int:
+        out.append(_K_INT)
+        _put_varint(out, (v << 1) if v >= 0 else ((-v << 1) - 1))
+    elif v is None:
+        out.append(_K_NONE)
+    elif t is bool:
+        out.append(_K_TRUE if v else _K_FALSE)
+    elif t is dict:
+        out.append(_K_DICT)
+        _put_varint(out, len(v))
+        for k, item in v.items():
+            key = str(k).encode("utf-8")
+            _put_varint(out, len(key))
+            out += key
+            _pack_value(item, out)
+    elif t is list or t is tuple:
+        out.append(_K_LIST)
+        _put_varint(out, len(v))
+        for item in v:
+            _pack_value(item, out)
+    elif t is float:
+        out.append(_K_FLOAT)
+        out += _DOUBLE.pack(v)
+    elif t is bytes or t is bytearray:
+        out.append(_K_BYTES)
+        _put_varint(out, len(v))
+        out += v
+    elif isinstance(v, str):
+        _pack_str(str(v), out)
+    elif isinstance(v, int):
+        _pack_value(int(v), out)
+    else:
+        raise ProtocolError(f"Cannot encode {type(v).__name__}")
+
+
+def _unpack_value(buf, pos):
+    kind = buf[pos]
+    pos += 1
+    if kind == _K_STR:
+        n = buf[pos]
+        if n < 0x80:
+            pos += 1
+        else:
+            n, pos = _read_varint(buf, pos)
+        return buf[pos:pos + n].decode("utf-8"), pos + n
+    if kind == _K_UUID:
+        return _uuid_str(bytes(buf[pos:pos + 16])), pos + 16
+    if kind == _K_INT:
+        n, pos = _read_varint(buf, pos)
+        return (n >> 1) ^ -(n & 1), pos
+    if kind == _K_ENC:
+        n, pos = _read_varint(buf, pos)
+        return ENC_PREFIX + base64.b64encode(buf[pos:pos + n]).decode("ascii"), pos + n
+    if kind == _K_E2E:
+        n, pos = _read_varint(buf, pos)
+        sid = buf[pos:pos + n].decode("utf-8")
+        pos += n
+        n, pos = _read_varint(buf, pos)
+        token = base64.b64encode(buf[pos:pos + n]).decode("ascii")
+        return f"{E2E_PREFIX}{sid}:{ENC_PREFIX}{token}", pos + n
+    if kind == _K_NONE:
+        return None, pos
+    if kind == _K_TRUE:
+        return True, pos
+    if kind == _K_FALSE:
+        return False, pos
+    if kind == _K_DICT:
+        count, pos = _read_varint(buf, pos)
+        d = {}
+        for _ in range(count):
+            n, pos = _read_varint(buf, pos)
+            key = buf[pos:pos + n].decode("utf-8")
+            d[key], pos = _unpack_value(buf, pos + n)
+        return d, pos
+    if kind == _K_LIST:
+        count, pos = _read_varint(buf, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _unpack_value(buf, pos)
+            items.append(item)
+        return items, pos
+    if kind == _K_FLOAT:
+        return _DOUBLE.unpack_from(buf, pos)[0], pos + 8
+    if kind == _K_BYTES:
+        n, pos = _read_varint(buf, pos)
+        return bytes(buf[pos:pos + n]), pos + n
+    raise ProtocolError(f"Unknown value kind {kind}")
+
+
+def _pack_envelope(msg: dict):
+    """Fixed-layout encoding of a standard message, or None if it does not fit."""
+    type_code = MESSAGE_TYPES.get(msg["type"])
+    if type_code is None:
+        return None
+    try:
+        flags = 0
+        sender, forwarder, receiver, message_id = msg["from"], msg["forward"], msg["to"], msg["message_id"]
+        b_from = _uuid_raw(sender) if len(sender) == 36 else b""
+        if b_from:
+            flags |= 0x01
+        else:
+            b_from = sender.encode("utf-8")
+        b_forward = _uuid_raw(forwarder) if len(forwarder) == 36 else b""
+        if b_forward:
+            flags |= 0x04
+        else:
+            b_forward = forwarder.encode("utf-8")
+        b_to = _uuid_raw(receiver) if len(receiver) == 36 else b""
+        if b_to:
+            flags |= 0x08
+        else:
+            b_to = receiver.encode("utf-8")
+        # message ids are unique: converting directly beats churning the cache
+        b_id = _uuid_to_raw(message_id) if len(message_id) == 36 else b""
+        if b_id:
+            flags |= 0x20
+        else:
+            b_id = message_id.encode("utf-8")
+        b_from_n = msg["from_n"].encode("utf-8")
+        b_to_n = msg["to_n"].encode("utf-8")
+
+        out = bytearray(_ENVELOPE.pack(
+            ENVELOPE_MARKER, type_code, msg["ttl"], msg["timestamp"], flags,
+            len(b_from), len(b_from_n), len(b_forward), len(b_to), len(b_to_n), len(b_id)
+        ))
+    except (AttributeError, TypeError, struct.error):
+        # non-string ids/names, ttl or timestamp out of range: use the tagged form
+        return None
+    out += b_from + b_from_n + b_forward + b_to + b_to_n + b_id
+    _pack_value(msg["content"], out)
+    return bytes(out)
+
+
+def _unpack_envelope(payload) -> dict:
+    _, type_code, ttl, ts, flags, n_from, n_from_n, n_forward, n_to, n_to_n, n_id = _ENVELOPE.unpack_from(payload, 0)
+    pos = _ENVELOPE.size
+    end = pos + n_from
+    sender = _uuid_str(payload[pos:end]) if flags & 0x01 else payload[pos:end].decode("utf-8")
+    pos, end = end, end + n_from_n
+    sender_name = payload[pos:end].decode("utf-8")
+    pos, end = end, end + n_forward
+    forwarder = _uuid_str(payload[pos:end]) if flags & 0x04 else payload[pos:end].decode("utf-8")
+    pos, end = end, end + n_to
+    receiver = _uuid_str(payload[pos:end]) if flags & 0x08 else payload[pos:end].decode("utf-8")
+    pos, end = end, end + n_to_n
+    receiver_name = payload[pos:end].decode("utf-8")
+    pos, end = end, end + n_id
+    message_id = _raw_to_uuid(payload[pos:end]) if flags & 0x20 else payload[pos:end].decode("utf-8")
+    content, pos = _unpack_value(payload, end)
+    if pos != len(payload):
+        raise ProtocolError("Truncated or trailing bytes in message envelope")
+    return {
+        "type": _TYPE_NAMES.get(type_code, type_code),
+        "from": sender,
+        "from_n": sender_name,
+        "forward": forwarder,
+        "to": receiver,
+        "to_n": receiver_name,
+        "message_id": message_id,
+        "content": content,
+        "ttl": ttl,
+        "timestamp": ts,
+    }
+
+
+def _binary_encode(msg: dict) -> bytes:
+    if msg.keys() == _ENVELOPE_KEYS:
+        packed = _pack_envelope(msg)
+        if packed is not None:
+            return packed
+    out = bytearray()
+    for key, value in msg.items():
+        tag = FIELD_TAGS.get(key)
+        if tag is None:
+            name = str(key).encode("utf-8")
+            out.append(_TAG_EXTRA)
+            _put_varint(out, len(name))
+            out += name
+        else:
+            out.append(tag)
+            if tag == 1 and type(value) is str and value in MESSAGE_TYPES:
+                value = MESSAGE_TYPES[value]
+        _pack_value(value, out)
+    return bytes(out)
+
+
+def _binary_decode(payload: bytes) -> dict:
+    msg = {}
+    pos, end = 0, len(payload)
+    try:
+        if end and payload[0] == ENVELOPE_MARKER:
+            return _unpack_envelope(payload)
+        while pos < end:
+            tag = payload[pos]
+            pos += 1
+            if tag == _TAG_EXTRA:
+                n, pos = _read_varint(payload, pos)
+                key = payload[pos:pos + n].decode("utf-8")
+                pos += n
+            else:
+                key = _TAG_FIELDS.get(tag)
+                if key is None:
+                    raise ProtocolError(f"Unknown field tag {tag}")
+            value, pos = _unpack_value(payload, pos)
+            if tag == 1 and type(value) is int:
+                value = _TYPE_NAMES.get(value, value)
+            msg[key] = value
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise ProtocolError(f"Corrupt binary payload: {e}") from e
+    if pos != end:
+        # a length ran past the end (slices do not raise)
+        raise ProtocolError("Truncated binary payload")
+    return msg
+
+
+def _json_encode(msg: dict) -> bytes:
+    return json.dumps(msg).encode("utf-8")
+
+
+def _json_decode(payload: bytes) -> dict:
+    return json.loads(payload.decode("utf-8"))
+
+
+# codec id -> (encode(dict) -> bytes, decode(bytes) -> dict)
+CODECS = {
+    CODEC_JSON: (_json_encode, _json_decode),
+    CODEC_BINARY: (_binary_encode, _binary_decode),
+}
+# what this node offers in HELLO, most preferred first
+SUPPORTED_CODECS = (CODEC_BINARY, CODEC_JSON)
+DEFAULT_CODEC = CODEC_BINARY
+
+
+def pack_message(msg: dict, codec=DEFAULT_CODEC, version=PROTOCOL_VERSION) -> bytes:
+    """Encode a message dict into a complete frame."""
+    try:
+        encode = CODECS[codec][0]
+    except KeyError:
+        raise ProtocolError(f"Unsupported codec {codec}")
+    attempt = 0
+    if "attempt" in msg:
+        # route header only, never part of the body
+        msg = dict(msg)
+        attempt = msg.pop("attempt") or 0
+    payload = encode(msg)
+    frame_type = MESSAGE_TYPES.get(msg.get("type"), FRAME_TYPE_UNKNOWN)
+    if version >= 2:
+        route = (msg.get("ttl"), msg.get("forward") or "")
+        if version >= 3:
+            route += (min(int(attempt), MAX_ATTEMPT),)
+        try:
+            return encode_frame(payload, frame_type, codec, route=route)
+        except (TypeError, ValueError, AttributeError, ProtocolError):
+            pass    # no usable ttl/forward: plain version 1 frame
+    return encode_frame(payload, frame_type, codec)
+
+
+def frame_type(frame) -> int:
+    return frame[3]
+
+
+def frame_codec(frame) -> int:
+    return frame[4]
+
+
+def frame_version(frame) -> int:
+    return frame[2]
+
+
+def transcode_frame(frame: bytes, codec, version=PROTOCOL_VERSION) -> bytes:
+    """Re-encode a message frame for a peer limited to `codec` / `version`."""
+    if frame[:len(FRAME_MAGIC)] != FRAME_MAGIC:
+        return frame
+    if frame_codec(frame) == codec and frame_version(frame) <= version:
+        return frame
+    return pack_message(decode_message(frame), codec, version)
+
+
+def encode_hello(payload: dict) -> bytes:
+    """Control frame for codec negotiation; always JSON so anyone can read it."""
+    return encode_frame(_json_encode(payload), FRAME_TYPE_HELLO, CODEC_JSON)
+
+
+def decode_hello(frame) -> dict:
+    _, _, payload = decode_frame(frame)
+    try:
+        hello = _json_decode(payload)
+    except ValueError as e:
+        raise ProtocolError(f"Bad HELLO: {e}") from e
+    return hello if isinstance(hello, dict) else {}
+
+
+def choose_version(offered) -> int:
+    """Highest protocol version both sides support (1 for old peers)."""
+    common = [v for v in SUPPORTED_VERSIONS if v in (offered or ())]
+    return max(common) if common else 1
+
+
+def choose_codec(offered) -> int:
+    """Best codec both sides support (JSON when nothing else matches)."""
+    for codec in SUPPORTED_CODECS:
+        if codec in (offered or ()):
+            return codec
+    return CODEC_JSON
+
+
+# ---------- messages ----------
+def encode_message(sender, receiver, content, forwarder="", sender_name="", receiver_name="", ttl=DEFAULT_TTL, message_type="MESSAGE", message_id=None, codec=DEFAULT_CODEC, attempt=0):
     # Ensure a new message_id is generated per call if not provided
     if message_id is None:
         message_id = str(uuid4())
 
-    en_msg_str = json.dumps({
+    msg = {
         "type": message_type,
         "from": sender,
         "from_n": sender_name,
@@ -18,9 +707,24 @@ def encode_message(sender, receiver, content, forwarder="", sender_name="", rece
         "content": content,
         "ttl": ttl,
         "timestamp": int(time.time())
-    })
-    print(en_msg_str)
-    return en_msg_str.encode("utf-8")
+    }
+    if attempt:
+        msg["attempt"] = attempt
+    return pack_message(msg, codec)
 
 def decode_message(data):
-    return json.loads(data.decode("utf-8"))
\ No newline at end of file
+    # Bare JSON (pre-framing peers / tools) is still accepted
+    if data[:len(FRAME_MAGIC)] != FRAME_MAGIC:
+        return json.loads(data.decode("utf-8"))
+    _, _, codec, route, payload = split_frame(data)
+    try:
+        decode = CODECS[codec][1]
+    except KeyError:
+        raise ProtocolError(f"Unsupported codec {codec}")
+    msg = decode(payload)
+    if route is not None:
+        msg["ttl"], msg["forward"] = route
+        attempt = frame_attempt(data)
+        if attempt:
+            msg["attempt"] = attempt
+    return msg
@@ -0,0 +1,17 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class NetworkBridge(QObject):
+    """Hands AsyncNetworkEngine events to the Qt side.
+
+    The engine emits these from its network thread; because the bridge lives
+    in the UI thread, Qt queues each emit there, so ChatManager handlers keep
+    running on the thread they always ran on. `invoke` carries a callable
+    to run there (engine timers, see AsyncNetworkEngine.call_later).
+    """
+    new_data = pyqtSignal(bytes)
+    connected = pyqtSignal(str)
+    disconnected = pyqtSignal(str)
+    peer_identified = pyqtSignal(dict)
+    status = pyqtSignal(str)
+    invoke = pyqtSignal(object)
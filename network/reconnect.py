@@ -0,0 +1,120 @@
+import random
+import time
+
+
+class _PeerState:
+    __slots__ = ("attempts", "up_since", "last_live", "parked", "next_delay")
+
+    def __init__(self):
+        self.attempts = 0           # failures since the last stable connection
+        self.up_since = None        # clock() when the current connection came up
+        self.last_live = None       # clock() when the peer was last connected
+        self.parked = False
+        self.next_delay = 0.0
+
+
+class ReconnectScheduler:
+    """Decides how long an outbound link waits before its next connect attempt.
+
+    Delays grow exponentially from `base` by `factor` up to `max_delay`. Each
+    delay is then drawn uniformly from [delay * (1 - jitter), delay], so nodes
+    that lost their neighbours at the same moment (a fleet restart) spread
+    their retries out instead of reconnecting in lockstep.
+
+    After `max_attempts` failures in a row the peer is parked: it is only
+    retried every `park_delay` seconds until it connects again or `wake` is
+    called (e.g. because the peer just connected to us).
+
+    A peer that was connected less than `live_window` seconds ago most
+    likely restarted or dropped briefly, so its delays are divided by
+    `live_boost` and it is never parked inside that window. The backoff only
+    starts over once a connection has stayed up for `stable_after` seconds,
+    so a peer that accepts and then drops us at once still backs off.
+
+    Only touched from the engine loop; not thread-safe.
+    """
+
+    def __init__(self, base=1.0, factor=2.0, max_delay=60.0, jitter=0.5, max_attempts=10,
+                 park_delay=300.0, live_window=60.0, live_boost=4.0, stable_after=10.0,
+                 rng=None, clock=time.monotonic):
+        if not 0.0 <= jitter <= 1.0:
+            raise ValueError("jitter must be between 0 and 1")
+        self.base = base
+        self.factor = factor
+        self.max_delay = max(max_delay, base)
+        # first exponent whose delay reaches max_delay; attempts are clamped
+        # to it so factor ** attempts cannot overflow for a peer that flaps
+        # for days
+        self._max_exponent = 0
+        while self._max_exponent < 1000 and base * factor ** self._max_exponent < self.max_delay:
+            self._max_exponent += 1
+        self.jitter = jitter
+        self.max_attempts = max_attempts
+        self.park_delay = park_delay
+        self.live_window = live_window
+        self.live_boost = live_boost
+        self.stable_after = stable_after
+        self._rng = rng if rng is not None else random.Random()
+        self._clock = clock
+        self._peers = {}
+
+    def connected(self, peer_id):
+        state = self._state(peer_id)
+        state.parked = False
+        state.next_delay = 0.0
+        state.up_since = state.last_live = self._clock()
+
+    def disconnected(self, peer_id):
+        """A connection dropped; reset the backoff if it had been stable."""
+        state = self._state(peer_id)
+        now = self._clock()
+        if state.up_since is not None and now - state.up_since >= self.stable_after:
+            state.attempts = 0
+        state.up_since = None
+        state.last_live = now
+
+    def failed(self, peer_id) -> float:
+        """Record a failed attempt (or a dropped link) and return the wait before the next one."""
+        state = self._state(peer_id)
+        state.attempts += 1
+        recently_live = state.last_live is not None and self._clock() - state.last_live < self.live_window
+
+        if (not recently_live and self.max_attempts is not None
+                and state.attempts >= self.max_attempts):
+            state.parked = True
+            delay = self.park_delay
+        else:
+            exponent = min(state.attempts - 1, self._max_exponent)
+            delay = min(self.base * self.factor ** exponent, self.max_delay)
+            if recently_live:
+                delay /= self.live_boost
+        delay *= 1.0 - self.jitter * self._rng.random()
+        state.next_delay = delay
+        return delay
+
+    def wake(self, peer_id):
+        """Unpark a peer and restart its backoff from the beginning."""
+        state = self._peers.get(peer_id)
+        if state is not None:
+            state.attempts = 0
+            state.parked = False
+
+    def forget(self, peer_id):
+        self._peers.pop(peer_id, None)
+
+    def is_parked(self, peer_id) -> bool:
+        state = self._peers.get(peer_id)
+        return state is not None and state.parked
+
+    def stats(self) -> dict:
+        return {
+            peer_id: {"attempts": s.attempts, "parked": s.parked, "next_delay": round(s.next_delay, 3)}
+            for peer_id, s in self._peers.items()
+        }
+
+    # ---------- internals ----------
+    def _state(self, peer_id):
+        state = self._peers.get(peer_id)
+        if state is None:
+            state = self._peers[peer_id] = _PeerState()
+        return state
@@ -0,0 +1,70 @@
+"""Headless peer chat node (relay / server use, no PyQt).
+
+Runs the same ChatManager core as the desktop app on a plain asyncio loop:
+
+    python node.py --config A.json
+    python -m node --config A.json --username relay_A
+"""
+import argparse
+import asyncio
+import signal
+from core.chat_manager import ChatManager
+from utils.config import Config
+from utils.logger import configure as configure_logging, parse_levels
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a headless peer chat node.")
+    parser.add_argument("--config", required=True, help="config file name in config/ (e.g. A.json) or a path")
+    parser.add_argument("--username", help="override the username from the config file")
+    parser.add_argument("--quiet", action="store_true", help="do not print status lines")
+    parser.add_argument("--log-level", help="root log level (default INFO, or PEERCHAT_LOG_LEVEL)")
+    parser.add_argument("--log-levels", help='per-module levels, e.g. "core.chat_manager=DEBUG,network=WARNING"')
+    parser.add_argument("--log-json", action="store_true", help="write log records as JSON lines")
+    parser.add_argument("--metrics-port", type=int, help="serve metrics on http://127.0.0.1:PORT/metrics")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(args.log_level, parse_levels(args.log_levels), fmt="json" if args.log_json else "text")
+
+    config = Config(args.config)
+    config.load_config()
+    if args.username:
+        config.username = args.username
+    if args.metrics_port is not None:
+        config.metrics_port = args.metrics_port
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    manager = ChatManager(config)
+    if not args.quiet:
+        manager.status.connect(print)
+    manager.message_received.connect(
+        lambda m: print(f"[MESSAGE] {m.get('from_n') or m.get('from')}: {m.get('content')}")
+    )
+
+    stop_event = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C still arrives as KeyboardInterrupt below
+            pass
+
+    print(f"[NODE] {config.username} ({config.peer_id}) on {config.ip}:{config.port}")
+    manager.start(loop=loop)
+    try:
+        loop.run_until_complete(stop_event.wait())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.stop()
+        loop.close()
+        print("[NODE] Stopped")
+
+
+if __name__ == "__main__":
+    main()
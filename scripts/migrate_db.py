@@ -18,7 +18,7 @@ def main():
         try:
             db = ChatDatabase(f)
             db.migrate()
-            db.conn.close()
+            db.close()
             print(f"  -> Migrated {f}")
         except Exception as e:
             print(f"  -> Failed to migrate {f}: {e}")
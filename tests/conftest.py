@@ -1,7 +1,150 @@
 import os
 import sys
 
+import pytest
+
 # Ensure the project root (one level up from tests/) is on sys.path so imports like `from core.db import ChatDatabase` work.
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+from core.chat_manager import ChatManager  # noqa: E402
+from network.protocol import decode_message  # noqa: E402
+
+
+# ---------- test doubles ----------
+class FakeClock:
+    """Manual clock: pass it as `clock=` and set `now`."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DummyConfig:
+    """What a ChatManager reads from its config; other settings as keywords."""
+
+    def __init__(self, tmp_path, name="A", port=0, **settings):
+        self.peer_id = f"node{name}"
+        self.username = f"user_{name}"
+        self.node = str(tmp_path / name)
+        self.ip = "127.0.0.1"
+        self.port = port
+        for key, value in settings.items():
+            setattr(self, key, value)
+
+
+class FakeLink:
+    """Stands in for a PeerLink and records what is sent on it.
+
+    Frames are decoded unless raw=True. A link that is not running refuses
+    them, like a PeerLink that is reconnecting.
+    """
+
+    def __init__(self, running=True, raw=False):
+        self.running = running
+        self.raw = raw
+        self.sent = []
+
+    def send(self, data, priority=False):
+        if not self.running:
+            return False
+        self.sent.append(data if self.raw else decode_message(data))
+        return True
+
+
+class Wire:
+    """In-memory links between ChatManagers; frames wait in `queue` until pump().
+
+    drop(src, dst, msg) returning True loses that frame on the way. With
+    sync=True every frame is handed over as soon as it is sent.
+    """
+
+    def __init__(self, drop=None, sync=False):
+        self.queue = []
+        self.drop = drop or (lambda src, dst, msg: False)
+        self.sync = sync
+
+    def connect(self, a, b):
+        a.clients[b.config.peer_id] = _WireLink(self, a, b)
+        b.clients[a.config.peer_id] = _WireLink(self, b, a)
+
+    def pump(self):
+        while self.queue:
+            src, dst, data = self.queue.pop(0)
+            if not self.drop(src.config.peer_id, dst.config.peer_id, decode_message(data)):
+                dst.handle_incoming(data)
+
+
+class _WireLink:
+    def __init__(self, wire, src, dst):
+        self.wire, self.src, self.dst = wire, src, dst
+        self.running = True
+        self.sent = []
+
+    def send(self, data, priority=False):
+        if not self.running:
+            return False
+        self.sent.append(decode_message(data))
+        self.wire.queue.append((self.src, self.dst, data))
+        if self.wire.sync:
+            self.wire.pump()
+        return True
+
+
+# ---------- fixtures ----------
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """make_config("B", **settings) -> DummyConfig for nodeB under tmp_path."""
+    def make(name="A", **settings):
+        return DummyConfig(tmp_path, name, **settings)
+    return make
+
+
+@pytest.fixture
+def make_manager(make_config):
+    """make_manager("B", **settings), or make_manager(config=...) to reuse one.
+
+    Every manager's database is closed at teardown.
+    """
+    managers = []
+
+    def make(name="A", config=None, **settings):
+        manager = ChatManager(config if config is not None else make_config(name, **settings))
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.db.close()
+
+
+@pytest.fixture
+def fake_link():
+    """FakeLink factory: decoded messages, fake_link(running=False) for a reconnecting one."""
+    return FakeLink
+
+
+@pytest.fixture
+def raw_link():
+    """FakeLink factory that keeps the raw frames."""
+    return lambda: FakeLink(raw=True)
+
+
+@pytest.fixture
+def wire():
+    """Queued in-memory links (Wire); set wire.drop to lose frames."""
+    return Wire()
+
+
+@pytest.fixture
+def sync_wire():
+    """In-memory links that deliver every frame as it is sent."""
+    return Wire(sync=True)
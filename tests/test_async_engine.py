@@ -0,0 +1,195 @@
+import socket
+import threading
+import time
+from network.async_engine import AsyncNetworkEngine
+from network.protocol import CODEC_BINARY, CODEC_JSON, decode_message, encode_message, frame_codec
+from network.reconnect import ReconnectScheduler
+
+
+class _Signal:
+    def __init__(self):
+        self.calls = []
+        self.event = threading.Event()
+
+    def emit(self, *args):
+        self.calls.append(args[0] if len(args) == 1 else args)
+        self.event.set()
+
+
+class _Bridge:
+    def __init__(self):
+        self.new_data = _Signal()
+        self.connected = _Signal()
+        self.disconnected = _Signal()
+        self.peer_identified = _Signal()
+        self.status = _Signal()
+        self.invoke = _Signal()
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_engines_exchange_many_frames_over_one_link():
+    bridge_a, bridge_b = _Bridge(), _Bridge()
+    a = AsyncNetworkEngine("127.0.0.1", 0, bridge_a)
+    b = AsyncNetworkEngine("127.0.0.1", 0, bridge_b)
+    a.start()
+    b.start()
+    try:
+        link = a.connect_peer("nodeB", "127.0.0.1", b.port)
+        assert bridge_a.connected.event.wait(5)
+        assert bridge_a.connected.calls == ["nodeB"]
+
+        # the HELLO answer switches the link from JSON to the binary codec
+        assert _wait_for(lambda: link.codec == CODEC_BINARY)
+
+        for i in range(2000):
+            assert link.send(encode_message("nodeA", "nodeB", f"hi {i}", message_id=str(i), codec=CODEC_JSON))
+
+        assert _wait_for(lambda: len(bridge_b.new_data.calls) == 2000)
+        ids = [decode_message(f)["message_id"] for f in bridge_b.new_data.calls]
+        assert ids == [str(i) for i in range(2000)]
+        assert {frame_codec(f) for f in bridge_b.new_data.calls} == {CODEC_BINARY}
+        assert bridge_b.peer_identified.calls[0]["peer_id"] == "nodeA"
+    finally:
+        a.stop()
+        b.stop()
+
+    assert not a._thread.is_alive()
+    assert not b._thread.is_alive()
+
+
+def test_link_reconnects_when_peer_comes_up_later():
+    bridge_a, bridge_b = _Bridge(), _Bridge()
+    b = AsyncNetworkEngine("127.0.0.1", 0, bridge_b)
+    b.start()
+    port = b.port
+    b.stop()
+
+    a = AsyncNetworkEngine("127.0.0.1", 0, bridge_a, retry_interval=0.05)
+    a.start()
+    b = AsyncNetworkEngine("127.0.0.1", port, bridge_b)
+    try:
+        link = a.connect_peer("nodeB", "127.0.0.1", port)
+        time.sleep(0.2)
+        assert not link.running
+        b.start()
+        assert _wait_for(lambda: link.running)
+    finally:
+        a.stop()
+        b.stop()
+
+
+def test_slow_peer_queue_is_bounded_and_does_not_delay_others():
+    # a "peer" that accepts connections but never reads
+    stalled = socket.socket()
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stalled.bind(("127.0.0.1", 0))
+    stalled.listen()
+
+    bridge_a, bridge_b = _Bridge(), _Bridge()
+    a = AsyncNetworkEngine("127.0.0.1", 0, bridge_a, queue_high=256 * 1024, queue_low=64 * 1024)
+    b = AsyncNetworkEngine("127.0.0.1", 0, bridge_b)
+    a.start()
+    b.start()
+    try:
+        slow = a.connect_peer("slow", "127.0.0.1", stalled.getsockname()[1])
+        fast = a.connect_peer("nodeB", "127.0.0.1", b.port)
+        assert _wait_for(lambda: slow.running and fast.running)
+
+        big = encode_message("nodeA", "slow", "x" * 60000)
+        accepted = sum(slow.send(big) for _ in range(1000))      # ~60 MB offered
+        for i in range(500):
+            assert fast.send(encode_message("nodeA", "nodeB", f"hi {i}", message_id=str(i)))
+
+        assert _wait_for(lambda: len(bridge_b.new_data.calls) == 500)
+        stats = a.link_stats()["slow"]
+        assert stats["queued_bytes"] <= 256 * 1024 + len(big)
+        assert slow.queued_bytes() >= len(big) > slow.queue_depth()    # bytes, not frames
+        assert stats["dropped_frames"] == 1000 - accepted > 0
+        # small frames to the fast peer were coalesced into fewer writes
+        assert a.link_stats()["nodeB"]["writes"] < 500
+
+        # priority frames still get in while the slow link is congested
+        assert slow.congested
+        assert slow.send(encode_message("nodeA", "slow", "handshake"), priority=True)
+    finally:
+        a.stop()
+        b.stop()
+        stalled.close()
+
+
+def test_parked_link_retries_as_soon_as_the_peer_dials_in():
+    bridge_a, bridge_b = _Bridge(), _Bridge()
+    b = AsyncNetworkEngine("127.0.0.1", 0, bridge_b)
+    b.start()
+    port = b.port
+    b.stop()
+
+    parked = ReconnectScheduler(base=0.01, max_attempts=1, park_delay=60)
+    a = AsyncNetworkEngine("127.0.0.1", 0, bridge_a, reconnect=parked)
+    a.start()
+    b = AsyncNetworkEngine("127.0.0.1", port, bridge_b)
+    try:
+        link = a.connect_peer("nodeB", "127.0.0.1", port)
+        assert _wait_for(lambda: parked.is_parked("nodeB"))
+        b.start()
+
+        # B comes back and talks to A first; A stops waiting out the park
+        back = b.connect_peer("nodeA", "127.0.0.1", a.port)
+        assert _wait_for(lambda: back.running)
+        back.send(encode_message("nodeB", "nodeA", "hello"))
+        assert _wait_for(lambda: link.running, timeout=3)
+        assert not parked.is_parked("nodeB")
+    finally:
+        a.stop()
+        b.stop()
+
+
+def test_write_error_drops_the_connection_and_the_link_reconnects():
+    bridge_a, bridge_b = _Bridge(), _Bridge()
+    a = AsyncNetworkEngine("127.0.0.1", 0, bridge_a, retry_interval=0.05)
+    b = AsyncNetworkEngine("127.0.0.1", 0, bridge_b)
+    a.start()
+    b.start()
+    try:
+        link = a.connect_peer("nodeB", "127.0.0.1", b.port)
+        assert _wait_for(lambda: link.running)
+
+        def broken(data):
+            raise ConnectionResetError("reset by peer")
+        link._writer.write = broken
+        link.send(encode_message("nodeA", "nodeB", "lost", message_id="m1"))
+
+        assert _wait_for(lambda: bridge_a.disconnected.calls == ["nodeB"])
+        assert any("write failed" in s for s in bridge_a.status.calls)
+        assert _wait_for(lambda: len(bridge_a.connected.calls) == 2 and link.running)
+        assert link.send(encode_message("nodeA", "nodeB", "after", message_id="m2"))
+        assert _wait_for(lambda: [decode_message(f)["message_id"] for f in bridge_b.new_data.calls] == ["m2"])
+    finally:
+        a.stop()
+        b.stop()
+
+
+def test_call_later_hands_the_callable_to_the_bridge_and_stop_cancels_pending():
+    bridge = _Bridge()
+    engine = AsyncNetworkEngine("127.0.0.1", 0, bridge)
+    assert not engine.call_later(0.01, lambda: None)      # no loop yet
+    engine.start()
+    try:
+        fire, never = (lambda: None), (lambda: None)
+        assert engine.call_later(0.01, fire)
+        engine.call_later(60, never)
+        assert bridge.invoke.event.wait(5)
+        assert bridge.invoke.calls == [fire]
+        assert _wait_for(lambda: len(engine._timers) == 1)
+    finally:
+        engine.stop()
+    assert not engine._timers
+    assert bridge.invoke.calls == [fire]
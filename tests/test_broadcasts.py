@@ -19,4 +19,4 @@ def test_get_broadcasts(tmp_path):
     assert receiver == ""
     assert content == "hello everyone"
 
-    db.conn.close()
\ No newline at end of file
+    db.close()
\ No newline at end of file
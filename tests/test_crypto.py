@@ -0,0 +1,39 @@
+import base64
+import pytest
+from crypto.encrypt import ENC_PREFIX, decrypt_many, decrypt_text, encrypt_many, encrypt_text, get_cipher
+
+
+KEY = bytes(range(32))
+
+
+def test_cipher_context_is_shared_and_round_trips():
+    assert get_cipher(KEY) is get_cipher(bytearray(KEY))
+
+    token = encrypt_text("xin chào", KEY)
+    assert token.startswith(ENC_PREFIX)
+    assert encrypt_text("xin chào", KEY) != token      # fresh nonce every time
+    assert decrypt_text(token, KEY) == "xin chào"
+    assert decrypt_text("plain", KEY) == "plain"
+
+    with pytest.raises(ValueError):
+        decrypt_text(token, bytes(32))
+    with pytest.raises(ValueError):
+        get_cipher(b"short")
+
+
+def test_batch_apis():
+    tokens = encrypt_many([f"m{i}" for i in range(10)], KEY)
+    assert decrypt_many(tokens, KEY) == [f"m{i}" for i in range(10)]
+    assert decrypt_many([tokens[0], ENC_PREFIX + "AAAA", "plain"], KEY) == ["m0", None, "plain"]
+
+
+def test_broadcast_encrypts_once_for_all_neighbours(make_manager, raw_link, monkeypatch):
+    monkeypatch.delenv("PEERCHAT_ENCRYPTION", raising=False)
+    monkeypatch.delenv("PEERCHAT_AES_KEY", raising=False)
+    manager = make_manager(encryption_enabled=True, aes_key=base64.b64encode(KEY).decode("ascii"))
+    manager.clients = {"nodeB": raw_link(), "nodeC": raw_link(), "nodeD": raw_link()}
+    manager.send_broadcast_message("hello all")
+
+    packets = [link.sent for link in manager.clients.values()]
+    assert all(len(p) == 1 for p in packets)
+    assert packets[0][0] == packets[1][0] == packets[2][0]
@@ -29,10 +29,68 @@ def test_save_and_get_conversation():
 
     finally:
         try:
-            db.conn.close()
+            db.close()
         except Exception:
             pass
         try:
             os.remove(db.db_path)
         except FileNotFoundError:
             pass
+
+
+def test_write_behind_batches_and_flushes_on_close(tmp_path):
+    db_file = str(tmp_path / "write_behind.db")
+    db = ChatDatabase(db_file, write_behind=True, batch_size=100, flush_interval=60)
+    db.reset_db()
+
+    for i in range(1000):
+        db.save_message(f"m{i}", "alice", "bob", f"msg {i}", sender_name="alice", receiver_name="bob")
+
+    # reads flush first, so our own writes are always visible
+    assert len(db.get_conversation("alice", "bob")) == 1000
+
+    for i in range(1000, 1250):
+        db.save_message(f"m{i}", "bob", "alice", f"msg {i}", sender_name="bob", receiver_name="alice")
+    db.close()
+
+    reopened = ChatDatabase(db_file)
+    try:
+        assert len(reopened.get_conversation("alice", "bob")) == 1250
+    finally:
+        reopened.close()
+
+
+def test_history_pages_walk_back_to_the_start(tmp_path):
+    db = ChatDatabase(str(tmp_path / "pages.db"))
+    db.reset_db()
+    for i in range(230):
+        if i % 2:
+            db.save_message(f"c{i}", "alice", "bob", f"msg {i}", sender_name="alice", receiver_name="bob")
+        else:
+            db.save_message(f"c{i}", "bob", "alice", f"msg {i}", sender_name="bob", receiver_name="alice")
+        db.save_message(f"b{i}", "alice", "", f"bc {i}", sender_name="alice", receiver_name="")
+    db.save_message("other", "alice", "carol", "not in this conversation")
+
+    pages, cursor = [], None
+    while True:
+        rows, cursor = db.get_conversation_page("alice", "bob", before=cursor, limit=50)
+        pages.insert(0, rows)
+        if cursor is None:
+            break
+    assert [len(p) for p in pages] == [30, 50, 50, 50, 50]
+    assert [r for p in pages for r in p] == [tuple(r) for r in db.get_conversation("alice", "bob")]
+
+    # notes to self: each row once, not once per direction
+    for i in range(3):
+        db.save_message(f"n{i}", "alice", "alice", f"note {i}", sender_name="alice", receiver_name="alice")
+    rows, cursor = db.get_conversation_page("alice", "alice", limit=2)
+    assert [r[2] for r in rows] == ["note 1", "note 2"]
+    rows, cursor = db.get_conversation_page("alice", "alice", before=cursor, limit=2)
+    assert [r[2] for r in rows] == ["note 0"] and cursor is None
+
+    rows, cursor = db.get_broadcasts_page(limit=100)
+    assert [r[5] for r in rows] == [f"bc {i}" for i in range(130, 230)]
+    rows, _ = db.get_broadcasts_page(before=cursor, limit=100)
+    assert rows[-1][5] == "bc 129"
+
+    db.close()
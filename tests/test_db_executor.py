@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from core.db import ChatDatabase
+from core.db_executor import DBExecutor
+
+
+def _executor(tmp_path, **kwargs):
+    def setup(conn):
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+    return DBExecutor(str(tmp_path / "x.db"), setup=setup, **kwargs)
+
+
+def _insert(conn, x):
+    conn.execute("INSERT INTO t VALUES (?)", (x,))
+    conn.commit()
+    return threading.current_thread().name
+
+
+def _values(conn):
+    return [r[0] for r in conn.execute("SELECT x FROM t ORDER BY rowid")]
+
+
+def test_writes_on_one_thread_reads_see_them(tmp_path):
+    ex = _executor(tmp_path)
+    try:
+        futures = [ex.submit_write(_insert, i) for i in range(20)]
+        # submitted after the writes: waits for them, runs on a reader
+        assert ex.submit_read(_values).result(5) == list(range(20))
+        assert {f.result() for f in futures} == {"peerchat-db-writer"}
+        assert threading.current_thread() is not ex._writer
+        with pytest.raises(sqlite3.OperationalError):
+            ex.read(_insert, 99)            # reader connections are read-only
+    finally:
+        ex.close()
+    with pytest.raises(RuntimeError):
+        ex.submit_read(_values)
+    ex.close()                              # idempotent
+
+
+def test_slow_read_does_not_hold_up_writes(tmp_path):
+    ex = _executor(tmp_path)
+    try:
+        ex.write(_insert, 1)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_read(conn):
+            cur = conn.execute("SELECT x FROM t")   # read transaction open
+            started.set()
+            release.wait(5)
+            return [r[0] for r in cur]
+
+        read = ex.submit_read(slow_read)
+        assert started.wait(5)
+        t0 = time.perf_counter()
+        ex.write(_insert, 2)
+        assert time.perf_counter() - t0 < 1.0
+        release.set()
+        assert read.result(5) == [1]                # snapshot from before the write
+        assert ex.read(_values) == [1, 2]
+    finally:
+        release.set()
+        ex.close()
+
+
+def test_failed_write_rolls_back(tmp_path):
+    ex = _executor(tmp_path)
+    try:
+        def half_done(conn):
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            ex.write(half_done)
+        ex.write(_insert, 2)
+        assert ex.read(_values) == [2]
+    finally:
+        ex.close()
+
+
+def test_chat_database_futures_and_write_behind(tmp_path):
+    db = ChatDatabase(str(tmp_path / "chat.db"), write_behind=True, batch_size=1000, flush_interval=60)
+    try:
+        for i in range(10):
+            db.save_message(f"m{i}", "alice", "bob", f"msg {i}")
+        page = db.submit(db.get_conversation_page, "alice", "bob", limit=5)
+        rows, cursor = page.result(5)
+        assert [r[2] for r in rows] == [f"msg {i}" for i in range(5, 10)] and cursor
+
+        done = db.submit(db.upsert_neighbor, "bob", "Bob", "127.0.0.1", 9000)
+        done.result(5)
+        assert db.submit(db.set_neighbor_status, "bob", 0).result(5) is True
+        assert db.get_neighbor("bob")["status"] == 0
+        assert db.get_username("bob") == "Bob"
+    finally:
+        db.close()
@@ -0,0 +1,53 @@
+import pytest
+from core.dedup import SeenCache
+
+
+def test_seen_counts_hits_and_misses(clock):
+    cache = SeenCache(capacity=100, ttl=60, clock=clock)
+    assert cache.seen("m1") is False
+    assert cache.seen("m1") is True
+    assert cache.seen("m2") is False
+    assert "m1" in cache
+    assert cache.stats() == {"size": 2, "capacity": 100, "hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_ids_expire_after_ttl(clock):
+    cache = SeenCache(capacity=100, ttl=60, buckets=4, clock=clock)
+    cache.seen("old")
+
+    clock.now = 30
+    assert "old" in cache
+    cache.seen("newer")
+
+    clock.now = 61
+    assert "old" not in cache
+    assert "newer" in cache
+    assert cache.evictions == 1
+
+
+def test_rotations_do_not_drift_with_lookup_times(clock):
+    cache = SeenCache(capacity=100, ttl=60, buckets=4, clock=clock)
+    cache.seen("old")
+    # each lookup lands just before the next slice boundary
+    for now in (29, 44, 59):
+        clock.now = now
+        assert "old" in cache
+
+    clock.now = 61
+    assert "old" not in cache
+
+
+def test_memory_stays_bounded_under_flood(clock):
+    cache = SeenCache(capacity=1000, ttl=3600, buckets=4, clock=clock)
+    for i in range(100_000):
+        cache.seen(f"msg-{i}")
+        assert len(cache) <= 1000
+
+    # most recent ids are still suppressed
+    assert cache.seen("msg-99999") is True
+    assert cache.evictions == 100_000 - len(cache)
+
+
+def test_capacity_must_cover_buckets():
+    with pytest.raises(ValueError):
+        SeenCache(capacity=2, buckets=4)
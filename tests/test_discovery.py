@@ -0,0 +1,124 @@
+import random
+from benchmarks.mesh import MemoryMesh, NodeConfig, _peer_ids, build_topology
+from core.chat_manager import ChatManager
+from core.discovery import PeerSampler, make_descriptor
+from network.protocol import encode_message
+
+
+def _d(i):
+    return {"peer_id": f"p{i}", "username": f"u{i}", "ip": "10.0.0.1", "port": 9000 + i}
+
+
+def test_descriptor_needs_a_connectable_endpoint():
+    assert make_descriptor(_d(1)) == _d(1)
+    assert make_descriptor(dict(_d(1), status=1, age=3)) == _d(1)
+    assert make_descriptor(dict(_d(1), ip="0.0.0.0")) is None
+    assert make_descriptor(dict(_d(1), port=0)) is None
+    assert make_descriptor("p1") is None
+
+
+def test_view_is_bounded_and_keeps_the_younger_copy():
+    s = PeerSampler(_d(0), view_size=4, shuffle_len=3, rng=random.Random(1))
+    assert s.merge([_d(i) for i in range(1, 4)]) is True
+    assert s.merge([_d(1)]) is False
+
+    s.start_round([])
+    assert s.view["p1"]["age"] == 1
+    s.merge([dict(_d(1), age=0), dict(_d(2), age=5)])
+    assert s.view["p1"]["age"] == 0 and s.view["p2"]["age"] == 1
+
+    s.merge([_d(i) for i in range(4, 10)])
+    assert len(s.view) == 4
+    assert len(s.members) == 9
+    assert len(s.sample_for("p1")) == 2
+    assert s.merge([_d(0)]) is False       # never ourselves
+
+
+def test_shuffle_replaces_what_was_sent_away():
+    s = PeerSampler(_d(0), view_size=3, shuffle_len=3, rng=random.Random(2))
+    s.merge([_d(1), _d(2), _d(3)])
+    sent = {d["peer_id"] for d in s.sample_for("p1")}
+    s.merge([_d(7), _d(8)], from_peer="p1")
+    assert set(s.view) == ({"p1", "p2", "p3"} - sent) | {"p7", "p8"}
+
+
+def test_membership_is_capped_and_expires(clock):
+    s = PeerSampler(_d(0), capacity=5, member_ttl=60, clock=clock)
+    s.merge([_d(i) for i in range(1, 9)])
+    assert [d["peer_id"] for d in s.member_list()] == ["p4", "p5", "p6", "p7", "p8"]
+    clock.now = 30
+    s.merge([_d(4)])
+    clock.now = 70
+    s.start_round([])
+    assert [d["peer_id"] for d in s.member_list()] == ["p4"]
+
+
+def test_find_nodes_is_answered_on_the_link_and_never_relayed(tmp_path, make_manager, fake_link):
+    manager = make_manager(config=NodeConfig(0, "nodeA", str(tmp_path), port=9000))
+    manager.clients = {"nodeB": fake_link(), "nodeC": fake_link()}
+    discovered = []
+    manager.update_discovered_peers.connect(discovered.append)
+
+    request = {"self": dict(_d(1), peer_id="nodeB"), "peers": [_d(5)]}
+    manager.handle_incoming(encode_message("nodeB", "nodeA", request, ttl=1, message_type="FIND_NODES"))
+    # an old-style flood relayed through C is answered back along the route only
+    manager.handle_incoming(encode_message("nodeD", "*", "", forwarder="nodeC", message_type="FIND_NODES"))
+
+    to_b = manager.clients["nodeB"].sent
+    assert [(m["type"], m["to"], m["ttl"]) for m in to_b] == [("FIND_ACK", "nodeB", 1)]
+    assert to_b[0]["content"]["self"]["peer_id"] == "nodeA"
+    assert all(m["type"] == "FIND_ACK" for m in manager.clients["nodeC"].sent)
+    assert {d["peer_id"] for d in discovered[-1]} == {"nodeB", "p5"}
+
+
+def _gossip_mesh(tmp_path, n, seed=0):
+    adjacency = build_topology("random", n, seed)
+    peer_ids = _peer_ids(n, seed)
+    configs = [NodeConfig(i, peer_ids[i], str(tmp_path), port=10000 + i) for i in range(n)]
+    managers = [ChatManager(c) for c in configs]
+    mesh = MemoryMesh(managers, adjacency, peer_ids, seed=seed)
+    for i, manager in enumerate(managers):
+        manager.discovery._rng = random.Random(seed * 1000 + i)
+        # what a real node loads from its neighbour table
+        manager.discovery.merge([vars(configs[j]) for j in adjacency[i]])
+    return managers, mesh
+
+
+def _run_rounds(managers, mesh, rounds):
+    for _ in range(rounds):
+        for manager in managers:
+            manager.gossip_round()
+        mesh.run()
+
+
+def test_gossip_cost_per_node_stays_flat_as_the_mesh_grows(tmp_path):
+    per_node = {}
+    for n in (20, 80):
+        workdir = tmp_path / str(n)
+        workdir.mkdir()
+        managers, mesh = _gossip_mesh(workdir, n)
+        try:
+            _run_rounds(managers, mesh, 5)
+            per_node[n] = mesh.frames / (n * 5)
+            assert mesh.errors == 0
+        finally:
+            for manager in managers:
+                manager.db.close()
+    # one request and one answer per partner (fewer on degree-1 nodes), whatever the size
+    fanout = managers[0].discovery.fanout
+    assert 2 * fanout - 0.25 <= per_node[80] <= 2 * fanout
+    assert 2 * fanout - 0.25 <= per_node[20] <= 2 * fanout
+
+
+def test_gossip_membership_converges(tmp_path):
+    n = 40
+    managers, mesh = _gossip_mesh(tmp_path, n, seed=4)
+    try:
+        _run_rounds(managers, mesh, 25)
+        coverage = [len(m.discovery.members) / (n - 1) for m in managers]
+        assert min(coverage) > 0.9
+        assert sum(coverage) / n > 0.97
+        assert all(len(m.discovery.view) <= m.discovery.view_size for m in managers)
+    finally:
+        for manager in managers:
+            manager.db.close()
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import subprocess
+import sys
+from core.db import ChatDatabase
+
+
+def test_chat_manager_imports_without_pyqt():
+    code = (
+        "import sys; import core.chat_manager; "
+        "sys.exit(1 if any(m.startswith('PyQt5') for m in sys.modules) else 0)"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 0
+
+
+def test_headless_nodes_exchange_message_on_one_loop(tmp_path, make_manager):
+    db = ChatDatabase(str(tmp_path / "B.db"))
+    db.reset_db()
+    db.close()
+
+    loop = asyncio.new_event_loop()
+    b = make_manager("B")
+    a = make_manager("A")
+    received = []
+    b.message_received.connect(received.append)
+
+    async def scenario():
+        b.start(loop=loop)
+        a.start(loop=loop)
+        while b.engine._server is None:
+            await asyncio.sleep(0.01)
+        a.init_client("nodeB", "127.0.0.1", b.engine.port)
+        while not a.clients["nodeB"].running:
+            await asyncio.sleep(0.01)
+        a.send_message("nodeB", "hello from A")
+        while not received:
+            await asyncio.sleep(0.01)
+
+    try:
+        loop.run_until_complete(asyncio.wait_for(scenario(), 5))
+    finally:
+        a.stop()
+        b.stop()
+        loop.close()
+
+    assert received[0]["content"] == "hello from A"
+    assert received[0]["from"] == "nodeA"
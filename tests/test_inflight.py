@@ -0,0 +1,115 @@
+from core.inflight import InflightTable
+from network.protocol import encode_message
+
+
+def test_rtt_estimate_and_karn_rule(clock):
+    table = InflightTable(initial_rto=3.0, min_rto=0.5, max_rto=30.0, clock=clock)
+    assert table.timeout("B") == 3.0 and table.rtt("B") is None
+
+    table.sent("B", "m1", 1)
+    clock.now = 0.2
+    assert table.acked("m1") == ("B", 0.2, 0.2)     # first sample: rttvar = rtt / 2
+    assert table.rtt("B") == 0.2
+    assert round(table.timeout("B"), 6) == 0.6    # srtt + 4 * rttvar
+    assert table.acked("m1") is None
+
+    # acknowledged after a retransmit: delivery time only, no RTT sample
+    table.sent("B", "m2", 2)
+    clock.now = 1.0
+    table.sent("B", "m2", 2)
+    clock.now = 1.1
+    dest, rtt, delivery = table.acked("m2")
+    assert rtt is None and round(delivery, 3) == 0.9
+    assert table.rtt("B") == 0.2
+
+
+def test_timeouts_back_off_and_give_up(clock):
+    table = InflightTable(initial_rto=1.0, max_rto=30.0, max_attempts=3, clock=clock)
+    table.sent("B", "m1", 1)
+    table.sent("C", "m2", 2)
+    assert table.next_deadline() == 1.0
+
+    clock.now = 1.0
+    assert table.expired() == [("B", "m1", 1), ("C", "m2", 2)]
+    table.sent("B", "m1", 1)                  # only m1 is re-sent
+    table.forget("m2")
+    assert table.next_deadline() == 2.0       # doubled
+    clock.now = 2.5
+    assert table.expired() == []
+    clock.now = 3.0
+    assert table.expired() == [("B", "m1", 1)]
+    table.sent("B", "m1", 1)
+    clock.now = 7.0
+    assert table.expired() == []              # third attempt timed out: given up
+    assert len(table) == 0 and table.given_up == 1 and table.timeouts == 4
+
+
+def test_only_lost_messages_are_retransmitted_and_rtt_is_recorded(make_manager, fake_link, clock):
+    cm = make_manager()
+    cm.inflight._clock = clock
+    link = cm.clients["nodeB"] = fake_link()
+    cm.routing.learn("nodeB", "nodeB", 1)
+
+    ids = [cm.send_message("nodeB", f"msg {i}") for i in range(3)]
+    assert len(link.sent) == 3 and len(cm.inflight) == 3
+
+    clock.now = 0.05
+    cm.handle_incoming(encode_message("nodeB", "nodeA", ids[0], message_type="ACK"))
+    cm.handle_incoming(encode_message("nodeB", "nodeA", ids[2], message_type="ACK"))
+
+    clock.now = 10
+    cm._retransmit_tick()
+    assert [m["message_id"] for m in link.sent[3:]] == [ids[1]]
+    cm.handle_incoming(encode_message("nodeB", "nodeA", ids[1], message_type="ACK"))
+
+    snap = cm.metrics.snapshot()
+    assert snap["peerchat_ack_rtt_seconds"]["peer=nodeB"]["count"] == 2
+    assert snap["peerchat_delivery_seconds"]["peer=nodeB"]["count"] == 3
+    assert snap["peerchat_retransmits_total"] == {"peer=nodeB": 1}
+    assert snap["peerchat_inflight"] == 0 and cm.outbox.pending() == 0
+
+
+def test_retransmit_timer_is_armed_once_the_engine_can_run_it(make_manager, fake_link):
+    cm = make_manager()
+    cm.clients["nodeB"] = fake_link()
+    cm.send_message("nodeB", "before start")
+    # no loop: call_later refused, so the timer is not marked as set
+    assert len(cm.inflight) == 1 and not cm._retransmit_scheduled
+
+    timers = []
+    cm.engine.call_later = lambda delay, fn: timers.append(fn) or True
+    cm.send_message("nodeB", "after start")
+    assert timers == [cm._retransmit_tick] and cm._retransmit_scheduled
+
+
+def test_retransmit_crosses_a_relay_that_saw_the_first_copy(make_manager, wire, clock):
+    lost = []
+
+    def drop(src, dst, msg):
+        # the relay's first copy to B is lost
+        if (src, dst, msg["type"]) == ("nodeR", "nodeB", "MESSAGE") and not lost:
+            lost.append(msg)
+            return True
+        return False
+
+    wire.drop = drop
+    a, r, b = (make_manager(p) for p in "ARB")
+    a.inflight._clock = clock
+    wire.connect(a, r)
+    wire.connect(r, b)
+    delivered = []
+    b.message_received.connect(delivered.append)
+
+    msg_id = a.send_message("nodeB", "over the relay")
+    wire.pump()
+    assert lost and not delivered and msg_id in a.inflight
+
+    clock.now = 10
+    a._retransmit_tick()
+    wire.pump()
+    assert [m["message_id"] for m in delivered] == [msg_id]
+    assert len(a.inflight) == 0 and a.outbox.pending() == 0
+
+    # a late duplicate is ACKed again but not delivered twice
+    b.handle_incoming(encode_message("nodeA", "nodeB", "again", message_id=msg_id, attempt=2))
+    assert len(delivered) == 1
@@ -0,0 +1,100 @@
+import io
+import json
+import logging
+import pytest
+from utils import logger as plog
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Loud:
+    """Counts how often it is formatted."""
+    calls = 0
+
+    def __repr__(self):
+        Loud.calls += 1
+        return "loud"
+
+
+@pytest.fixture
+def configured(monkeypatch):
+    monkeypatch.delenv("PEERCHAT_LOG_LEVEL", raising=False)
+    monkeypatch.delenv("PEERCHAT_LOG_LEVELS", raising=False)
+    stream = io.StringIO()
+    yield stream
+    plog.shutdown()
+    root = logging.getLogger(plog.ROOT)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.NOTSET)
+    root.propagate = True
+    for name in ("core.chat_manager", "network"):
+        plog.get_logger(name).setLevel(logging.NOTSET)
+
+
+def test_levels_per_module_and_lazy_formatting(configured):
+    plog.configure("INFO", {"core.chat_manager": "DEBUG", "network": "WARNING"}, stream=configured)
+    chat = plog.get_logger("core.chat_manager")
+    net = plog.get_logger("network.async_engine")
+
+    Loud.calls = 0
+    net.debug("never %r", Loud())
+    net.info("never %r", Loud())
+    assert Loud.calls == 0                      # filtered before formatting
+
+    chat.debug("received %r", Loud(), extra={"peer": "nodeB"})
+    net.warning("slow peer")
+    plog.shutdown()                             # drain the queue
+
+    lines = configured.getvalue().splitlines()
+    assert len(lines) == 2
+    assert "peerchat.core.chat_manager: received loud peer=nodeB" in lines[0]
+    assert lines[1].endswith("peerchat.network.async_engine: slow peer")
+
+
+def test_repeats_are_rate_limited_per_call_site():
+    clock = Clock()
+    limit = plog.RateLimitFilter(burst=3, window=10, clock=clock)
+    log = logging.getLogger("peerchat.test.ratelimit")
+
+    def record(i):
+        return log.makeRecord(log.name, logging.ERROR, "x.py", 7, "send failed %s", (i,), None)
+
+    passed = [limit.filter(record(i)) for i in range(100)]
+    assert passed.count(True) == 3 and limit.suppressed == 97
+
+    other = log.makeRecord(log.name, logging.ERROR, "x.py", 8, "other", (), None)
+    assert limit.filter(other)                  # different call site
+
+    clock.now = 11
+    summary = record(100)
+    assert limit.filter(summary)
+    assert "suppressed 97 similar" in summary.getMessage()
+
+
+def test_distinct_messages_from_one_site_are_not_limited_together():
+    limit = plog.RateLimitFilter(burst=2, window=10, clock=Clock())
+    log = logging.getLogger("peerchat.test.ratelimit")
+
+    def record(msg, level=logging.WARNING):
+        return log.makeRecord(log.name, level, "x.py", 7, msg, (), None)
+
+    assert [limit.filter(record("a")) for _ in range(3)] == [True, True, False]
+    assert limit.filter(record("b")) and limit.filter(record("c"))
+    assert all(limit.filter(record("a", logging.DEBUG)) for _ in range(10))
+    assert limit.suppressed == 1
+
+
+def test_json_output(configured):
+    plog.configure("INFO", fmt="json", stream=configured, use_queue=False)
+    plog.get_logger("core.db").error("flush failed: %s", "disk full", extra={"rows": 3})
+    out = json.loads(configured.getvalue())
+    assert out["logger"] == "peerchat.core.db"
+    assert out["msg"] == "flush failed: disk full"
+    assert out["rows"] == 3
@@ -0,0 +1,47 @@
+from benchmarks.mesh import TOPOLOGIES, build_topology, make_workload, run_loopback, run_memory
+
+
+def _connected(adjacency):
+    seen, stack = {0}, [0]
+    while stack:
+        for nxt in adjacency[stack.pop()]:
+            if nxt not in seen:
+                seen.add(nxt)
+                stack.append(nxt)
+    return len(seen) == len(adjacency)
+
+
+def test_topologies_are_connected_and_seeded():
+    for name in TOPOLOGIES:
+        adjacency = build_topology(name, 25, seed=3)
+        assert len(adjacency) == 25 and _connected(adjacency), name
+        assert build_topology(name, 25, seed=3) == adjacency
+    assert all(len(n) == 2 for n in build_topology("ring", 10))
+    assert build_topology("random", 40, seed=1) != build_topology("random", 40, seed=2)
+
+
+def test_memory_mesh_is_reproducible(tmp_path):
+    workload = make_workload(12, 60, rate=100, broadcast_ratio=0.2, seed=5)
+    first = run_memory(12, "scale-free", workload, seed=5, workdir=str(tmp_path / "a"))
+    second = run_memory(12, "scale-free", workload, seed=5, workdir=str(tmp_path / "b"))
+
+    assert first["delivery_ratio"] == 1.0
+    assert first["duplicate_deliveries"] == 0 and first["errors"] == 0
+    for key in ("delivered", "frames", "redundant_frames", "latency_ms", "simulated_s"):
+        assert first[key] == second[key], key
+
+
+def test_lossy_links_lower_the_delivery_ratio(tmp_path):
+    workload = make_workload(10, 40, rate=100, seed=1)
+    report = run_memory(10, "ring", workload, seed=1, loss=0.5, workdir=str(tmp_path))
+    assert report["lost_frames"] > 0
+    assert report["delivery_ratio"] < 1.0
+    # ACK timers run on the simulated clock: lost direct messages are re-sent
+    assert report["retransmits"] > 0
+
+
+def test_loopback_mesh_delivers(tmp_path):
+    workload = make_workload(4, 20, rate=200, broadcast_ratio=0.25, seed=2)
+    report = run_loopback(4, "ring", workload, seed=2, workdir=str(tmp_path))
+    assert report["delivery_ratio"] == 1.0
+    assert report["latency_ms"]["p50"] is not None
@@ -0,0 +1,68 @@
+import json
+import urllib.request
+import pytest
+from core.metrics import MetricsRegistry, MetricsServer
+from network.protocol import encode_message
+
+
+def test_registry_snapshot_and_prometheus_text():
+    registry = MetricsRegistry()
+    frames = registry.counter("frames_total", "Frames", ("type",))
+    frames.labels("MESSAGE").inc()
+    frames.labels("MESSAGE").inc(2)
+    frames.labels("FIND_NODES").inc()
+    depth = registry.gauge("depth", "Queue depth", ("peer",), fn=lambda: {"nodeB": 7})
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.001, 0.01))
+    for v in (0.0005, 0.002, 0.002, 0.5):
+        latency.observe(v)
+
+    assert registry.counter("frames_total") is frames
+    with pytest.raises(ValueError):
+        registry.gauge("frames_total")
+    assert depth.samples() == [(("nodeB",), 7)]
+
+    snap = registry.snapshot()
+    assert snap["frames_total"] == {"type=MESSAGE": 3, "type=FIND_NODES": 1}
+    assert snap["depth"] == {"peer=nodeB": 7}
+    assert snap["latency_seconds"]["count"] == 4
+    assert snap["latency_seconds"]["p50"] == 0.01
+
+    text = registry.render()
+    assert "# TYPE frames_total counter" in text
+    assert 'frames_total{type="MESSAGE"} 3' in text
+    assert 'latency_seconds_bucket{le="0.001"} 1' in text
+    assert 'latency_seconds_bucket{le="0.01"} 3' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in text
+    assert "latency_seconds_count 4" in text
+
+
+def test_chat_manager_counts_traffic_and_serves_it(make_manager, raw_link):
+    manager = make_manager()
+    server = None
+    try:
+        manager.clients = {"nodeB": raw_link(), "nodeC": raw_link()}
+        frame = encode_message("nodeB", "*", "hi all", message_id="m1")
+        manager.handle_incoming(frame)
+        manager.handle_incoming(frame)           # duplicate
+        manager.send_broadcast_message("hello")
+        manager.db.flush()
+
+        snap = manager.metrics.snapshot()
+        assert snap["peerchat_messages_in_total"] == {"type=MESSAGE": 2}
+        assert snap["peerchat_messages_deduped_total"] == {"type=MESSAGE": 1}
+        assert snap["peerchat_messages_forwarded_total"] == {"type=MESSAGE": 1}
+        assert snap["peerchat_messages_out_total"] == {"type=MESSAGE": 1}
+        assert snap["peerchat_wire_bytes_in_total"] == 2 * len(frame)
+        assert snap["peerchat_seen_cache_size"] == 2
+        assert snap["peerchat_decode_seconds"]["count"] == 2
+        assert snap["peerchat_db_rows_written_total"] == 2
+
+        server = MetricsServer(manager.metrics).start()
+        base = f"http://127.0.0.1:{server.port}"
+        text = urllib.request.urlopen(base + "/metrics", timeout=5).read().decode()
+        assert 'peerchat_messages_in_total{type="MESSAGE"} 2' in text
+        scraped = json.loads(urllib.request.urlopen(base + "/metrics.json", timeout=5).read())
+        assert scraped["peerchat_messages_deduped_total"] == {"type=MESSAGE": 1}
+    finally:
+        if server is not None:
+            server.stop()
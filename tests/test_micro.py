@@ -0,0 +1,25 @@
+from benchmarks.micro import compare, measure, run
+
+
+def test_measure_and_run_a_case():
+    calls = []
+    best, median = measure(lambda: calls.append(1), min_time=0.01, repeat=3)
+    assert 0 < best <= median
+    assert calls
+
+    results = run("protocol.decode_message.json", min_time=0.01, repeat=2)
+    assert list(results) == ["protocol.decode_message.json"]
+    assert results["protocol.decode_message.json"]["best_us"] > 0
+
+
+def test_limited_case_never_exceeds_its_fixture():
+    items = iter(range(50))
+    best, _ = measure(lambda: next(items), min_time=1.0, repeat=3, limit=50)
+    assert best > 0                     # StopIteration would have escaped
+
+
+def test_compare_flags_regressions():
+    baseline = {"a": {"best_us": 10.0}, "b": {"best_us": 10.0}, "c": {"best_us": 10.0}}
+    results = {"a": {"best_us": 13.0}, "b": {"best_us": 10.5}, "c": {"best_us": 5.0}, "d": {"best_us": 1.0}}
+    verdicts = {row[0]: row[4] for row in compare(results, baseline, threshold=0.2)}
+    assert verdicts == {"a": "REGRESSION", "b": "ok", "c": "faster", "d": "new"}
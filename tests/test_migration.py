@@ -40,4 +40,52 @@ def test_migrate_adds_id_and_backfills(tmp_path):
     assert rows[0][1] is not None and rows[0][1] != ""
     assert rows[0][2] is not None
 
-    db.conn.close()
\ No newline at end of file
+    db.close()
+
+def test_migrate_v2_adds_keys_indexes_and_wal(tmp_path):
+    db_file = tmp_path / "test_v1.db"
+
+    conn = sqlite3.connect(str(db_file))
+    conn.execute("""
+        CREATE TABLE messages (
+            id VARCHAR(36), sender TEXT, sender_name TEXT, receiver TEXT, receiver_name TEXT,
+            content TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, is_sent INTEGER DEFAULT 1
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE neighbor (
+            peer_id TEXT, username TEXT, ip TEXT NOT NULL, port INTEGER NOT NULL,
+            last_seen DATETIME DEFAULT CURRENT_TIMESTAMP, status INTEGER DEFAULT 1, is_neighbor INTEGER DEFAULT 1
+        )
+    """)
+    conn.execute("INSERT INTO messages (id, sender, receiver, content) VALUES ('m1', 'alice', 'bob', 'hi')")
+    conn.execute("INSERT INTO messages (id, sender, receiver, content) VALUES ('m1', 'alice', 'bob', 'hi again')")
+    conn.execute("INSERT INTO neighbor (peer_id, username, ip, port) VALUES ('peer1', 'old', '127.0.0.1', 8080)")
+    conn.execute("INSERT INTO neighbor (peer_id, username, ip, port) VALUES ('peer1', 'new', '127.0.0.1', 8080)")
+    conn.commit()
+    conn.close()
+
+    db = ChatDatabase(str(db_file))
+    cur = db.conn.cursor()
+
+    assert cur.execute("PRAGMA user_version").fetchone()[0] == 4
+    assert [r[5] for r in db.search_messages("hi")[0]] == ["hi"]     # history indexed
+    assert cur.execute("SELECT COUNT(*) FROM outbox").fetchone()[0] == 0
+    assert cur.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    pk_cols = [r[1] for r in cur.execute("PRAGMA table_info(messages)") if r[5]]
+    assert pk_cols == ["id"]
+    assert cur.execute("SELECT content FROM messages").fetchall() == [("hi",)]
+    assert db.get_neighbor("peer1")["username"] == "new"
+
+    # upsert now relies on the unique peer_id
+    db.upsert_neighbor("peer1", "newer", "127.0.0.1", 8081, status=0)
+    assert cur.execute("SELECT COUNT(*) FROM neighbor").fetchone()[0] == 1
+
+    plan = " ".join(r[3] for r in cur.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM messages WHERE sender = 'a' AND receiver = 'b' ORDER BY timestamp"))
+    assert "idx_messages_conversation" in plan
+    plan = " ".join(r[3] for r in cur.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM messages WHERE receiver = '' OR receiver IS NULL ORDER BY timestamp"))
+    assert "idx_messages_broadcast" in plan
+
+    db.close()
@@ -5,7 +5,6 @@ from core.db import ChatDatabase
 
 def test_active_removes_and_db_status(tmp_path):
     # Prepare a db and config
-    db_file = tmp_path / "nodeA.db"
     cfg_file = tmp_path / "A.json"
 
     # Minimal config object
@@ -13,23 +12,26 @@ def test_active_removes_and_db_status(tmp_path):
         def __init__(self):
             self.peer_id = "nodeA"
             self.username = "user_A"
-            self.node = "A"
+            self.node = str(tmp_path / "A")
             self.ip = "127.0.0.1"
             self.port = 8080
 
     cfg = DummyConfig()
 
-    db = ChatDatabase(str(db_file))
+    # ChatManager opens <node>.db and loads its neighbors once, at startup
+    db = ChatDatabase(str(tmp_path / "A.db"))
     db.reset_db()
 
     # Insert neighbor entry
     db.upsert_neighbor("peer1", "user_B", "127.0.0.1", 8081, status=0)
+    db.close()
 
     cm = ChatManager(cfg)
-    cm.db = db
+    db = cm.db
 
     # Simulate adding active peer
     cm.add_active_peer("peer1")
+    assert cm.peers.get("peer1")["status"] == 1
     neighbors = db.get_neighbors()
     # peer1 should now be status=1
     peer = [p for p in neighbors if p["peer_id"] == "peer1"][0]
@@ -37,8 +39,10 @@ def test_active_removes_and_db_status(tmp_path):
 
     # Simulate removing active peer
     cm.remove_active_peer("peer1")
+    assert cm.peers.get("peer1")["status"] == 0
     neighbors = db.get_neighbors()
     peer = [p for p in neighbors if p["peer_id"] == "peer1"][0]
     assert peer["status"] == 0
+    assert peer["username"] == "user_B" and peer["port"] == 8081
 
-    db.conn.close()
\ No newline at end of file
+    db.close()
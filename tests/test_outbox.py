@@ -0,0 +1,184 @@
+from core.db import ChatDatabase
+from core.outbox import Outbox
+from network.protocol import encode_message
+
+
+def _send_all(outbox, dest, limit=100):
+    ids = []
+    for seq, msg_id, frame in outbox.next_batch(dest, limit):
+        outbox.mark_sent(dest, seq)
+        ids.append(msg_id)
+    return ids
+
+
+def _blocking_calls(db):
+    """Names of blocking DB calls made from outside the DB threads."""
+    calls = []
+    for name in ("read", "write"):
+        def call(fn, *args, _name=name, _orig=getattr(db.executor, name), **kwargs):
+            if not db.executor.on_executor():
+                calls.append(_name)
+            return _orig(fn, *args, **kwargs)
+        setattr(db.executor, name, call)
+    return calls
+
+
+def test_queue_is_in_memory_written_through_and_survives_a_restart(tmp_path):
+    db = ChatDatabase(str(tmp_path / "o.db"))
+    try:
+        box = Outbox(db, burst=100)
+        blocking = _blocking_calls(db)
+        for i in range(10):
+            assert box.put("B", f"m{i}", f"frame {i}".encode())
+        assert not box.put("B", "m0", b"again")
+        assert box.pending("B") == 10
+
+        assert _send_all(box, "B", 6) == [f"m{i}" for i in range(6)]
+        assert _send_all(box, "B") == [f"m{i}" for i in range(6, 10)]
+        assert not box.has_unsent("B") and box.frame("m9") == b"frame 9"
+
+        submitted = []
+        submit = db.submit
+        db.submit = lambda fn, *args: submitted.append(fn.__name__) or submit(fn, *args)
+        for i in (0, 1, 2, 9):
+            assert box.ack(f"m{i}")
+        assert submitted == ["outbox_remove"] * 4
+        # relayed / duplicate ACKs are answered from memory
+        assert not box.ack("m9") and not box.ack("someone-else")
+        assert len(submitted) == 4
+        del db.submit
+        assert box.pending("B") == 6
+        assert blocking == []                # the network path never waited on SQLite
+
+        restarted = Outbox(db, burst=100)
+        restarted.load()
+        assert restarted.pending() == 6
+        # may have gone out before the restart: counted as a re-send
+        assert restarted.next_attempt("m3", 1) == 1 and restarted.next_attempt("m3", 1) == 2
+        assert _send_all(restarted, "B") == [f"m{i}" for i in range(3, 9)]
+        assert restarted.frame("m3") == b"frame 3"
+        restarted.put("B", "new", b"frame new")
+        assert restarted.next_attempt("new", 7) == 0
+    finally:
+        db.close()
+
+
+def test_rate_limit_and_rewind(tmp_path, clock):
+    db = ChatDatabase(str(tmp_path / "o.db"))
+    try:
+        box = Outbox(db, rate=10, burst=3, clock=clock)
+        for i in range(5):
+            box.put("B", f"m{i}", b"x")
+
+        assert _send_all(box, "B") == ["m0", "m1", "m2"]
+        assert box.next_batch("B", 10) == [] and box.wait_time("B") == 0.1
+        clock.now = 0.1
+        assert _send_all(box, "B") == ["m3"]
+
+        box.ack("m0")
+        box.rewind("B")
+        clock.now = 1
+        assert _send_all(box, "B") == ["m1", "m2", "m3"]
+        assert box.resent == 3
+        assert box.frame("m1") == b"x" and box.frame("m0") is None
+    finally:
+        db.close()
+
+
+def test_old_entries_expire_at_runtime_and_relayed_frames_are_capped(tmp_path, clock):
+    db = ChatDatabase(str(tmp_path / "o.db"))
+    try:
+        box = Outbox(db, max_age=60, relay_cap=2, clock=clock)
+        box.put("B", "old", b"x")
+        box.hold("C", "e2e", "not sealed yet")
+        clock.now = 30
+        box.put("B", "new", b"y")
+        clock.now = 61
+        # the stale frame never goes out, and the sweep takes the held text too
+        assert _send_all(box, "B") == ["new"]
+        assert box.expire() == 1 and box.expired == 2
+        assert box.frame("old") is None and box.unsealed("C") == []
+
+        for i in range(3):
+            assert box.put("D", f"r{i}", b"z", relayed=True)
+        box.put("D", "own", b"mine")
+        assert box.dropped == 1 and box.frame("r0") is None
+        assert [m for _, m, _ in box.next_batch("D", 10)] == ["r1", "r2", "own"]
+
+        # relayed frames were never written: a restart only has our own
+        assert [row[1] for row in db.outbox_rows()] == ["new", "own"]
+    finally:
+        db.close()
+
+
+def test_offline_message_is_delivered_when_the_peer_comes_back(make_manager, fake_link):
+    cm = make_manager()
+    statuses = []
+    cm.status.connect(statuses.append)
+    msg_id = cm.send_message("nodeB", "are you there?")
+    assert msg_id and cm.outbox.pending("nodeB") == 1
+    assert "queued" in statuses[-1]
+
+    link = cm.clients["nodeB"] = fake_link()
+    cm.add_active_peer("nodeB")
+    assert [(m["type"], m["message_id"]) for m in link.sent] == [("MESSAGE", msg_id)]
+
+    # reconnect before the ACK: the same frame goes out again
+    cm.add_active_peer("nodeB")
+    assert [m["message_id"] for m in link.sent] == [msg_id, msg_id]
+
+    cm.handle_incoming(encode_message("nodeB", "nodeA", msg_id, message_type="ACK"))
+    assert cm.outbox.pending() == 0
+    assert cm.metrics.snapshot()["peerchat_outbox_acked_total"] == 1
+
+
+def test_receiver_acks_every_copy_and_relay_holds_for_a_reconnecting_neighbour(make_manager, fake_link):
+    cm = make_manager()
+    b, c = fake_link(), fake_link(running=False)
+    cm.clients = {"nodeB": b, "nodeC": c}
+
+    frame = encode_message("nodeB", "nodeA", "hi", message_id="m1")
+    cm.handle_incoming(frame)
+    cm.handle_incoming(frame)            # retransmitted
+    assert [(m["type"], m["content"]) for m in b.sent] == [("ACK", "m1"), ("ACK", "m1")]
+
+    cm.handle_incoming(encode_message("nodeB", "nodeC", "for C", message_id="m2"))
+    assert cm.outbox.pending("nodeC") == 1 and c.sent == []
+    c.running = True
+    cm.add_active_peer("nodeC")
+    assert [(m["message_id"], m["forward"]) for m in c.sent] == [("m2", "nodeA")]
+
+    # C's answer to B passes through us: our copy is done too
+    cm.handle_incoming(encode_message("nodeC", "nodeB", "m2", message_type="ACK"))
+    assert cm.outbox.pending() == 0
+
+
+def test_reconnect_resends_through_a_relay_that_saw_the_first_copy(make_manager, wire):
+    lost = []
+
+    def drop(src, dst, msg):
+        if (src, dst, msg["type"]) == ("nodeR", "nodeB", "MESSAGE") and not lost:
+            lost.append(msg)
+            return True
+        return False
+
+    wire.drop = drop
+    a, r, b = (make_manager(p) for p in "ARB")
+    wire.connect(a, r)
+    wire.connect(r, b)
+    delivered = []
+    b.message_received.connect(delivered.append)
+
+    msg_id = a.send_message("nodeB", "held for later")
+    wire.pump()
+    assert lost and not delivered
+    a.inflight.forget(msg_id)            # retries given up
+
+    link = a.clients["nodeR"]
+    link.running = False
+    a.remove_active_peer("nodeR")
+    link.running = True
+    a.add_active_peer("nodeR")
+    wire.pump()
+    assert [m["message_id"] for m in delivered] == [msg_id]
+    assert a.outbox.pending() == 0
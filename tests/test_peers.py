@@ -0,0 +1,74 @@
+from core.db import ChatDatabase
+from core.peers import PeerDirectory
+from network.protocol import encode_message
+
+
+def _count_reads(db):
+    calls = []
+    submit_read = db.executor.submit_read
+    db.executor.submit_read = lambda *a, **kw: calls.append(a) or submit_read(*a, **kw)
+    return calls
+
+
+def test_lookups_stay_in_memory_and_changes_write_through(tmp_path):
+    db = ChatDatabase(str(tmp_path / "p.db"))
+    try:
+        db.upsert_neighbor("peer1", "alice", "10.0.0.1", 9001, status=0)
+        db.upsert_neighbor("peer2", "bob", "10.0.0.2", 9002, status=1)
+        peers = PeerDirectory(db)
+        peers.load()
+        events = []
+        peers.changed.connect(lambda peer_id, peer: events.append((peer_id, peer and peer["username"])))
+
+        reads = _count_reads(db)
+        assert peers.username("peer1") == "alice"
+        assert peers.username("unknown-peer") == "unknown-"
+        assert peers.by_endpoint("10.0.0.2", "9002")["peer_id"] == "peer2"
+        assert [p["peer_id"] for p in peers.neighbors()] == ["peer2", "peer1"]   # online first
+
+        peers.set_status("peer1", 1)
+        peers.upsert("peer2", "bobby", "10.0.0.9", 9009, status=1)       # moved and renamed
+        peers.upsert("peer3", "carol", "10.0.0.3", 9003)
+        assert peers.rename("peer3", "carol") is False                     # no change, no event
+        assert reads == []
+        assert peers.by_endpoint("10.0.0.2", 9002) is None
+        assert peers.by_endpoint("10.0.0.9", 9009)["username"] == "bobby"
+        assert events == [("peer1", "alice"), ("peer2", "bobby"), ("peer3", "carol")]
+
+        # the DB caught up in the background; a fresh directory sees the same state
+        again = PeerDirectory(db)
+        again.load()
+        for peer_id in ("peer1", "peer2", "peer3"):
+            mine, theirs = peers.get(peer_id), again.get(peer_id)
+            assert (mine["username"], mine["ip"], mine["port"], mine["status"]) == \
+                   (theirs["username"], theirs["ip"], theirs["port"], theirs["status"])
+        # copies: callers can't bypass the indexes
+        peers.get("peer1")["username"] = "mallory"
+        assert peers.username("peer1") == "alice"
+    finally:
+        db.close()
+
+
+def test_incoming_names_and_gossip_renames_use_the_directory(tmp_path, make_manager):
+    seed = ChatDatabase(str(tmp_path / "A.db"))
+    seed.upsert_neighbor("nodeB", "user_B", "127.0.0.1", 9002)
+    seed.close()
+
+    manager = make_manager()
+    shown = []
+    manager.update_peers.connect(lambda peers: shown.append([p["username"] for p in peers]))
+    manager.add_active_peer("nodeB")
+    reads = _count_reads(manager.db)
+
+    manager.handle_incoming(encode_message("nodeB", "nodeA", "hi", message_id="m1"))
+    # the neighbour announces a new name in its own gossip descriptor
+    manager._merge_discovered(
+        {"self": {"peer_id": "nodeB", "username": "Bee", "ip": "127.0.0.1", "port": 9002}},
+        from_peer="nodeB",
+    )
+    assert reads == []
+    assert shown[-1] == ["Bee"]
+    assert manager.peers.username("nodeB") == "Bee"
+    assert manager.db.get_neighbor("nodeB")["username"] == "Bee"
+    rows = manager.db.get_conversation("nodeB", "nodeA")
+    assert rows[0][4] == "Bee"          # history resolves names through the neighbor table
@@ -31,17 +31,20 @@ def test_propagate_names_from_upsert(tmp_path):
     row = cur.fetchone()
     assert row is not None
 
-    # Upsert neighbor and expect propagation into messages (should overwrite/backfill)
-    db.upsert_neighbor("peer1", "Alice", "127.0.0.1", 8080, status=1)
+    stored_name = row[0]
 
-    cur.execute("SELECT sender_name FROM messages WHERE id = 'm1'")
-    row = cur.fetchone()
-    assert row[0] == "Alice"
+    # Upsert neighbor: reads resolve the new name through the neighbor table
+    db.upsert_neighbor("peer1", "Alice", "127.0.0.1", 8080, status=1)
+    conv = db.get_conversation("peer1", "peer2")
+    assert conv[0][4] == "Alice"
 
-    # Change username and ensure messages are updated
+    # Change username and ensure reads follow it
     db.upsert_neighbor("peer1", "Alice2", "127.0.0.1", 8080, status=1)
+    conv = db.get_conversation("peer1", "peer2")
+    assert conv[0][4] == "Alice2"
+
+    # ... without rewriting the stored history row
     cur.execute("SELECT sender_name FROM messages WHERE id = 'm1'")
-    row = cur.fetchone()
-    assert row[0] == "Alice2"
+    assert cur.fetchone()[0] == stored_name
 
-    db.conn.close()
\ No newline at end of file
+    db.close()
@@ -0,0 +1,148 @@
+import pytest
+from network.protocol import (
+    CODEC_BINARY,
+    CODEC_JSON,
+    FRAME_HEADER,
+    FrameDecoder,
+    ProtocolError,
+    choose_codec,
+    decode_message,
+    encode_frame,
+    encode_message,
+    forward_frame,
+    frame_attempt,
+    frame_codec,
+    frame_version,
+    retry_frame,
+    split_frame,
+    pack_message,
+    transcode_frame,
+)
+
+
+def test_decoder_handles_coalesced_and_split_frames():
+    packets = [encode_message("alice", "bob", f"msg {i}", message_id=f"m{i}") for i in range(50)]
+    stream = b"".join(packets)
+
+    decoder = FrameDecoder()
+    frames = []
+    # Feed in awkward chunk sizes so frames are both split and coalesced
+    for i in range(0, len(stream), 7):
+        frames.extend(decoder.feed(stream[i:i + 7]))
+
+    assert decoder.pending() == 0
+    assert [decode_message(f)["message_id"] for f in frames] == [f"m{i}" for i in range(50)]
+
+
+def test_large_message_roundtrip():
+    content = "x" * 200_000
+    packet = encode_message("alice", "bob", content)
+
+    decoder = FrameDecoder()
+    assert decoder.feed(packet[:4096]) == []
+    frames = decoder.feed(packet[4096:])
+    assert len(frames) == 1
+    assert decode_message(frames[0])["content"] == content
+
+
+def test_bad_magic_and_oversized_frames_are_rejected():
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(b"XX" + b"\x00" * FRAME_HEADER.size)
+
+    decoder = FrameDecoder(max_frame_size=16)
+    with pytest.raises(ProtocolError):
+        decoder.feed(encode_frame(b"y" * 17))
+
+
+def test_decode_accepts_bare_json():
+    assert decode_message(b'{"type": "MESSAGE", "ttl": 5}')["ttl"] == 5
+
+
+def test_binary_codec_roundtrips_and_is_smaller():
+    token = "ENC1:AES256GCM:" + "q83vEjRWeJCrze8SNFZ4kKvN7xI0VniQ"
+    messages = [
+        ("3f1c2d9e-8a4b-4c1d-9e2f-1234567890ab", "8a9b0c1d-2e3f-4a5b-8c7d-0123456789ab", token),
+        ("nodeA", "nodeB", "E2E1:c4c43daf88024ad7:" + token),
+        ("nodeA", "*", "xin chào"),
+        # not canonical: must come back exactly as sent
+        ("3F1C2D9E-8A4B-4C1D-9E2F-1234567890AB", "nodeB", "ENC1:AES256GCM:not base64!"),
+    ]
+    for sender, receiver, content in messages:
+        as_json = encode_message(sender, receiver, content, sender_name="Alice", message_id="0b7f0c43-5b1e-4f7e-9d55-2a4c2d1f9e10", codec=CODEC_JSON)
+        as_binary = encode_message(sender, receiver, content, sender_name="Alice", message_id="0b7f0c43-5b1e-4f7e-9d55-2a4c2d1f9e10", codec=CODEC_BINARY)
+        assert frame_codec(as_binary) == CODEC_BINARY
+        assert decode_message(as_binary) == decode_message(as_json)
+        assert len(as_binary) < len(as_json)
+
+    # anything outside the fixed envelope goes through the tagged form
+    odd = {"type": "FIND_ACK", "from": "D", "ttl": 300, "extra": [1.5, None, True, b"\x00\x01", -7],
+           "content": {"self": {"peer_id": "D", "port": 9000}, "neighbors": []}}
+    assert decode_message(pack_message(odd, CODEC_BINARY)) == odd
+
+
+def test_transcoding_and_negotiation():
+    frame = encode_message("alice", "bob", "hi", message_id="m1", codec=CODEC_BINARY)
+    as_json = transcode_frame(frame, CODEC_JSON)
+    assert frame_codec(as_json) == CODEC_JSON
+    assert decode_message(as_json) == decode_message(frame)
+    assert transcode_frame(frame, CODEC_BINARY) is frame
+
+    assert choose_codec([CODEC_JSON, CODEC_BINARY]) == CODEC_BINARY
+    assert choose_codec([CODEC_JSON]) == CODEC_JSON
+    assert choose_codec(None) == CODEC_JSON
+
+    with pytest.raises(ProtocolError):
+        decode_message(encode_frame(b"\x07\x05\x01", codec=CODEC_BINARY))
+    with pytest.raises(ProtocolError):
+        decode_message(encode_frame(b"{}", codec=9))
+
+
+def test_forwarding_patches_route_header_and_reuses_body():
+    frame = encode_message("alice", "bob", "ENC1:AES256GCM:q83vEjRWeJCrze8SNFZ4kKvN7xI0VniQ", message_id="m1")
+    _, _, _, route, body = split_frame(frame)
+    assert route == (5, "")
+
+    relayed = forward_frame(frame, 4, "relay_1")
+    assert split_frame(relayed)[3:] == ((4, "relay_1"), body)
+    msg = decode_message(relayed)
+    assert (msg["ttl"], msg["forward"], msg["message_id"]) == (4, "relay_1", "m1")
+    assert {k: v for k, v in msg.items() if k not in ("ttl", "forward")} == \
+        {k: v for k, v in decode_message(frame).items() if k not in ("ttl", "forward")}
+
+    # version 1 frames are still read, and re-encoded when forwarded
+    old = transcode_frame(frame, CODEC_JSON, version=1)
+    assert frame_version(old) == 1 and decode_message(old) == decode_message(frame)
+    assert FrameDecoder().feed(old + frame) == [old, frame]
+    assert decode_message(forward_frame(old, 3, "relay_2"))["forward"] == "relay_2"
+
+
+def test_relay_hands_the_same_buffer_to_every_link(make_manager, raw_link):
+    cm = make_manager()
+    cm.clients = {p: raw_link() for p in "BCDE"}
+
+    cm.handle_incoming(encode_message("B", "*", "hi all", ttl=4, message_id="b1"))
+    sent = [link.sent for link in cm.clients.values() if link.sent]
+    assert len(sent) == 3 and all(len(s) == 1 for s in sent)
+    assert sent[0][0] is sent[1][0] is sent[2][0]
+    msg = decode_message(sent[0][0])
+    assert (msg["ttl"], msg["forward"], msg["content"]) == (3, "nodeA", "hi all")
+
+
+def test_retransmit_attempt_rides_in_the_route_header():
+    frame = encode_message("alice", "bob", "hi", message_id="m1")
+    assert frame_version(frame) == 3 and frame_attempt(frame) == 0
+    assert "attempt" not in decode_message(frame)
+    body = split_frame(frame)[4]
+
+    retry = retry_frame(frame, 2)
+    assert frame_attempt(retry) == 2 and split_frame(retry)[4] == body
+    assert decode_message(retry)["attempt"] == 2
+    assert frame_attempt(retry_frame(frame, 1000)) == 255
+
+    # relays keep the attempt; peers on version 2 get the frame without it
+    relayed = forward_frame(retry, 3, "relay_1")
+    assert frame_attempt(relayed) == 2 and split_frame(relayed)[3] == (3, "relay_1")
+    old = transcode_frame(relayed, CODEC_JSON, version=2)
+    assert frame_version(old) == 2 and frame_attempt(old) == 0
+    assert "attempt" not in decode_message(old)
+    assert frame_attempt(retry_frame(old, 1)) == 1
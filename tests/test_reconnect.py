@@ -0,0 +1,77 @@
+import random
+import pytest
+from network.reconnect import ReconnectScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make(**kwargs):
+    kwargs.setdefault("rng", random.Random(7))
+    kwargs.setdefault("clock", FakeClock())
+    return ReconnectScheduler(**kwargs)
+
+
+def test_backoff_grows_caps_and_parks():
+    s = make(base=1, factor=2, max_delay=8, jitter=0, max_attempts=6, park_delay=300)
+    delays = [s.failed("B") for _ in range(7)]
+    assert delays == [1, 2, 4, 8, 8, 300, 300]
+    assert s.is_parked("B")
+
+    s.wake("B")
+    assert not s.is_parked("B")
+    assert s.failed("B") == 1
+
+    with pytest.raises(ValueError):
+        make(jitter=1.5)
+
+
+def test_jitter_spreads_a_fleet_restart():
+    s = make(base=4, jitter=0.5)
+    first = [s.failed(f"peer{i}") for i in range(200)]
+    assert all(2 <= d <= 4 for d in first)
+    # nobody reconnects in lockstep: the delays cover the whole window
+    assert max(first) - min(first) > 1.5
+    assert len({round(d, 3) for d in first}) > 150
+
+
+def test_recently_live_peer_is_retried_sooner_and_not_parked():
+    clock = FakeClock()
+    s = make(base=2, jitter=0, max_attempts=2, park_delay=300, live_window=60, live_boost=4,
+             stable_after=10, clock=clock)
+    s.connected("B")
+    clock.now += 30
+    s.disconnected("B")                 # stable for 30 s: backoff starts over
+    assert s.failed("B") == 0.5
+    assert s.failed("B") == 1.0         # inside the live window: not parked
+    assert not s.is_parked("B")
+
+    clock.now += 120                    # long gone now
+    assert s.failed("B") == 300
+    assert s.is_parked("B")
+
+
+def test_flapping_peer_keeps_backing_off():
+    clock = FakeClock()
+    s = make(base=1, jitter=0, live_boost=1, stable_after=10, clock=clock)
+    delays = []
+    for _ in range(4):
+        s.connected("B")
+        clock.now += 0.1                # accepted, then dropped at once
+        s.disconnected("B")
+        delays.append(s.failed("B"))
+    assert delays == [1, 2, 4, 8]
+
+
+def test_endless_flapping_does_not_overflow_the_backoff():
+    clock = FakeClock()
+    s = make(base=1.0, factor=2.0, max_delay=60, jitter=0, live_boost=1, clock=clock)
+    s.connected("B")
+    for _ in range(5000):               # always recently live: never parked
+        delay = s.failed("B")
+    assert delay == 60 and s.stats()["B"]["attempts"] == 5000
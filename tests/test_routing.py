@@ -0,0 +1,57 @@
+from core.routing import RoutingTable
+from network.protocol import encode_message
+
+
+def test_learns_shortest_route_and_expires(clock):
+    table = RoutingTable("A", route_ttl=10, clock=clock)
+
+    table.learn_from_message({"type": "MESSAGE", "from": "Z", "forward": "B", "ttl": 2})   # 4 hops
+    assert table.next_hop("Z") == "B"
+    table.learn_from_message({"type": "MESSAGE", "from": "Z", "forward": "C", "ttl": 4})   # 2 hops
+    assert table.next_hop("Z") == "C"
+    table.learn_from_message({"type": "MESSAGE", "from": "Z", "forward": "B", "ttl": 3})   # longer, ignored
+    assert table.next_hop("Z") == "C"
+
+    clock.now = 11
+    assert table.next_hop("Z") is None
+
+
+def test_find_ack_neighbors_and_dropped_next_hop():
+    table = RoutingTable("A")
+    table.learn_from_message({
+        "type": "FIND_ACK", "from": "D", "forward": "B", "ttl": 5,
+        "content": {"self": {"peer_id": "D"}, "neighbors": [{"peer_id": "E"}, {"peer_id": "A"}]},
+    })
+    assert table.routes()["E"]["hops"] == 2
+    assert "A" not in table.routes()
+
+    table.drop_next_hop("B")
+    assert len(table) == 0
+
+    # gossip answers come straight from a neighbour with ttl=1
+    table.learn_from_message({
+        "type": "FIND_ACK", "from": "D", "forward": "", "ttl": 1,
+        "content": {"neighbors": [{"peer_id": "E"}]},
+    })
+    assert table.routes()["D"]["hops"] == 1
+    assert table.routes()["E"] == dict(table.routes()["E"], next_hop="D", hops=2)
+
+
+def test_directed_message_is_unicast_along_route(make_manager, fake_link):
+    cm = make_manager()
+    cm.clients = {"B": fake_link(), "C": fake_link(), "D": fake_link()}
+
+    # A broadcast from Z reaches us through C: learn Z -> C, and it floods
+    cm.handle_incoming(encode_message("Z", "*", "hi all", forwarder="C", ttl=3, message_id="b1"))
+    assert [len(cm.clients[p].sent) for p in "BCD"] == [1, 0, 1]
+
+    # A 1-to-1 message from B for Z only goes to C
+    cm.handle_incoming(encode_message("B", "Z", "hi Z", message_id="m1"))
+    assert [m["message_id"] for m in cm.clients["C"].sent] == ["m1"]
+    assert [len(cm.clients[p].sent) for p in "BD"] == [1, 1]
+
+    # Messages addressed to us are not relayed at all, only acknowledged
+    cm.handle_incoming(encode_message("B", "nodeA", "hi A", message_id="m2"))
+    assert sum(len(l.sent) for l in cm.clients.values()) == 4
+    ack = cm.clients["B"].sent[-1]
+    assert (ack["type"], ack["to"], ack["content"]) == ("ACK", "B", "m2")
@@ -0,0 +1,97 @@
+import time
+from core.db import ChatDatabase
+
+
+def _db(tmp_path, write_behind=False):
+    db = ChatDatabase(str(tmp_path / "search.db"), write_behind=write_behind)
+    rows = [
+        ("m1", "alice", "bob", "lunch at noon?", "alice"),
+        ("m2", "bob", "alice", "xin chào, deploy xong chưa", "bob"),
+        ("m3", "carol", "", "deploy deploy deploy tonight", "carol"),
+        ("m4", "bob", "carol", "deadline is friday", "bob"),
+        ("m5", "alice", "carol", "hello from the lunch deploy team", "alice"),
+    ]
+    for mid, sender, receiver, content, name in rows:
+        db.save_message(mid, sender, receiver, content, sender_name=name)
+    return db
+
+
+def _ids(result):
+    rows, _ = result
+    return [r[0] for r in rows]
+
+
+def test_ranked_prefix_and_diacritic_insensitive(tmp_path):
+    db = _db(tmp_path)
+    try:
+        assert _ids(db.search_messages("deploy"))[0] == "m3"           # most relevant first
+        assert set(_ids(db.search_messages("deploy"))) == {"m2", "m3", "m5"}
+        assert _ids(db.search_messages("dead")) == ["m4"]               # type-ahead prefix
+        assert _ids(db.search_messages("chao")) == ["m2"]               # "chào"
+        assert _ids(db.search_messages("lunch deploy")) == ["m5"]       # every word
+        assert _ids(db.search_messages("carol")) == ["m3"]              # sender name
+        assert _ids(db.search_messages("deploy", peer="bob")) == ["m2"]
+
+        rows, _ = db.search_messages("deadline")
+        assert rows[0][1:3] == ("bob", "bob") and rows[0][7] == "[deadline] is friday"
+        # user input is quoted, never parsed as FTS syntax
+        assert _ids(db.search_messages('lunch" OR "deadline')) == []
+        assert db.search_messages("  !! ") == ([], None)
+    finally:
+        db.close()
+
+
+def test_pages_and_write_behind_rows_are_searchable(tmp_path):
+    db = _db(tmp_path, write_behind=True)
+    try:
+        for i in range(7):
+            db.save_message(f"n{i}", "dave", "alice", f"ping number {i}", sender_name="dave")
+        first, nxt = db.search_messages("ping", limit=5)
+        assert len(first) == 5 and nxt == 5
+        second, nxt = db.search_messages("ping", offset=nxt, limit=5)
+        assert len(second) == 2 and nxt is None
+        assert {r[0] for r in first + second} == {f"n{i}" for i in range(7)}
+    finally:
+        db.close()
+
+
+def test_index_follows_deletes_and_reset(tmp_path):
+    db = _db(tmp_path)
+    try:
+        def edit(conn):
+            conn.execute("DELETE FROM messages WHERE id = 'm4'")
+            conn.execute("UPDATE messages SET content = 'dinner at eight' WHERE id = 'm1'")
+            conn.commit()
+        db.executor.write(edit)
+        assert _ids(db.search_messages("deadline")) == []
+        assert _ids(db.search_messages("lunch")) == ["m5"]
+        assert _ids(db.search_messages("dinner")) == ["m1"]
+
+        db.reset_db()
+        assert db.search_messages("deploy") == ([], None)
+        db.save_message("x1", "erin", "", "deploy again")
+        assert _ids(db.search_messages("deploy")) == ["x1"]
+    finally:
+        db.close()
+
+
+def test_search_runner_delivers_only_the_latest_query(tmp_path):
+    from PyQt5.QtCore import QCoreApplication
+    from ui.search import SearchRunner
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    db = _db(tmp_path)
+    runner = SearchRunner(db)
+    try:
+        got = []
+        runner.results.connect(lambda text, offset, rows, nxt: got.append((text, [r[0] for r in rows])))
+        runner.search("lunch")
+        runner.search("deadline")
+        deadline = time.time() + 5
+        while not got and time.time() < deadline:
+            runner.wait(50)
+            app.processEvents()
+        assert got == [("deadline", ["m4"])]
+    finally:
+        runner.wait()
+        db.close()
@@ -0,0 +1,125 @@
+import pytest
+from crypto.key_exchange import generate_keypair
+from crypto.session import E2E_PREFIX, SessionKeyCache
+
+
+@pytest.fixture
+def e2e_config(make_config):
+    """e2e_config("B", keys=False, **settings): a node config with (or without) an X25519 keypair."""
+    def make(name, keys=True, **settings):
+        priv, pub = generate_keypair() if keys else ("", "")
+        return make_config(name, x25519_priv=priv, x25519_pub=pub, **settings)
+    return make
+
+
+def received(manager):
+    got = []
+    manager.message_received.connect(lambda m: got.append(m["content"]))
+    return got
+
+
+def test_session_cache_rekey_expiry_and_lru(clock):
+    cache = SessionKeyCache(capacity=2, max_messages=2, max_age=10, clock=clock)
+
+    s1 = cache.put("B", "s1", bytes(32))
+    assert cache.current("B") is s1
+    s1.seal("one")
+    s1.seal("two")
+    assert cache.current("B") is None            # used up: time to rekey
+    assert cache.lookup("B", "s1") is s1         # still opens in-flight messages
+
+    cache.put("B", "s2", bytes(range(32)))
+    cache.put("C", "s3", bytes(32))
+    assert cache.lookup("B", "s1") is None       # pushed out by capacity
+    clock.now = 11
+    assert cache.current("C") is None and len(cache) == 1
+
+
+def test_direct_messages_are_end_to_end_encrypted(make_manager, e2e_config, sync_wire):
+    a = make_manager(config=e2e_config("A", session_rekey_messages=3))
+    b = make_manager(config=e2e_config("B"))
+    sync_wire.connect(a, b)
+    got = received(b)
+
+    for i in range(7):
+        a.send_message("nodeB", f"secret {i}")
+
+    assert got == [f"secret {i}" for i in range(7)]
+    on_wire = [m for m in a.clients["nodeB"].sent if m["type"] == "MESSAGE"]
+    assert len(on_wire) == 7
+    assert all(m["content"].startswith(E2E_PREFIX) and "secret" not in m["content"] for m in on_wire)
+
+    # one handshake per 3 messages, not one X25519 per message
+    handshakes = [m for m in a.clients["nodeB"].sent if m["type"] == "HANDSHAKE"]
+    assert len(handshakes) == 3
+    assert a.sessions.stats()["rekeys"] == 2
+
+    # the other direction reuses the session B already holds
+    back = received(a)
+    b.send_message("nodeA", "reply")
+    assert back == ["reply"]
+
+
+def test_peer_without_keypair_falls_back(make_manager, e2e_config, sync_wire):
+    a = make_manager(config=e2e_config("A"))
+    b = make_manager(config=e2e_config("B", keys=False))
+    sync_wire.connect(a, b)
+    got = received(b)
+    a.send_message("nodeB", "hello")
+    a.send_message("nodeB", "again")
+    assert got == ["hello", "again"]
+    assert "nodeB" in a._e2e_unsupported
+    assert len(a.sessions) == 0
+
+
+def test_messages_waiting_for_a_session_survive_a_restart(make_manager, e2e_config, sync_wire):
+    config = e2e_config("A")
+    a = make_manager(config=config)
+    for i in range(300):                 # no link yet: nothing can be sealed
+        a.send_message("nodeB", f"queued {i}")
+    assert len(a.outbox.unsealed("nodeB")) == 300
+    a.db.close()
+
+    a = make_manager(config=config)
+    b = make_manager(config=e2e_config("B"))
+    assert len(a.outbox.unsealed("nodeB")) == 300
+    got = received(b)
+    sync_wire.connect(a, b)
+    a.add_active_peer("nodeB")
+    assert got == [f"queued {i}" for i in range(300)]
+    sent = [m for m in a.clients["nodeB"].sent if m["type"] == "MESSAGE"]
+    assert all(m["content"].startswith(E2E_PREFIX) for m in sent)
+    assert a.outbox.unsealed("nodeB") == [] and a.db.outbox_held() == []
+
+
+def test_receiver_restart_loses_its_session_and_the_message_is_resealed(make_manager, e2e_config, sync_wire):
+    a = make_manager(config=e2e_config("A"))
+    config_b = e2e_config("B")
+    b = make_manager(config=config_b)
+    sync_wire.connect(a, b)
+    a.send_message("nodeB", "before")
+    old_sid = a.sessions.current("nodeB").sid
+    b.db.close()
+
+    b = make_manager(config=config_b)        # same keys, no sessions
+    sync_wire.connect(a, b)
+    got = received(b)
+    msg_id = a.send_message("nodeB", "after restart")
+
+    assert got == ["after restart"]
+    sent = [m for m in a.clients["nodeB"].sent if m["type"] == "MESSAGE"]
+    assert [m["message_id"] for m in sent] == [msg_id, msg_id]   # resealed once
+    assert a.sessions.current("nodeB").sid != old_sid
+    assert a.outbox.pending() == 0 and a.outbox.unsealed("nodeB") == []
+    rows = b.db.get_conversation("nodeA", "nodeB")
+    assert [r[2] for r in rows] == ["before", "after restart"]     # never the ciphertext
+
+
+def test_sessions_are_dropped_when_the_link_goes_down(make_manager, e2e_config, sync_wire):
+    a = make_manager(config=e2e_config("A"))
+    b = make_manager(config=e2e_config("B"))
+    sync_wire.connect(a, b)
+    a.send_message("nodeB", "hi")
+    assert a.sessions.current("nodeB") is not None
+    a.remove_active_peer("nodeB")
+    assert a.sessions.current("nodeB") is None
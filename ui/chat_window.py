@@ -1,16 +1,34 @@
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QPoint, QTimer, pyqtSignal
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, 
     QVBoxLayout, QHBoxLayout, QSplitter,
-    QLabel, QListWidget, QListWidgetItem, QTextEdit, 
-    QLineEdit, QPushButton, QAction, QDialog, QDialogButtonBox
+    QLabel, QListWidget, QListWidgetItem, QListView, QTextEdit, 
+    QLineEdit, QPushButton, QAction, QDialog, QDialogButtonBox,
+    QAbstractItemView
 )
+from ui.message_model import MessageListModel
+from ui.search import SearchRunner
 import datetime
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# rows fetched per history page (initial load and each scroll to the top)
+HISTORY_PAGE_SIZE = 50
+# typing pause before a search runs (ms)
+SEARCH_DEBOUNCE_MS = 250
 
 class ChatWindow(QMainWindow):
+    # (callback, future) of a DB call, emitted on a DB thread, handled on ours
+    db_result = pyqtSignal(object, object)
+
     def __init__(self, chat_manager):
         super().__init__()
         self.chat_manager = chat_manager
+        # history search goes through DBExecutor.submit_read (the DB reader pool)
+        self.search = SearchRunner(chat_manager.db, self)
+        self._search_text = ""          # "" when the chat view shows history
+        self._search_next = None        # offset of the next results page
 
         self.setWindowTitle("Peer Chat")
         self.resize(900, 400)
@@ -20,6 +38,11 @@ class ChatWindow(QMainWindow):
 
         # chat
         self.selected_user = {}
+        self._history_fetch = None      # fn(before, limit) -> (rows, cursor)
+        self._history_format = None     # fn(row) -> display line
+        self._history_cursor = None     # None: nothing older to load
+        self._history_loading = False   # a page request is on the DB threads
+        self._history_gen = 0           # bumped when the view switches history
 
         # events
         self.chat_manager.message_received.connect(self.message_handle)
@@ -27,6 +50,8 @@ class ChatWindow(QMainWindow):
         self.chat_manager.status.connect(self.status_hanndle)
         self.chat_manager.update_peers.connect(self.update_peer_list)
         self.chat_manager.update_discovered_peers.connect(self.update_discovered_list)
+        self.search.results.connect(self.on_search_results)
+        self.db_result.connect(self.on_db_result)
         # UI interactions
         self.node_list.itemClicked.connect(self.on_peer_selected)
     def update_discovered_list(self, peers):
@@ -160,8 +185,24 @@ class ChatWindow(QMainWindow):
         title = QLabel("Chat box")
         title.setStyleSheet("font-weight: bold; font-size: 14px;")
 
-        self.chat_view = QTextEdit()
-        self.chat_view.setReadOnly(True)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search history...")
+        self.search_input.setClearButtonEnabled(True)
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self.run_search)
+        self.search_input.textChanged.connect(self._search_timer.start)
+        self.search_input.returnPressed.connect(self.run_search)
+
+        # Model/view list: only visible rows are laid out and painted
+        self.chat_model = MessageListModel(self)
+        self.chat_view = QListView()
+        self.chat_view.setModel(self.chat_model)
+        self.chat_view.setWordWrap(True)
+        self.chat_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.chat_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.chat_view.verticalScrollBar().valueChanged.connect(self.on_chat_scrolled)
 
         input_layout = QHBoxLayout()
         self.chat_input = QLineEdit()
@@ -173,6 +214,7 @@ class ChatWindow(QMainWindow):
         input_layout.addWidget(self.btn_send)
 
         layout.addWidget(title)
+        layout.addWidget(self.search_input)
         layout.addWidget(self.chat_view)
         layout.addLayout(input_layout)
 
@@ -216,7 +258,7 @@ class ChatWindow(QMainWindow):
 
         neighbors_list = QListWidget()
         try:
-            neighbors = self.chat_manager.db.get_neighbors()
+            neighbors = self.chat_manager.peers.neighbors()
             for n in neighbors:
                 # Show basic neighbor info (peer id, ip:port) without status
                 item_text = f"{n.get('username') or n.get('peer_id')[:8]} — {n.get('peer_id')} @ {n.get('ip')}:{n.get('port')}"
@@ -238,24 +280,29 @@ class ChatWindow(QMainWindow):
     def send_message(self):
         msg = self.chat_input.text()
         self.chat_input.clear()
+        if self._search_text:
+            # back to the conversation the message goes to
+            self.search_input.clear()
+            self.run_search()
 
         ts = self._format_timestamp(datetime.datetime.now())
 
         # If a peer is selected, send a direct message; otherwise broadcast
         if self.selected_user and self.selected_user.get("peer_id"):
             peer_id = self.selected_user.get("peer_id")
-            self.chat_view.append(f'[{ts}] {self.chat_manager.config.username}: {msg}')
+            self.append_chat_line(f'[{ts}] {self.chat_manager.config.username}: {msg}')
             self.chat_manager.send_message(peer_id, msg)
         else:
-            self.chat_view.append(f'[{ts}] {self.chat_manager.config.username}: {msg}')
+            self.append_chat_line(f'[{ts}] {self.chat_manager.config.username}: {msg}')
             self.chat_manager.send_broadcast_message(msg)
 
     def message_handle(self, msg):
-        print("[NEW MESSAGE] ", msg)
+        if self._search_text:
+            return      # stored; shown when the search is cleared
         # Append to view and persist handled by ChatManager (show timestamp)
         ts = self._format_timestamp(msg.get("timestamp"))
-        name = msg.get("from_n") or self.chat_manager.db.get_username(msg.get("from"))
-        self.chat_view.append(f'[{ts}] {name}: {msg.get("content", "")}')
+        name = msg.get("from_n") or self.chat_manager.peers.username(msg.get("from"))
+        self.append_chat_line(f'[{ts}] {name}: {msg.get("content", "")}')
 
     def on_peer_selected(self, item):
         peer = item.data(Qt.UserRole)
@@ -271,37 +318,163 @@ class ChatWindow(QMainWindow):
             return
 
         self.selected_user = peer
+        if self._search_text:
+            self.run_search()       # same query, scoped to this peer
+            return
         self.load_conversation(peer_id)
 
+    # ---------- History ----------
     def load_conversation(self, peer_id):
-        # Load conversation between local node and peer_id
+        # Load the newest page of the conversation between local node and peer_id
+        my_id = self.chat_manager.config.peer_id
         try:
-            self.chat_view.clear()
-            conv = self.chat_manager.db.get_conversation(self.chat_manager.config.peer_id, peer_id)
-            for sender, receiver, content, timestamp, sender_name, receiver_name in conv:
-                ts = self._format_timestamp(timestamp)
-                if sender == self.chat_manager.config.peer_id:
-                    name = self.chat_manager.config.username
-                else:
-                    name = sender_name or self.chat_manager.db.get_username(sender)
-                self.chat_view.append(f"[{ts}] {name}: {content}")
+            self.open_history(
+                lambda before, limit: self.chat_manager.db.get_conversation_page(my_id, peer_id, before, limit),
+                lambda r: self._format_line(r[0], r[4], r[2], r[3])
+            )
         except Exception as e:
-            print(f"[UI_ERROR] load_conversation failed: {e}")
+            log.error("load_conversation failed: %s", e)
 
     def load_initial_messages(self):
         # Show broadcasts (receiver empty) as general history
         try:
-            self.chat_view.clear()
-            bcs = self.chat_manager.db.get_broadcasts()
-            for mid, sender, sender_name, receiver, receiver_name, content, timestamp, is_sent in bcs:
-                ts = self._format_timestamp(timestamp)
-                if sender == self.chat_manager.config.peer_id:
-                    name = self.chat_manager.config.username
-                else:
-                    name = sender_name or self.chat_manager.db.get_username(sender)
-                self.chat_view.append(f"[{ts}] {name}: {content}")
+            self.open_history(
+                self.chat_manager.db.get_broadcasts_page,
+                lambda r: self._format_line(r[1], r[2], r[5], r[6])
+            )
+        except Exception as e:
+            log.error("load_initial_messages failed: %s", e)
+
+    def open_history(self, fetch, fmt):
+        """Show the newest page of a history; older pages load on scroll."""
+        self._history_fetch = fetch
+        self._history_format = fmt
+        self._history_cursor = None
+        self._history_gen += 1
+        self.chat_model.clear()
+        self._request_history_page(None)
+
+    def load_older_messages(self):
+        if self._history_fetch is None or self._history_cursor is None or self._history_loading:
+            return
+        self._request_history_page(self._history_cursor)
+
+    def _request_history_page(self, before):
+        generation = self._history_gen
+        self._history_loading = True
+        self.db_call(
+            lambda page: self._show_history_page(generation, before is None, page),
+            self._history_fetch, before, HISTORY_PAGE_SIZE,
+        )
+
+    def _show_history_page(self, generation, newest, page):
+        if generation != self._history_gen:
+            return      # the view moved on to another history or a search
+        self._history_loading = False
+        rows, self._history_cursor = page
+        if newest:
+            self.chat_model.prepend_lines([self._history_format(r) for r in rows])
+            self.chat_view.scrollToBottom()
+            return
+        if not rows:
+            return
+
+        # keep the line that was at the top of the viewport in place
+        anchor = self.chat_view.indexAt(QPoint(0, 0)).row()
+        self.chat_model.prepend_lines([self._history_format(r) for r in rows])
+        if anchor >= 0:
+            self.chat_view.scrollTo(self.chat_model.index(anchor + len(rows)), QAbstractItemView.PositionAtTop)
+
+    # ---------- DB calls ----------
+    def db_call(self, callback, fn, *args):
+        """Run fn(*args) on the DB threads; callback(result) runs later on the UI thread."""
+        future = self.chat_manager.db.submit(fn, *args)
+        future.add_done_callback(self._emit_db_result(callback))
+
+    def _emit_db_result(self, callback):
+        def done(future):
+            try:
+                self.db_result.emit(callback, future)
+            except RuntimeError:
+                pass        # the window is gone
+        return done
+
+    def on_db_result(self, callback, future):
+        try:
+            result = future.result()
         except Exception as e:
-            print(f"[UI_ERROR] load_initial_messages failed: {e}")
+            log.error("DB call failed: %s", e)
+            self._history_loading = False
+            return
+        callback(result)
+
+    def on_chat_scrolled(self, value):
+        if self._search_text:
+            # results are best-first: the next page loads at the bottom
+            if value == self.chat_view.verticalScrollBar().maximum() and self._search_next is not None:
+                self.search.search(self._search_text, self._search_peer(), self._search_next)
+                self._search_next = None
+            return
+        if value == self.chat_view.verticalScrollBar().minimum():
+            try:
+                self.load_older_messages()
+            except Exception as e:
+                log.error("load_older_messages failed: %s", e)
+
+    # ---------- Search ----------
+    def _search_peer(self):
+        return (self.selected_user or {}).get("peer_id")
+
+    def run_search(self):
+        """Search history for the search box text (scoped to the selected peer)."""
+        self._search_timer.stop()
+        text = self.search_input.text().strip()
+        if not text:
+            if self._search_text:
+                self._search_text = ""
+                self.search.cancel()
+                peer_id = self._search_peer()
+                if peer_id:
+                    self.load_conversation(peer_id)
+                else:
+                    self.load_initial_messages()
+            return
+        self._search_text = text
+        self._search_next = None
+        self.search.search(text, self._search_peer())
+
+    def on_search_results(self, text, offset, rows, next_offset):
+        if text != self._search_text:
+            return
+        if offset == 0:
+            self._history_fetch = None
+            self._history_gen += 1
+            self.chat_model.clear()
+            if not rows:
+                self.chat_model.append_line(f'No messages match "{text}"')
+        for r in rows:
+            # (id, sender, sender_name, receiver, receiver_name, content, timestamp, snippet)
+            self.chat_model.append_line(self._format_line(r[1], r[2], r[7], r[6]))
+        self._search_next = next_offset
+        if offset == 0:
+            self.chat_view.scrollToTop()
+
+    def append_chat_line(self, text):
+        # follow new messages only when the user is already at the bottom
+        bar = self.chat_view.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum()
+        self.chat_model.append_line(text)
+        if at_bottom:
+            self.chat_view.scrollToBottom()
+
+    def _format_line(self, sender, sender_name, content, timestamp):
+        ts = self._format_timestamp(timestamp)
+        if sender == self.chat_manager.config.peer_id:
+            name = self.chat_manager.config.username
+        else:
+            # names are already resolved by the page query
+            name = sender_name or (sender or "")[:8]
+        return f"[{ts}] {name}: {content}"
 
     def log_handle(self, log):
         self.log_view.append(f'{log["from_n"]}: {log["content"]}')
@@ -319,6 +492,8 @@ class ChatWindow(QMainWindow):
     def close(self):
         # Ensure ChatManager and its resources are shutdown cleanly
         try:
+            self.search.cancel()
+            self.search.wait(2000)
             self.chat_manager.stop()
         except Exception:
             pass
@@ -5,8 +5,12 @@ from PyQt5.QtWidgets import (
 )
 from ui.chat_window import ChatWindow
 from core.chat_manager import ChatManager
+from network.qt_bridge import NetworkBridge
 from utils.config import Config
 from core.db import ChatDatabase
+from utils.logger import get_logger
+
+log = get_logger(__name__)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -45,7 +49,7 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(container)
 
     def on_node_changed(self, text):
-        print(f"[LOG] Selected node: {text}")
+        log.info("Selected node: %s", text)
         #load config from file
         self.app_config = Config(f'{text}.json')
         self.app_config.load_config()
@@ -62,7 +66,8 @@ class MainWindow(QMainWindow):
             self.app_config.username = username
             self.app_config.save_config()
             
-            self.chat_manager = ChatManager(self.app_config)
+            # NetworkBridge queues engine events onto this (UI) thread
+            self.chat_manager = ChatManager(self.app_config, bridge=NetworkBridge())
             self.chat_manager.start()
             # ensure clean shutdown
             QApplication.instance().aboutToQuit.connect(self.chat_manager.stop)
@@ -0,0 +1,40 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex
+
+
+class MessageListModel(QAbstractListModel):
+    """Chat lines for a QListView.
+
+    The view only lays out and paints the rows that are visible, so the cost
+    of showing a conversation depends on the window size, not on how much
+    history has been loaded. Older pages are inserted at the top.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lines = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._lines)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        return self._lines[index.row()]
+
+    def append_line(self, text):
+        row = len(self._lines)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._lines.append(text)
+        self.endInsertRows()
+
+    def prepend_lines(self, lines):
+        if not lines:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(lines) - 1)
+        self._lines[:0] = lines
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._lines = []
+        self.endResetModel()
@@ -0,0 +1,62 @@
+from concurrent.futures import wait as wait_futures
+from PyQt5.QtCore import QObject, pyqtSignal
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+class SearchRunner(QObject):
+    """Runs ChatDatabase.search_messages on the DB reader threads.
+
+    `results(text, offset, rows, next_offset)` is emitted on the runner's
+    (UI) thread, and only for the latest search: typing ahead supersedes
+    queries that have not finished yet.
+    """
+
+    results = pyqtSignal(str, int, object, object)
+    _finished = pyqtSignal(int, object)
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._generation = 0
+        self._future = None
+        self._finished.connect(self._on_finished)
+
+    def search(self, text, peer=None, offset=0):
+        self._generation += 1
+        generation = self._generation
+        try:
+            self._future = self.db.submit(self.db.search_messages, text, peer=peer, offset=offset)
+        except RuntimeError as e:
+            log.error("search %r not started: %s", text, e)
+            return
+        # runs on a DB thread; the signal hops back to ours
+        self._future.add_done_callback(lambda fut: self._done(generation, text, offset, fut))
+
+    def cancel(self):
+        """Drop the results of every search started so far."""
+        self._generation += 1
+
+    def wait(self, msecs=-1) -> bool:
+        if self._future is None:
+            return True
+        done, _ = wait_futures([self._future], None if msecs < 0 else msecs / 1000)
+        return bool(done)
+
+    def _done(self, generation, text, offset, fut):
+        if generation != self._generation:
+            return      # superseded: don't bother the UI thread
+        try:
+            rows, next_offset = fut.result()
+        except Exception as e:
+            log.error("search %r failed: %s", text, e)
+            rows, next_offset = [], None
+        try:
+            self._finished.emit(generation, (text, offset, rows, next_offset))
+        except RuntimeError:
+            pass        # the window went away meanwhile
+
+    def _on_finished(self, generation, result):
+        if generation == self._generation:
+            self.results.emit(*result)
@@ -1,6 +1,9 @@
 import json
 import os
 from uuid import uuid4
+from utils.logger import get_logger
+
+log = get_logger(__name__)
 
 class Config:
     def __init__(self, config_filename="config.json"):
@@ -20,6 +23,35 @@ class Config:
         self.aes_key = ""  # base64 or passphrase
         # When True, print plaintext + ciphertext compare logs to Terminal
         self.crypto_log_compare = False
+        # X25519 keypair (base64) for end-to-end per-peer session keys
+        self.x25519_priv = ""
+        self.x25519_pub = ""
+        self.session_rekey_messages = 10000   # re-handshake after this many sends
+        self.session_max_age = 3600           # seconds a session key is used
+
+        # --- Duplicate suppression (seen message ids) ---
+        self.dedup_capacity = 100000    # max remembered ids
+        self.dedup_ttl = 600            # seconds an id is remembered
+
+        # Store-and-forward outbox for direct messages (see core/outbox.py)
+        self.outbox_rate = 200          # frames/s per destination while draining
+        self.outbox_burst = 50          # frames sent back to back before the rate applies
+        self.outbox_max_age = 86400     # seconds a queued message is kept
+        self.outbox_relay_cap = 1000    # frames a relay holds per reconnecting neighbour
+        # ACK timeouts: adaptive per peer (srtt + 4 * rttvar), doubled per retry
+        self.ack_timeout = 3            # seconds before the first RTT sample
+        self.ack_timeout_max = 30       # cap for the timeout and its backoff
+        self.ack_max_attempts = 5       # sends before waiting for a reconnect
+
+        # Prometheus-style metrics endpoint (0 = off)
+        self.metrics_host = "127.0.0.1"
+        self.metrics_port = 0
+
+        # Gossip peer discovery (see core/discovery.py)
+        self.discovery_interval = 30    # seconds between rounds (0 = manual only)
+        self.discovery_fanout = 2       # neighbours contacted per round
+        self.discovery_view_size = 20   # descriptors kept in the partial view
+        self.discovery_shuffle_len = 8  # descriptors exchanged per request
     
     def load_config(self):
         try:
@@ -35,14 +67,37 @@ class Config:
                 self.encryption_enabled = bool(config_data.get("encryption_enabled", False))
                 self.aes_key = str(config_data.get("aes_key", "") or "")
                 self.crypto_log_compare = bool(config_data.get("crypto_log_compare", False))
+                self.x25519_priv = str(config_data.get("x25519_priv", "") or "")
+                self.x25519_pub = str(config_data.get("x25519_pub", "") or "")
+                self.session_rekey_messages = int(config_data.get("session_rekey_messages", self.session_rekey_messages))
+                self.session_max_age = float(config_data.get("session_max_age", self.session_max_age))
+
+                self.dedup_capacity = int(config_data.get("dedup_capacity", self.dedup_capacity))
+                self.dedup_ttl = float(config_data.get("dedup_ttl", self.dedup_ttl))
+
+                self.outbox_rate = float(config_data.get("outbox_rate", self.outbox_rate))
+                self.outbox_burst = int(config_data.get("outbox_burst", self.outbox_burst))
+                self.outbox_max_age = float(config_data.get("outbox_max_age", self.outbox_max_age))
+                self.outbox_relay_cap = int(config_data.get("outbox_relay_cap", self.outbox_relay_cap))
+                self.ack_timeout = float(config_data.get("ack_timeout", self.ack_timeout))
+                self.ack_timeout_max = float(config_data.get("ack_timeout_max", self.ack_timeout_max))
+                self.ack_max_attempts = int(config_data.get("ack_max_attempts", self.ack_max_attempts))
+
+                self.metrics_host = config_data.get("metrics_host", self.metrics_host)
+                self.metrics_port = int(config_data.get("metrics_port", self.metrics_port))
+
+                self.discovery_interval = float(config_data.get("discovery_interval", self.discovery_interval))
+                self.discovery_fanout = int(config_data.get("discovery_fanout", self.discovery_fanout))
+                self.discovery_view_size = int(config_data.get("discovery_view_size", self.discovery_view_size))
+                self.discovery_shuffle_len = int(config_data.get("discovery_shuffle_len", self.discovery_shuffle_len))
                 
-                print(f"[LOG] Config successfully load from {self.config_path}")
+                log.info("Config loaded from %s", self.config_path)
 
         except FileNotFoundError:
-            print(f"[ERROR] The config file was not found at {self.config_path}")
+            log.error("Config file not found at %s", self.config_path)
   
         except json.JSONDecodeError:
-            print(f"[ERROR] Could not decode JSON from the file at {self.config_path}")
+            log.error("Could not decode JSON from %s", self.config_path)
 
     def save_config(self):
         config_data = {
@@ -57,9 +112,32 @@ class Config:
             "encryption_enabled": self.encryption_enabled,
             "aes_key": self.aes_key,
             "crypto_log_compare": self.crypto_log_compare,
+            "x25519_priv": self.x25519_priv,
+            "x25519_pub": self.x25519_pub,
+            "session_rekey_messages": self.session_rekey_messages,
+            "session_max_age": self.session_max_age,
+
+            "dedup_capacity": self.dedup_capacity,
+            "dedup_ttl": self.dedup_ttl,
+
+            "outbox_rate": self.outbox_rate,
+            "outbox_burst": self.outbox_burst,
+            "outbox_max_age": self.outbox_max_age,
+            "outbox_relay_cap": self.outbox_relay_cap,
+            "ack_timeout": self.ack_timeout,
+            "ack_timeout_max": self.ack_timeout_max,
+            "ack_max_attempts": self.ack_max_attempts,
+
+            "metrics_host": self.metrics_host,
+            "metrics_port": self.metrics_port,
+
+            "discovery_interval": self.discovery_interval,
+            "discovery_fanout": self.discovery_fanout,
+            "discovery_view_size": self.discovery_view_size,
+            "discovery_shuffle_len": self.discovery_shuffle_len,
         }
         with open(self.config_path, "w") as f:
             # Use json.dump() to write the dictionary to the file
             json.dump(config_data, f, indent=4) # "indent=4" makes the file human-readable
 
-        print(f"[LOG] Config successfully saved to {self.config_path}")
\ No newline at end of file
+        log.info("Config saved to %s", self.config_path)
\ No newline at end of file
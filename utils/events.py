@@ -0,0 +1,30 @@
+import traceback
+
+
+class Signal:
+    """Plain-Python stand-in for pyqtSignal.
+
+    Same connect/disconnect/emit surface, so UI code written against Qt
+    signals works unchanged, but slots are called synchronously on the
+    emitting thread and PyQt is never imported.
+    """
+
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def disconnect(self, slot=None):
+        if slot is None:
+            self._slots.clear()
+        else:
+            self._slots.remove(slot)
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            try:
+                slot(*args)
+            except Exception:
+                # Like Qt: a failing slot is reported, the emitter keeps going
+                traceback.print_exc()
@@ -1,6 +1,174 @@
+"""Logging for peerchat.
+
+Every module gets its logger from `get_logger(__name__)`. Nothing is printed
+until `configure()` runs (main.py / node.py call it), and messages below a
+logger's level are discarded by `logging` before the message is formatted:
+pass values as arguments (`log.debug("sent %s", msg_id)`), never as
+f-strings, so a disabled debug line costs one level check.
+
+`configure()` sets
+  - a root level and per-module levels ("core.chat_manager=DEBUG,network=WARNING"),
+    also read from PEERCHAT_LOG_LEVEL / PEERCHAT_LOG_LEVELS
+  - a QueueHandler: the calling thread only enqueues the record, a
+    QueueListener thread formats and writes it
+  - a rate limit on repeats of the same call site, so a flood of identical
+    errors prints a few lines and then a "suppressed N" summary
+
+Extra fields (`log.info("connected", extra={"peer": pid})`) are appended as
+key=value, or become keys of the object with fmt="json".
+"""
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+
+ROOT = "peerchat"
+DEFAULT_FORMAT = "%(asctime)s %(levelname)-5s %(name)s: %(message)s"
+
+# attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the peerchat namespace ("core.db" -> "peerchat.core.db")."""
+    if name == "__main__" or not name:
+        return logging.getLogger(ROOT)
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def _extra_fields(record) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS and not k.startswith("_")}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Text lines with `extra` fields appended as key=value."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        out.update(_extra_fields(record))
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `burst` records per message every `window` seconds.
+
+    A message is its call site (logger, file, line) plus its format string,
+    so the same error repeating with different arguments counts as one while
+    different messages logged from one place do not hold each other back.
+    DEBUG records are never limited: they are only on when asked for. When a
+    message's window ends, the next record it lets through carries how many
+    were suppressed in between.
+    """
+
+    def __init__(self, burst=10, window=10.0, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._clock = clock
+        self._sites = {}        # (site, msg) -> [window_start, count, suppressed]
+        self.suppressed = 0
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG:
+            return True
+        site = (record.name, record.pathname, record.lineno, str(record.msg))
+        now = self._clock()
+        state = self._sites.get(site)
+        if state is None or now - state[0] >= self.window:
+            if state is not None and state[2]:
+                record.msg = f"{record.msg} (suppressed {state[2]} similar)"
+            if len(self._sites) > 4096:
+                self._sites.clear()
+            self._sites[site] = [now, 1, 0]
+            return True
+        state[1] += 1
+        if state[1] <= self.burst:
+            return True
+        state[2] += 1
+        self.suppressed += 1
+        return False
+
+
+def parse_levels(spec) -> dict:
+    """"core.db=DEBUG,network=WARNING" -> {"core.db": "DEBUG", "network": "WARNING"}."""
+    levels = {}
+    for part in (spec or "").split(","):
+        name, sep, level = part.strip().partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure(level=None, levels=None, fmt="text", stream=None, use_queue=True, burst=10, window=10.0):
+    """Install peerchat's handler. Safe to call again to change settings."""
+    global _listener
+    shutdown()
+
+    root = logging.getLogger(ROOT)
+    root.setLevel((level or os.environ.get("PEERCHAT_LOG_LEVEL") or "INFO").upper())
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    module_levels = parse_levels(os.environ.get("PEERCHAT_LOG_LEVELS"))
+    module_levels.update(levels or {})
+    for name, lvl in module_levels.items():
+        get_logger(name).setLevel(lvl)
+
+    target = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    target.setFormatter(JsonFormatter() if fmt == "json" else StructuredFormatter(DEFAULT_FORMAT))
+
+    if use_queue:
+        records = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(records)
+        _listener = logging.handlers.QueueListener(records, target, respect_handler_level=True)
+        _listener.start()
+    else:
+        handler = target
+    # filter before enqueueing so suppressed records cost no queue traffic
+    handler.addFilter(RateLimitFilter(burst, window))
+    root.addHandler(handler)
+    return root
+
+
+def shutdown():
+    """Flush and stop the background writer, if any."""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+        _listener = None
+
+
+atexit.register(shutdown)
 
-logging.basicConfig(level=logging.INFO)
 
 def log(msg):
-    logging.info(msg)
+    get_logger("").info(msg)